@@ -134,6 +134,20 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Cache used by the catalog API response cache (api.cache)
+# LocMemCache is private to each process: a write only invalidates the
+# pages cached by the worker that handled it, and other workers may serve
+# stale pages for up to CATALOG_CACHE_TIMEOUT. Run a single process with
+# it, or use a shared backend when serving with several workers, e.g.
+#     "BACKEND": "django.core.cache.backends.redis.RedisCache",
+#     "LOCATION": "redis://127.0.0.1:6379",
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
 # Add these settings for media files (for avatars)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -0,0 +1,99 @@
+"""
+Versioned response cache for the read-only catalog API.
+
+Cached pages are keyed on a global catalog version, so invalidation is a
+single counter increment: old keys are never read again and expire on
+their own. api.signals bumps the version whenever a catalog or
+circulation row is saved or deleted, and on books.signals.catalog_changed,
+which code outside the API sends after changing rows with QuerySet.update()
+or bulk_create().
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+# How long a builder may hold a page lock, and how long others wait for it
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Missing or evicted; add() keeps a concurrent first write intact
+        if not cache.add(key, delta, None):
+            return cache.incr(key, delta)
+        return delta
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_catalog():
+    """Make every cached catalog response stale"""
+    _incr(VERSION_KEY)
+
+
+def get_stats():
+    return {
+        'version': get_version(),
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def make_key(request, view):
+    """Key a response on the catalog version, the view and its full query"""
+    query = sorted(request.query_params.lists())
+    lookup = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field, '')
+    digest = hashlib.md5(repr(query).encode(), usedforsecurity=False).hexdigest()
+    return f'catalog:{get_version()}:{view.basename}:{view.action}:{lookup}:{digest}'
+
+
+def get_or_build(key, build):
+    """
+    Return the cached value for key, or build and store it.
+
+    Concurrent misses on the same key are coalesced: the first caller takes
+    a lock and builds the value while the others wait for it to appear.
+    If the builder takes longer than LOCK_WAIT the waiters build it
+    themselves. `build` may return None to skip caching.
+    """
+    value = cache.get(key)
+    if value is not None:
+        _incr(HITS_KEY)
+        return value
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_WAIT
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            _incr(HITS_KEY)
+            return value
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+
+    try:
+        _incr(MISSES_KEY)
+        value = build()
+        if value is not None:
+            cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
@@ -0,0 +1,50 @@
+import re
+
+import django_filters
+from rest_framework import filters
+
+from books import search
+from books.models import BookProfile
+
+NL_CODE_PATTERN = re.compile(r'^NL\d+$', re.IGNORECASE)
+
+
+class BookProfileFilter(django_filters.FilterSet):
+    """Filters for book profiles, including the copies on the shelf"""
+    available = django_filters.BooleanFilter(method='filter_available')
+    min_available = django_filters.NumberFilter(field_name='available_copies', lookup_expr='gte')
+
+    class Meta:
+        model = BookProfile
+        fields = ['author', 'series']
+
+    def filter_available(self, queryset, name, value):
+        if value:
+            return queryset.filter(available_copies__gt=0)
+        return queryset.filter(available_copies=0)
+
+
+class CatalogSearchFilter(filters.SearchFilter):
+    """
+    Search the catalog through the full-text index in books.search.
+
+    Views set `search_profile_field` to the field holding the profile id
+    ('id' for profiles, 'profile' for copies) and may set `search_code_field`
+    to match NL codes by prefix. Matches are annotated with `search_rank`
+    (lower is more relevant) and ordered by it. Without the index the
+    regular `search_fields` LIKE search is used.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search.is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        code_field = getattr(view, 'search_code_field', None)
+        if code_field and len(terms) == 1 and NL_CODE_PATTERN.match(terms[0]):
+            return queryset.filter(**{f'{code_field}__istartswith': terms[0]})
+
+        query = search.build_match_query(terms)
+        return search.matching(
+            queryset, query, view.search_profile_field
+        ).order_by('search_rank', *queryset.query.order_by)
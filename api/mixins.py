@@ -0,0 +1,113 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .cache import get_or_build, get_version, make_key
+
+
+class FieldShapeMixin:
+    """
+    Let get_queryset() load only what the response renders, following the
+    ?fields= and ?expand= parameters handled by DynamicFieldsMixin.
+    """
+
+    def wants_field(self, name):
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'requested_fields'):
+            return True
+        requested = serializer_class.requested_fields(self.request)
+        return requested is None or name in requested
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and detail requests with an ETag and Last-Modified derived
+    from the newest `last_updated` and the row count of the filtered
+    queryset, and return 304 Not Modified without serializing anything when
+    the client already holds that state.
+
+    Views can add related querysets whose changes show up in their payloads
+    by overriding get_validator_querysets(), as querysets or as (queryset,
+    timestamp field) pairs. Embedded rows without a timestamp, such as
+    authors and series, are covered by the catalog cache version, which
+    is part of the ETag.
+    """
+    validator_field = 'last_updated'
+
+    def get_validator_querysets(self, queryset):
+        return [queryset]
+
+    def get_validators(self, queryset):
+        """Return (etag, last_modified timestamp) for the given queryset"""
+        state = [self.request.accepted_renderer.format, get_version()]
+        latest = None
+        for entry in self.get_validator_querysets(queryset):
+            qs, field = entry if isinstance(entry, tuple) else (entry, self.validator_field)
+            result = qs.order_by().aggregate(latest=Max(field), count=Count('pk'))
+            state += [result['latest'], result['count']]
+            if result['latest'] and (latest is None or result['latest'] > latest):
+                latest = result['latest']
+
+        digest = hashlib.md5(repr(state).encode(), usedforsecurity=False).hexdigest()
+        return f'W/"{digest}"', int(latest.timestamp()) if latest else None
+
+    def conditional_response(self, queryset, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(queryset)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            # Clients may keep the response but must revalidate it
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(queryset, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            # A malformed lookup, e.g. a non-numeric pk, as get_object() does
+            raise Http404
+        return self.conditional_response(queryset, super().retrieve, request, *args, **kwargs)
+
+
+class CachedResponseMixin:
+    """
+    Serve list and detail GETs from the versioned catalog cache in
+    api.cache. Only successful responses are cached.
+    """
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        built = {}
+
+        def build():
+            response = built['response'] = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                return response.data
+            return None
+
+        data = get_or_build(make_key(request, self), build)
+        if 'response' in built:
+            return built['response']
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
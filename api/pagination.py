@@ -0,0 +1,42 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the first ordering column instead of
+    paging with OFFSET from the start, and runs no total count.
+
+    The cursor only holds the first column's value at the page boundary.
+    When several rows share that value, as with equal names, borrow dates
+    or search ranks, the rows already shown among them are skipped with an
+    offset kept in the cursor, so a page costs the same as the first plus
+    the number of ties at its boundary. Only orderings led by a unique
+    column, like nl_code for books, are a pure seek.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # Full-text searches page by relevance unless an ordering was requested
+        if 'search_rank' in queryset.query.annotations and not request.query_params.get('ordering'):
+            return ('search_rank',) + tuple(self.ordering)
+        return ordering
+
+
+class BookCursorPagination(KeysetPagination):
+    ordering = ('nl_code',)
+
+
+class BookProfileCursorPagination(KeysetPagination):
+    ordering = ('name', 'id')
+
+
+class BorrowRecordCursorPagination(KeysetPagination):
+    # Matches the (status, -borrowed_date) index on BorrowRecord
+    ordering = ('-borrowed_date', 'id')
+
+
+class HoldCursorPagination(KeysetPagination):
+    # Queue order
+    ordering = ('placed_at', 'id')
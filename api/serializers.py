@@ -1,8 +1,52 @@
 from rest_framework import serializers
-from circulation.models import BorrowRecord
+from circulation.models import BorrowRecord, Hold
 from books.models import Book, BookProfile, Author, Series
 from users.models import Profile
 
+def _split_param(request, name):
+    value = request.query_params.get(name) if request is not None else None
+    if value is None:
+        return None
+    return {field.strip() for field in value.split(',') if field.strip()}
+
+class DynamicFieldsMixin:
+    """
+    Let clients pick the response shape with query parameters:
+
+    - ?fields=a,b returns only the listed fields
+    - ?expand=x,y adds fields from Meta.expandable_fields, which are
+      left out whenever ?fields= or ?expand= is given
+
+    Without either parameter the full shape is returned. Only the
+    top-level serializer of a GET response is trimmed.
+    """
+
+    @classmethod
+    def requested_fields(cls, request):
+        """Names of the fields to render for this request, or None for all"""
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        fields = _split_param(request, 'fields')
+        expand = _split_param(request, 'expand')
+        if fields is None and expand is None:
+            return None
+        expandable = set(getattr(cls.Meta, 'expandable_fields', []))
+        if fields is None:
+            fields = set(cls.Meta.fields) - expandable
+        return (fields | (expand or set())) & set(cls.Meta.fields)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        requested = self.requested_fields(self.context.get('request'))
+        if requested is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in requested}
+
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Author
@@ -13,24 +57,48 @@ class SeriesSerializer(serializers.ModelSerializer):
         model = Series
         fields = ['id', 'name', 'description']
 
-class BookProfileSerializer(serializers.ModelSerializer):
+class BookProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_details = AuthorSerializer(source='author', read_only=True)
     series_details = SeriesSerializer(source='series', read_only=True)
     copies_count = serializers.SerializerMethodField()
+    # Same as available_copies, kept for existing clients
+    available_count = serializers.IntegerField(source='available_copies', read_only=True)
+    borrowed_count = serializers.SerializerMethodField()
+    in_bundle_count = serializers.SerializerMethodField()
+    lost_count = serializers.SerializerMethodField()
 
     class Meta:
         model = BookProfile
         fields = [
             'id', 'name', 'isbn', 'description', 'icon',
             'author', 'author_details', 'series', 'series_details',
-            'time_added', 'last_updated', 'copies_count'
+            'time_added', 'last_updated', 'copies_count',
+            'available_count', 'borrowed_count', 'in_bundle_count', 'lost_count',
+            'available_copies'
         ]
-        read_only_fields = ['time_added', 'last_updated']
+        read_only_fields = ['time_added', 'last_updated', 'available_copies']
+        expandable_fields = ['author_details', 'series_details']
+
+    def _count(self, obj, name, **filters):
+        # List querysets annotate the counts (BookProfile.objects.with_copy_counts);
+        # single objects, e.g. after create or update, fall back to a query
+        if hasattr(obj, name):
+            return getattr(obj, name)
+        return obj.copies.filter(**filters).count()
 
     def get_copies_count(self, obj):
-        return obj.copies.count()
+        return self._count(obj, 'copies_count')
 
-class BookSerializer(serializers.ModelSerializer):
+    def get_borrowed_count(self, obj):
+        return self._count(obj, 'borrowed_count', status=Book.Status.BORROWED)
+
+    def get_in_bundle_count(self, obj):
+        return self._count(obj, 'in_bundle_count', status=Book.Status.IN_BUNDLE)
+
+    def get_lost_count(self, obj):
+        return self._count(obj, 'lost_count', status=Book.Status.LOST)
+
+class BookSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     profile_details = BookProfileSerializer(source='profile', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     current_borrower = serializers.SerializerMethodField()
@@ -43,9 +111,16 @@ class BookSerializer(serializers.ModelSerializer):
             'last_updated', 'current_borrower'
         ]
         read_only_fields = ['time_added', 'last_updated']
+        expandable_fields = ['profile_details', 'current_borrower']
 
     def get_current_borrower(self, obj):
-        active_borrow = obj.borrow_records.filter(status=BorrowRecord.Status.ACTIVE).first()
+        # BookViewSet prefetches active records into `active_borrow_records`
+        if hasattr(obj, 'active_borrow_records'):
+            active_borrow = next(iter(obj.active_borrow_records), None)
+        else:
+            active_borrow = obj.borrow_records.filter(
+                status__in=BorrowRecord.ON_LOAN
+            ).select_related('borrower__user').first()
         if active_borrow:
             return {
                 'id': active_borrow.borrower.user.id,
@@ -64,7 +139,18 @@ class BookCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("This NL code is already in use.")
         return value
 
-class BorrowRecordSerializer(serializers.ModelSerializer):
+class BookBulkItemSerializer(serializers.Serializer):
+    """
+    Shape and format of one item of a bulk book creation. Uniqueness and
+    profile existence are checked for the whole batch by the view.
+    """
+    profile = serializers.IntegerField()
+    nl_code = serializers.CharField(
+        max_length=20,
+        validators=Book._meta.get_field('nl_code').validators
+    )
+
+class BorrowRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     book_title = serializers.CharField(source='book.profile.name', read_only=True)
     borrower_name = serializers.CharField(source='borrower.user.username', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -77,41 +163,55 @@ class BorrowRecordSerializer(serializers.ModelSerializer):
             'book_title', 'borrower_name'
         ]
         read_only_fields = ['borrowed_date', 'status', 'returned_date']
+        expandable_fields = ['book_title', 'borrower_name']
 
 class BorrowCreateSerializer(serializers.Serializer):
+    """Availability and limits are checked by circulation.services.borrow_book"""
     book_id = serializers.IntegerField()
     user_id = serializers.IntegerField()
     notes = serializers.CharField(required=False, allow_blank=True)
 
-    def validate(self, data):
-        book_id = data.get('book_id')
-        user_id = data.get('user_id')
-
-        try:
-            book = Book.objects.get(id=book_id)
-            borrower = Profile.objects.get(user_id=user_id)
-        except Book.DoesNotExist:
-            raise serializers.ValidationError({"book_id": "Book not found"})
-        except Profile.DoesNotExist:
-            raise serializers.ValidationError({"user_id": "User profile not found"})
-
-        if book.status != Book.Status.NORMAL:
-            raise serializers.ValidationError(
-                {"book_id": f"Book is not available for borrowing. Current status: {book.get_status_display()}"}
-            )
-
-        active_borrows = BorrowRecord.objects.filter(
-            borrower=borrower,
-            status=BorrowRecord.Status.ACTIVE
-        ).count()
-
-        if active_borrows >= borrower.borrow_limit:
-            raise serializers.ValidationError(
-                {"user_id": f"User has reached borrowing limit of {borrower.borrow_limit} books"}
-            )
-
-        return data
+class CheckoutAnySerializer(serializers.Serializer):
+    """The copy is picked by circulation.services.borrow_any"""
+    user_id = serializers.IntegerField()
+    notes = serializers.CharField(required=False, allow_blank=True)
 
 class ReturnBookSerializer(serializers.Serializer):
     book_id = serializers.IntegerField()
-    notes = serializers.CharField(required=False, allow_blank=True) 
\ No newline at end of file
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+class RenewLoanSerializer(serializers.Serializer):
+    book_id = serializers.IntegerField()
+
+class BorrowBatchOperationSerializer(serializers.Serializer):
+    ACTIONS = ['borrow', 'return']
+
+    action = serializers.ChoiceField(choices=ACTIONS)
+    book_id = serializers.IntegerField()
+    user_id = serializers.IntegerField(required=False)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if data['action'] == 'borrow' and 'user_id' not in data:
+            raise serializers.ValidationError({"user_id": "This field is required to borrow a book."})
+        return data
+
+class HoldSerializer(serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book_profile.name', read_only=True)
+    patron_name = serializers.CharField(source='patron.user.username', read_only=True)
+    book_nl_code = serializers.CharField(source='book.nl_code', read_only=True, default=None)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = Hold
+        fields = [
+            'id', 'book_profile', 'book_title', 'patron', 'patron_name',
+            'status', 'status_display', 'book', 'book_nl_code',
+            'placed_at', 'ready_at', 'expires_at', 'closed_at'
+        ]
+        read_only_fields = fields
+
+class HoldCreateSerializer(serializers.Serializer):
+    book_profile = serializers.IntegerField()
+    # Staff place holds for a patron; patrons always hold for themselves
+    user_id = serializers.IntegerField(required=False)
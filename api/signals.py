@@ -0,0 +1,27 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from books.models import Author, Book, BookProfile, Series
+from books.signals import catalog_changed
+from bundles.models import Bundle
+from circulation.models import BorrowRecord
+from .cache import invalidate_catalog
+
+CATALOG_MODELS = (Book, BookProfile, Author, Series, BorrowRecord)
+
+
+def invalidate_on_change(sender, **kwargs):
+    invalidate_catalog()
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_on_change, sender=model, dispatch_uid=f'catalog_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_on_change, sender=model, dispatch_uid=f'catalog_cache_delete_{model.__name__}')
+catalog_changed.connect(invalidate_on_change, dispatch_uid='catalog_cache_changed')
+
+
+@receiver(m2m_changed, sender=Bundle.books.through)
+def invalidate_on_bundle_books_change(sender, action, **kwargs):
+    # Adding books to a bundle changes their status with QuerySet.update()
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_catalog()
@@ -1,3 +1,485 @@
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from books.models import Author, Book, BookProfile, Series
+from bundles.models import Bundle
+from circulation import services
+from circulation.models import BorrowRecord, Hold
+from subscriptions.models import FreeBorrowingPlan, PlanDuration, Subscription
+from .cache import get_or_build, get_stats, get_version
+from .views import BookViewSet
+
+
+class BookListQueryBudgetTests(TestCase):
+    """The book list must not issue queries per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.author = Author.objects.create(name='Author')
+        cls.series = Series.objects.create(name='Series')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def create_books(self, count, start=0):
+        for i in range(start, start + count):
+            profile = BookProfile.objects.create(
+                name=f'Title {i}', isbn=f'{i:013d}',
+                author=self.author, series=self.series
+            )
+            book = Book.objects.create(profile=profile, nl_code=f'NL{i}')
+            Book.objects.create(profile=profile, nl_code=f'NL{i}00000')
+            user = User.objects.create_user(f'reader{i}')
+            borrower = user.profile
+            BorrowRecord.objects.create(
+                book=book, borrower=borrower,
+                due_date=timezone.now() + timedelta(days=30)
+            )
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_is_constant_per_page(self):
+        self.create_books(2)
+        small, _ = self.count_list_queries()
+
+        self.create_books(8, start=2)
+        large, response = self.count_list_queries()
+
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(small, large)
+
+    def test_list_includes_related_details(self):
+        self.create_books(1)
+        _, response = self.count_list_queries()
+
+        borrowed = next(b for b in response.data['results'] if b['nl_code'] == 'NL0')
+        self.assertEqual(borrowed['profile_details']['copies_count'], 2)
+        self.assertEqual(borrowed['profile_details']['available_count'], 1)
+        self.assertEqual(borrowed['profile_details']['available_copies'], 1)
+        self.assertEqual(borrowed['profile_details']['author_details']['name'], 'Author')
+        self.assertEqual(borrowed['current_borrower']['username'], 'reader0')
+
+
+class ConditionalGetTests(TestCase):
+    """ETags change with every row the book list embeds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.author = Author.objects.create(name='Author')
+        profile = BookProfile.objects.create(name='Title', isbn='0000000000001', author=cls.author)
+        cls.book = Book.objects.create(profile=profile, nl_code='NL1')
+        cls.record = BorrowRecord.objects.create(
+            book=cls.book, borrower=User.objects.create_user('reader').profile,
+            due_date=timezone.now() + timedelta(days=30)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def assert_revalidates(self, change):
+        etag = self.client.get('/api/books/')['ETag']
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_malformed_pk_is_not_found(self):
+        for url in ['/api/books/abc/', '/api/book-profiles/abc/']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_author_rename(self):
+        self.author.name = 'Renamed'
+        response = self.assert_revalidates(self.author.save)
+        self.assertEqual(response.data['results'][0]['profile_details']['author_details']['name'], 'Renamed')
+
+    def test_due_date_change(self):
+        self.record.due_date += timedelta(days=7)
+        response = self.assert_revalidates(self.record.save)
+        self.assertEqual(response.data['results'][0]['current_borrower']['due_date'], self.record.due_date)
+
+
+class CatalogCacheTests(TestCase):
+    """Cached catalog pages are reused until the catalog changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.profile = BookProfile.objects.create(name='Title', isbn='0000000000001')
+        cls.book = Book.objects.create(profile=cls.profile, nl_code='NL1')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_repeated_get_is_a_hit(self):
+        self.client.get('/api/books/')
+        self.client.get('/api/books/')
+        self.client.get('/api/books/?status=NOR')
+        stats = get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_changes_invalidate(self):
+        for change in [
+            lambda: Book.objects.get(pk=self.book.pk).save(),
+            lambda: Author.objects.create(name='Author'),
+            lambda: Bundle.objects.create(bundle_id='B1', name='Bundle').books.add(self.book),
+            lambda: Book.objects.create(profile=self.profile, nl_code='NL2').delete(),
+        ]:
+            with self.subTest(change=change):
+                version = get_version()
+                change()
+                self.assertGreater(get_version(), version)
+
+    def test_invalidation_drops_cached_pages(self):
+        self.client.get('/api/books/')
+        BookProfile.objects.filter(pk=self.profile.pk).update(name='Renamed')
+        self.assertEqual(self.client.get('/api/books/').data['results'][0]['profile_details']['name'], 'Title')
+
+        self.profile.refresh_from_db()
+        self.profile.save()
+        self.assertEqual(self.client.get('/api/books/').data['results'][0]['profile_details']['name'], 'Renamed')
+
+    def test_concurrent_miss_waits_for_builder(self):
+        key = 'catalog:test:page'
+        # Another request is building the page
+        self.assertTrue(cache.add(f'{key}:lock', 1))
+        builder = threading.Timer(0.2, cache.set, args=[key, {'built': 'elsewhere'}])
+        builder.start()
+        self.addCleanup(builder.cancel)
+
+        def build():
+            self.fail('The page was built twice')
+
+        self.assertEqual(get_or_build(key, build), {'built': 'elsewhere'})
+        self.assertEqual(get_stats()['hits'], 1)
+
+
+class BookProfileListShapeTests(TestCase):
+    """Copy counts are only aggregated when the response needs them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        for i, copies in enumerate([1, 3, 2]):
+            profile = BookProfile.objects.create(name=f'Title {i}', isbn=f'{i:013d}')
+            for j in range(copies):
+                Book.objects.create(profile=profile, nl_code=f'NL{i}{j}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        aggregated = any('copies_count' in query['sql'] for query in ctx.captured_queries)
+        return response, aggregated
+
+    def test_counts_are_skipped_when_not_rendered(self):
+        response, aggregated = self.get('/api/book-profiles/?fields=id,name,available_copies')
+        self.assertFalse(aggregated)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'available_copies'})
+
+        response, aggregated = self.get('/api/book-profiles/?fields=id,copies_count')
+        self.assertTrue(aggregated)
+        self.assertEqual(response.data['results'][0]['copies_count'], 1)
+
+    def test_ordering_by_count_aggregates(self):
+        response, aggregated = self.get('/api/book-profiles/?fields=name&ordering=-copies_count')
+        self.assertTrue(aggregated)
+        self.assertEqual([row['name'] for row in response.data['results']], ['Title 1', 'Title 2', 'Title 0'])
+
+
+class BookBulkCreateTests(TestCase):
+    """Bulk creation reports every invalid item and creates the rest"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.profile = BookProfile.objects.create(name='Title', isbn='0000000000001')
+        Book.objects.create(profile=cls.profile, nl_code='NL1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def post(self, items):
+        return self.client.post('/api/books/bulk/', items, format='json')
+
+    def test_invalid_items_do_not_block_the_others(self):
+        response = self.post([
+            {'profile': self.profile.pk, 'nl_code': 'NL2'},
+            {'profile': self.profile.pk, 'nl_code': 'NL1'},
+            {'profile': self.profile.pk, 'nl_code': 'NL2'},
+            {'profile': self.profile.pk, 'nl_code': 'XX3'},
+            {'profile': 0, 'nl_code': 'NL4'},
+            {'profile': self.profile.pk, 'nl_code': 'NL5'},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 4))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [
+            'created', 'error', 'error', 'error', 'error', 'created'
+        ])
+        self.assertIn('already in use', results[1]['errors']['nl_code'][0])
+        self.assertIn('more than once', results[2]['errors']['nl_code'][0])
+        self.assertIn('nl_code', results[3]['errors'])
+        self.assertIn('profile', results[4]['errors'])
+
+        self.assertEqual(Book.objects.filter(nl_code__in=['NL2', 'NL5']).count(), 2)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.available_copies, 3)
+
+    def test_nothing_created(self):
+        response = self.post([{'profile': self.profile.pk, 'nl_code': 'NL1'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+
+        for items in [[], {'profile': self.profile.pk, 'nl_code': 'NL2'}]:
+            response = self.post(items)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['status'], 'error')
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_limit(self):
+        items = [{'profile': self.profile.pk, 'nl_code': f'NL{i}'} for i in range(10, 13)]
+        with mock.patch.object(BookViewSet, 'BULK_CREATE_LIMIT', 2):
+            response = self.post(items)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('At most 2', response.data['message'])
+
+            response = self.post(items[:2])
+            self.assertEqual(response.status_code, 201)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors page across ties in the first ordering column"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        for i, name in enumerate(['Alpha', 'Same', 'Same', 'Same', 'Same', 'Same', 'Zeta']):
+            BookProfile.objects.create(name=name, isbn=f'{i:013d}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_across_tied_names(self):
+        expected = list(BookProfile.objects.order_by('name', 'id').values_list('pk', flat=True))
+        self.assertEqual(self.collect('/api/book-profiles/?fields=id&page_size=2'), expected)
+
+    def test_pages_across_tied_search_ranks(self):
+        ids = self.collect('/api/book-profiles/?fields=id&page_size=2&search=same')
+        expected = BookProfile.objects.filter(name='Same').values_list('pk', flat=True)
+        self.assertEqual(sorted(ids), sorted(expected))
+
+    def test_search_ranks_before_name(self):
+        BookProfile.objects.create(name='Aardvark', isbn='9000000000001', description='zeta')
+        # The full shape aggregates copy counts over the ranked rows
+        response = self.client.get('/api/book-profiles/?search=zeta')
+        self.assertEqual([row['name'] for row in response.data['results']], ['Zeta', 'Aardvark'])
+        self.assertEqual(response.data['results'][0]['copies_count'], 0)
+
+    def test_pages_backwards_across_tied_names(self):
+        url = '/api/book-profiles/?fields=id&page_size=2'
+        while True:
+            response = self.client.get(url)
+            if not response.data['next']:
+                break
+            url = response.data['next']
+        ids = [row['id'] for row in response.data['results']]
+        url = response.data['previous']
+        while url:
+            response = self.client.get(url)
+            ids = [row['id'] for row in response.data['results']] + ids
+            url = response.data['previous']
+        expected = list(BookProfile.objects.order_by('name', 'id').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+
+class HoldApiTests(TestCase):
+    """Patrons cannot take copies off the shelf by placing holds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron = User.objects.create_user('patron')
+        cls.profile = BookProfile.objects.create(name='Title', isbn='0000000000001')
+        cls.book = Book.objects.create(profile=cls.profile, nl_code='NL1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.patron)
+
+    def test_patron_without_plan_is_refused(self):
+        Book.objects.filter(pk=self.book.pk).update(status=Book.Status.BORROWED)
+        response = self.client.post('/api/holds/', {'book_profile': self.profile.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'error')
+        self.assertFalse(Hold.objects.exists())
+
+    def test_copy_on_shelf_stays_there(self):
+        response = self.client.post('/api/holds/', {'book_profile': self.profile.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.Status.NORMAL)
+
+
+class BorrowBatchApiTests(TestCase):
+    """The batch endpoint reports an outcome for every operation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        duration = PlanDuration.objects.create(months=1, description='1 month')
+        plan = FreeBorrowingPlan.objects.create(name='Free', price=0, duration=duration, max_books=1)
+        cls.reader = User.objects.create_user('reader')
+        now = timezone.now()
+        Subscription.objects.create(
+            user=cls.reader, free_borrowing_plan=plan,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=30)
+        )
+        profile = BookProfile.objects.create(name='Title', isbn='0000000000001')
+        cls.books = [Book.objects.create(profile=profile, nl_code=f'NL{i}') for i in range(2)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def post(self, operations):
+        return self.client.post('/api/borrowing/batch/', operations, format='json')
+
+    def test_partial_failure(self):
+        response = self.post([
+            {'action': 'borrow', 'book_id': self.books[0].pk, 'user_id': self.reader.pk},
+            {'action': 'borrow', 'book_id': self.books[1].pk, 'user_id': self.reader.pk},
+            {'action': 'borrow', 'book_id': self.books[1].pk},
+            {'action': 'renew', 'book_id': self.books[1].pk},
+            {'action': 'return', 'book_id': self.books[0].pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'partial')
+        self.assertEqual(response.data['message'], 'Processed 2 of 5 operations')
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['success', 'error', 'error', 'error', 'success']
+        )
+        self.assertIn('borrowing limit', results[1]['message'])
+        self.assertIn('user_id', results[2]['errors'])
+        self.assertIn('action', results[3]['errors'])
+        self.assertEqual(results[0]['record_id'], results[4]['record_id'])
+        self.assertEqual(
+            BorrowRecord.objects.get(pk=results[0]['record_id']).status, BorrowRecord.Status.RETURNED
+        )
+
+    def test_all_failed(self):
+        response = self.post([{'action': 'return', 'book_id': self.books[0].pk}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'error')
+
+    def test_rejected_payloads(self):
+        for operations in [[], {'action': 'return', 'book_id': self.books[0].pk}]:
+            response = self.post(operations)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['status'], 'error')
+
+    def test_conflict(self):
+        with mock.patch.object(
+            services, 'process_batch', side_effect=services.CirculationError('Please try again')
+        ):
+            response = self.post([{'action': 'return', 'book_id': self.books[0].pk}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data, {'status': 'error', 'message': 'Please try again'})
+
+
+class BorrowHistoryExportApiTests(TestCase):
+    """The history export streams CSV or NDJSON and rejects bad parameters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        profile = BookProfile.objects.create(name='Title', isbn='0000000000001')
+        reader = User.objects.create_user('reader').profile
+        cls.records = []
+        for i, borrowed in enumerate(['2024-01-10', '2024-02-01']):
+            book = Book.objects.create(profile=profile, nl_code=f'NL{i}')
+            record = BorrowRecord.objects.create(
+                book=book, borrower=reader, borrowed_date=f'{borrowed}T12:00:00Z',
+                due_date=timezone.now() + timedelta(days=30)
+            )
+            cls.records.append(record)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_csv_streams(self):
+        response = self.client.get('/api/borrowing/export/?from=2024-02-01')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,book,book_title'))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f'{self.records[1].pk},NL1,Title'))
+
+    def test_rows_are_read_while_streaming(self):
+        response = self.client.get('/api/borrowing/export/')
+        content = iter(response.streaming_content)
+        with CaptureQueriesContext(connection) as ctx:
+            next(content)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(content)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_ndjson(self):
+        response = self.client.get('/api/borrowing/export/?output=ndjson&to=2024-01-10&status=ACT')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.records[0].pk])
 
-# Create your tests here.
+    def test_invalid_parameters(self):
+        for query, message in [
+            ('output=xml', 'Unsupported output format: xml'),
+            ('from=soon', 'Invalid date for from: soon'),
+            ('status=ACT,BAD', 'Invalid status: BAD'),
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/borrowing/export/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'status': 'error', 'message': message})
@@ -6,7 +6,9 @@ router = DefaultRouter()
 router.register(r'borrowing', views.BorrowingViewSet, basename='borrowing')
 router.register(r'books', views.BookViewSet, basename='books')
 router.register(r'book-profiles', views.BookProfileViewSet, basename='book-profiles')
+router.register(r'holds', views.HoldViewSet, basename='holds')
 
 urlpatterns = [
+    path('catalog-cache/', views.CatalogCacheStatsView.as_view(), name='catalog-cache'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,50 +1,168 @@
 from django.shortcuts import render
-from rest_framework import viewsets, status, filters
+from rest_framework import mixins, viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.utils import timezone
 from datetime import timedelta
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 
-from circulation.models import BorrowRecord
+from circulation import exports, services
+from circulation.models import BorrowRecord, Hold
 from books.models import Book, BookProfile
 from users.models import Profile
+from .filters import BookProfileFilter, CatalogSearchFilter
+from .cache import get_stats, invalidate_catalog
+from .mixins import CachedResponseMixin, ConditionalGetMixin, FieldShapeMixin
+from .pagination import (
+    BookCursorPagination, BookProfileCursorPagination, BorrowRecordCursorPagination,
+    HoldCursorPagination
+)
 from .serializers import (
     BorrowRecordSerializer, BorrowCreateSerializer, ReturnBookSerializer,
-    BookSerializer, BookProfileSerializer, BookCreateSerializer
+    BookSerializer, BookProfileSerializer, BookCreateSerializer, BookBulkItemSerializer,
+    BorrowBatchOperationSerializer, RenewLoanSerializer, HoldSerializer, HoldCreateSerializer,
+    CheckoutAnySerializer
 )
 
-class BookProfileViewSet(viewsets.ModelViewSet):
+class BookProfileViewSet(ConditionalGetMixin, CachedResponseMixin, FieldShapeMixin, viewsets.ModelViewSet):
     queryset = BookProfile.objects.all()
     serializer_class = BookProfileSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['author', 'series']
+    pagination_class = BookProfileCursorPagination
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter, filters.OrderingFilter]
+    filterset_class = BookProfileFilter
     search_fields = ['name', 'isbn', 'description']
-    ordering_fields = ['name', 'time_added', 'last_updated']
+    search_profile_field = 'id'
+    ordering_fields = [
+        'name', 'time_added', 'last_updated',
+        'copies_count', 'available_copies'
+    ]
+
+    # Annotated by with_copy_counts(); available_copies is a column
+    COUNT_FIELDS = ['copies_count', 'borrowed_count', 'in_bundle_count', 'lost_count']
+
+    def get_queryset(self):
+        """
+        Annotate copy counts per status in the list query itself, when the
+        response renders them or the results are ordered by them
+        """
+        # Meta.ordering is not applied to aggregated querysets
+        queryset = BookProfile.objects.order_by('name')
+        ordering = {
+            field.strip().lstrip('-')
+            for field in self.request.query_params.get('ordering', '').split(',')
+        }
+        if ordering & set(self.COUNT_FIELDS) or any(map(self.wants_field, self.COUNT_FIELDS)):
+            queryset = queryset.with_copy_counts()
+        related = [
+            relation for relation, field in [('author', 'author_details'), ('series', 'series_details')]
+            if self.wants_field(field)
+        ]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
+
+    def get_validator_querysets(self, queryset):
+        # Copy counts change with the status of the copies
+        return [queryset, Book.objects.filter(profile__in=queryset.values('pk'))]
+
+    def get_serializer_class(self):
+        if self.action == 'checkout_any':
+            return CheckoutAnySerializer
+        return BookProfileSerializer
 
     def get_permissions(self):
         """
-        Only staff can create/update/delete book profiles
+        Only staff can create/update/delete book profiles or check them out
         Regular users can only view
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'checkout_any']:
             return [IsAuthenticated(), IsAdminUser()]
         return [IsAuthenticated()]
 
-class BookViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def checkout_any(self, request, pk=None):
+        """Lend whichever copy of this title is free"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        book_profile = get_object_or_404(BookProfile, pk=pk)
+        borrower = get_object_or_404(Profile, user_id=serializer.validated_data['user_id'])
+        try:
+            borrow_record = services.borrow_any(
+                book_profile.pk,
+                borrower,
+                notes=serializer.validated_data.get('notes', ''),
+                actor=request.user
+            )
+        except services.CirculationError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'message': 'Borrow record created successfully',
+            'record': BorrowRecordSerializer(borrow_record).data
+        }, status=status.HTTP_201_CREATED)
+
+class BookViewSet(ConditionalGetMixin, CachedResponseMixin, FieldShapeMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = BookCursorPagination
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'profile']
     search_fields = ['nl_code', 'profile__name', 'profile__isbn']
+    search_profile_field = 'profile'
+    search_code_field = 'nl_code'
     ordering_fields = ['nl_code', 'time_added', 'last_updated']
 
+    BULK_CREATE_LIMIT = 5000
+
+    def get_queryset(self):
+        """
+        Load a page of books in a fixed number of queries: the books, their
+        profiles (with author, series and copy counts) and their active
+        borrow records with the borrowing user. Relations the response
+        does not render are not loaded.
+        """
+        queryset = Book.objects.all()
+        if self.wants_field('profile_details'):
+            profiles = BookProfile.objects.select_related(
+                'author', 'series'
+            ).with_copy_counts()
+            queryset = queryset.prefetch_related(Prefetch('profile', queryset=profiles))
+        if self.wants_field('current_borrower'):
+            active_borrows = BorrowRecord.objects.filter(
+                status__in=BorrowRecord.ON_LOAN
+            ).select_related('borrower__user')
+            queryset = queryset.prefetch_related(
+                Prefetch('borrow_records', queryset=active_borrows, to_attr='active_borrow_records')
+            )
+        return queryset
+
+    def get_validator_querysets(self, queryset):
+        # Each copy embeds its profile details and the loan it is out on
+        return [
+            queryset,
+            BookProfile.objects.filter(pk__in=queryset.values('profile')),
+            (BorrowRecord.objects.filter(
+                book__in=queryset.values('pk'), status__in=BorrowRecord.ON_LOAN
+            ), 'updated'),
+        ]
+
     def get_serializer_class(self):
         if self.action == 'create':
             return BookCreateSerializer
+        if self.action == 'bulk_create':
+            return BookBulkItemSerializer
         return BookSerializer
 
     def get_permissions(self):
@@ -52,7 +170,7 @@ class BookViewSet(viewsets.ModelViewSet):
         Only staff can create/update/delete books
         Regular users can only view
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'bulk_create', 'update', 'partial_update', 'destroy']:
             return [IsAuthenticated(), IsAdminUser()]
         return [IsAuthenticated()]
 
@@ -65,18 +183,109 @@ class BookViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        Create many copies at once from a list of {profile, nl_code} items.
+
+        Uniqueness and profiles are checked with one query each for the
+        whole batch and valid items are inserted in a single transaction.
+        Invalid items are reported per index and do not block the others.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({
+                'status': 'error',
+                'message': 'Expected a non-empty list of books'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.BULK_CREATE_LIMIT:
+            return Response({
+                'status': 'error',
+                'message': f'At most {self.BULK_CREATE_LIMIT} books can be created per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        valid = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+                results.append(None)
+            else:
+                results.append({
+                    'index': index,
+                    'nl_code': item.get('nl_code') if isinstance(item, dict) else None,
+                    'status': 'error',
+                    'errors': serializer.errors
+                })
+
+        codes = [data['nl_code'] for _, data in valid]
+        taken = set(Book.objects.filter(nl_code__in=codes).values_list('nl_code', flat=True))
+        profiles = set(BookProfile.objects.filter(
+            pk__in={data['profile'] for _, data in valid}
+        ).values_list('pk', flat=True))
+
+        seen = set()
+        to_create = []
+        for index, data in valid:
+            errors = {}
+            if data['nl_code'] in taken:
+                errors['nl_code'] = ['This NL code is already in use.']
+            elif data['nl_code'] in seen:
+                errors['nl_code'] = ['This NL code appears more than once in the request.']
+            if data['profile'] not in profiles:
+                errors['profile'] = ['Book profile not found.']
+            seen.add(data['nl_code'])
+
+            if errors:
+                results[index] = {
+                    'index': index, 'nl_code': data['nl_code'],
+                    'status': 'error', 'errors': errors
+                }
+            else:
+                to_create.append((index, Book(profile_id=data['profile'], nl_code=data['nl_code'])))
+
+        try:
+            with transaction.atomic():
+                Book.objects.bulk_create([book for _, book in to_create], batch_size=500)
+                BookProfile.objects.filter(
+                    pk__in={book.profile_id for _, book in to_create}
+                ).refresh_available_copies()
+        except IntegrityError:
+            return Response({
+                'status': 'error',
+                'message': 'Some NL codes were taken while the request was processed, please retry'
+            }, status=status.HTTP_409_CONFLICT)
+        if to_create:
+            invalidate_catalog()
+
+        for index, book in to_create:
+            results[index] = {
+                'index': index, 'nl_code': book.nl_code,
+                'status': 'created', 'id': book.pk
+            }
+
+        return Response({
+            'status': 'success' if to_create else 'error',
+            'message': f'Created {len(to_create)} of {len(items)} books',
+            'created': len(to_create),
+            'failed': len(items) - len(to_create),
+            'results': results
+        }, status=status.HTTP_201_CREATED if to_create else status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['post'])
     def write_off(self, request, pk=None):
         """Mark a book as written off"""
         book = self.get_object()
-        if book.status != Book.Status.NORMAL:
+        try:
+            services.write_off(book.pk, actor=request.user)
+        except services.CirculationError as e:
             return Response({
                 'status': 'error',
-                'message': f'Cannot write off book with status: {book.get_status_display()}'
+                'message': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        book.status = Book.Status.WRITTEN_OFF
-        book.save()
+        book.refresh_from_db(fields=['status', 'last_updated'])
         return Response({
             'status': 'success',
             'message': 'Book has been written off',
@@ -87,63 +296,75 @@ class BookViewSet(viewsets.ModelViewSet):
     def mark_lost(self, request, pk=None):
         """Mark a book as lost"""
         book = self.get_object()
-        if book.status not in [Book.Status.BORROWED, Book.Status.NORMAL]:
+        try:
+            services.mark_lost(book.pk, actor=request.user)
+        except services.CirculationError as e:
             return Response({
                 'status': 'error',
-                'message': f'Cannot mark book as lost with status: {book.get_status_display()}'
+                'message': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # If book was borrowed, update the borrow record
-        active_borrow = book.borrow_records.filter(status=BorrowRecord.Status.ACTIVE).first()
-        if active_borrow:
-            active_borrow.status = BorrowRecord.Status.LOST
-            active_borrow.save()
-
-        book.status = Book.Status.LOST
-        book.save()
+        book.refresh_from_db(fields=['status', 'last_updated'])
         return Response({
             'status': 'success',
             'message': 'Book has been marked as lost',
             'book': BookSerializer(book).data
         })
 
-class BorrowingViewSet(viewsets.ModelViewSet):
+class CatalogCacheStatsView(APIView):
+    """Hit and miss counters of the catalog response cache"""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+class BorrowingViewSet(FieldShapeMixin, viewsets.ModelViewSet):
     queryset = BorrowRecord.objects.all()
     serializer_class = BorrowRecordSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
+    pagination_class = BorrowRecordCursorPagination
+
+    BATCH_LIMIT = 1000
 
     def get_serializer_class(self):
         if self.action == 'create_borrow':
             return BorrowCreateSerializer
         elif self.action == 'return_book':
             return ReturnBookSerializer
+        elif self.action == 'renew':
+            return RenewLoanSerializer
+        elif self.action == 'batch':
+            return BorrowBatchOperationSerializer
         return BorrowRecordSerializer
 
+    def get_queryset(self):
+        queryset = BorrowRecord.objects.all()
+        related = [
+            relation for relation, field in [('book__profile', 'book_title'), ('borrower__user', 'borrower_name')]
+            if self.wants_field(field)
+        ]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
+
     @action(detail=False, methods=['post'])
     def create_borrow(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        book = get_object_or_404(Book, id=serializer.validated_data['book_id'])
         borrower = get_object_or_404(Profile, user_id=serializer.validated_data['user_id'])
-        notes = serializer.validated_data.get('notes', '')
-
-        # Auto-calculate due date (30 days from now)
-        due_date = timezone.now() + timedelta(days=30)
-
-        # Create borrow record
-        borrow_record = BorrowRecord.objects.create(
-            book=book,
-            borrower=borrower,
-            borrowed_date=timezone.now(),
-            due_date=due_date,
-            notes=notes,
-            status=BorrowRecord.Status.ACTIVE
-        )
-
-        # Update book status
-        book.status = Book.Status.BORROWED
-        book.save()
+        try:
+            borrow_record = services.borrow_book(
+                serializer.validated_data['book_id'],
+                borrower,
+                notes=serializer.validated_data.get('notes', ''),
+                actor=request.user
+            )
+        except services.CirculationError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             'status': 'success',
@@ -156,33 +377,199 @@ class BorrowingViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        book = get_object_or_404(Book, id=serializer.validated_data['book_id'])
-        notes = serializer.validated_data.get('notes', '')
-
-        # Find active borrow record
-        borrow_record = BorrowRecord.objects.filter(
-            book=book,
-            status=BorrowRecord.Status.ACTIVE
-        ).first()
-        
-        if not borrow_record:
+        try:
+            borrow_record = services.return_book(
+                serializer.validated_data['book_id'],
+                notes=serializer.validated_data.get('notes', ''),
+                actor=request.user
+            )
+        except services.CirculationError as e:
             return Response({
                 'status': 'error',
-                'message': 'No active borrow record found for this book'
+                'message': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update borrow record
-        borrow_record.status = BorrowRecord.Status.RETURNED
-        borrow_record.returned_date = timezone.now()
-        borrow_record.notes = f"{borrow_record.notes}\nReturn notes: {notes}".strip()
-        borrow_record.save()
+        return Response({
+            'status': 'success',
+            'message': 'Book returned successfully',
+            'record': BorrowRecordSerializer(borrow_record).data
+        })
 
-        # Update book status
-        book.status = Book.Status.NORMAL
-        book.save()
+    @action(detail=False, methods=['post'])
+    def renew(self, request):
+        """Extend the open loan of a book by another loan period"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            borrow_record = services.renew_loan(serializer.validated_data['book_id'], actor=request.user)
+        except services.CirculationError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             'status': 'success',
-            'message': 'Book returned successfully',
+            'message': 'Loan renewed successfully',
             'record': BorrowRecordSerializer(borrow_record).data
         })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the borrow history as CSV or NDJSON.
+
+        Query parameters: `output` (csv or ndjson), `from` and `to` bounds on
+        borrowed_date, and `status` (comma-separated status codes).
+        """
+        fmt = request.query_params.get('output', 'csv')
+        if fmt not in exports.FORMATS:
+            return Response({
+                'status': 'error',
+                'message': f'Unsupported output format: {fmt}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        bounds = {}
+        for param, name, end in [('from', 'date_from', False), ('to', 'date_to', True)]:
+            value = request.query_params.get(param)
+            if value:
+                bounds[name] = exports.parse_bound(value, end=end)
+                if bounds[name] is None:
+                    return Response({
+                        'status': 'error',
+                        'message': f'Invalid date for {param}: {value}'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+        statuses = [code for code in request.query_params.get('status', '').split(',') if code]
+        invalid = set(statuses) - set(BorrowRecord.Status.values)
+        if invalid:
+            return Response({
+                'status': 'error',
+                'message': f'Invalid status: {", ".join(sorted(invalid))}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = exports.history_queryset(statuses=statuses, **bounds)
+        response = StreamingHttpResponse(
+            exports.iter_export(queryset, fmt),
+            content_type=exports.CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="borrow-history.{fmt}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Process a list of borrow and return operations in one transaction.
+
+        Operations are applied in order by circulation.services.process_batch
+        with a few queries for the whole batch. Each operation gets its own
+        outcome; a failing one does not stop the rest. If another desk changed
+        the same copies or borrowers meanwhile, nothing is applied and the
+        batch can be retried.
+        """
+        operations = request.data
+        if not isinstance(operations, list) or not operations:
+            return Response({
+                'status': 'error',
+                'message': 'Expected a non-empty list of operations'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > self.BATCH_LIMIT:
+            return Response({
+                'status': 'error',
+                'message': f'At most {self.BATCH_LIMIT} operations can be processed per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(operations)
+        valid = []
+        for index, operation in enumerate(operations):
+            serializer = self.get_serializer(data=operation)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': 'error', 'errors': serializer.errors}
+
+        try:
+            outcomes = services.process_batch([op for _, op in valid], actor=request.user)
+        except services.CirculationError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_409_CONFLICT)
+        for (index, _), outcome in zip(valid, outcomes):
+            results[index] = {'index': index, **outcome}
+            if 'record' in outcome:
+                results[index]['record_id'] = results[index].pop('record').pk
+
+        succeeded = sum(1 for outcome in results if outcome['status'] == 'success')
+        return Response({
+            'status': 'success' if succeeded == len(operations) else 'partial' if succeeded else 'error',
+            'message': f'Processed {succeeded} of {len(operations)} operations',
+            'results': results
+        })
+
+class HoldViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Hold queues for titles. Patrons see and manage their own holds; staff
+    see every hold and can place holds on behalf of a patron.
+    """
+    serializer_class = HoldSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = HoldCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'book_profile', 'patron']
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return HoldCreateSerializer
+        return HoldSerializer
+
+    def get_queryset(self):
+        queryset = Hold.objects.select_related('book_profile', 'patron__user', 'book')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(patron__user=self.request.user)
+        return queryset
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user_id = serializer.validated_data.get('user_id')
+        if user_id is not None and user_id != request.user.pk and not request.user.is_staff:
+            return Response({
+                'status': 'error',
+                'message': 'Only staff can place holds for other users'
+            }, status=status.HTTP_403_FORBIDDEN)
+        patron = get_object_or_404(Profile, user_id=user_id if user_id is not None else request.user.pk)
+        book_profile = get_object_or_404(BookProfile, pk=serializer.validated_data['book_profile'])
+
+        try:
+            hold = services.place_hold(book_profile.pk, patron)
+        except services.CirculationError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'message': 'Hold placed',
+            'hold': HoldSerializer(hold).data
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        hold = self.get_object()
+        try:
+            services.cancel_hold(hold, actor=request.user)
+        except services.CirculationError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'message': 'Hold cancelled',
+            'hold': HoldSerializer(hold).data
+        })
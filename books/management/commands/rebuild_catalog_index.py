@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from books import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of the book catalog'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError(
+                'The catalog search index is not available on this database. '
+                'It requires SQLite with FTS5; run migrate first.'
+            )
+
+        count = search.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {count} book profiles')
+        )
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS books_bookprofile_fts USING fts5("
+        "name, isbn, description, author, series, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+    )
+    schema_editor.execute(
+        "INSERT INTO books_bookprofile_fts (rowid, name, isbn, description, author, series) "
+        "SELECT p.id, p.name, p.isbn, p.description, COALESCE(a.name, ''), COALESCE(s.name, '') "
+        "FROM books_bookprofile p "
+        "LEFT JOIN books_author a ON a.id = p.author_id "
+        "LEFT JOIN books_series s ON s.id = p.series_id"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS books_bookprofile_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0002_alter_book_status"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
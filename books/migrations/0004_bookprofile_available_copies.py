@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_available_copies(apps, schema_editor):
+    BookProfile = apps.get_model("books", "BookProfile")
+    Book = apps.get_model("books", "Book")
+    available = (
+        Book.objects.filter(profile=OuterRef("pk"), status="NOR")
+        .order_by()
+        .values("profile")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    BookProfile.objects.update(available_copies=Coalesce(Subquery(available), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_bookprofile_fts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookprofile",
+            name="available_copies",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_available_copies, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import RegexValidator
+from django.db.models.functions import Coalesce
 
 class Author(models.Model):
     name = models.CharField(max_length=200)
@@ -18,6 +19,33 @@ class Series(models.Model):
     def __str__(self):
         return self.name
 
+class BookProfileQuerySet(models.QuerySet):
+    def with_copy_counts(self):
+        """
+        Annotate the total number of copies and the number per status;
+        copies on the shelf are already counted in available_copies
+        """
+        return self.annotate(
+            copies_count=models.Count('copies'),
+            borrowed_count=models.Count(
+                'copies', filter=models.Q(copies__status=Book.Status.BORROWED)
+            ),
+            in_bundle_count=models.Count(
+                'copies', filter=models.Q(copies__status=Book.Status.IN_BUNDLE)
+            ),
+            lost_count=models.Count(
+                'copies', filter=models.Q(copies__status=Book.Status.LOST)
+            ),
+        )
+
+    def refresh_available_copies(self):
+        """Recount available_copies for these profiles with one UPDATE"""
+        available = Book.objects.filter(
+            profile=models.OuterRef('pk'),
+            status=Book.Status.NORMAL
+        ).order_by().values('profile').annotate(count=models.Count('pk')).values('count')
+        return self.update(available_copies=Coalesce(models.Subquery(available), 0))
+
 class BookProfile(models.Model):
     """Model for book metadata that can be shared across multiple copies"""
     name = models.CharField(max_length=200)
@@ -43,10 +71,21 @@ class BookProfile(models.Model):
         related_name='book_profiles'
     )
     
+    # Copies on the shelf (status Normal), recounted whenever a copy
+    # changes status so catalog pages and checkout need no aggregate
+    available_copies = models.PositiveIntegerField(default=0, editable=False)
+    
     # Metadata
     time_added = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     
+    objects = BookProfileQuerySet.as_manager()
+    
+    @staticmethod
+    def refresh_availability(book_ids):
+        """Recount available_copies for the profiles of the given copies"""
+        BookProfile.objects.filter(copies__in=list(book_ids)).refresh_available_copies()
+    
     class Meta:
         ordering = ['name']
     
@@ -0,0 +1,108 @@
+"""
+Full-text catalog search backed by an SQLite FTS5 table.
+
+The table holds one row per BookProfile (rowid = profile id) with the
+profile name, ISBN, description and the author and series names. Rows are
+refreshed from signals in books.signals and can be rebuilt with the
+rebuild_catalog_index management command. On other databases, or before
+the migration has run, is_available() is False and callers fall back to
+plain LIKE searches.
+"""
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'books_bookprofile_fts'
+
+# Ranking function with column weights: name, isbn, description, author, series
+RANK_FUNCTION = 'bm25(10.0, 5.0, 1.0, 3.0, 2.0)'
+
+SELECT_ROWS_SQL = """
+    SELECT p.id, p.name, p.isbn, p.description,
+           COALESCE(a.name, ''), COALESCE(s.name, '')
+    FROM books_bookprofile p
+    LEFT JOIN books_author a ON a.id = p.author_id
+    LEFT JOIN books_series s ON s.id = p.series_id
+"""
+
+_available = {}
+
+
+def is_available(using='default'):
+    """Whether the FTS table exists on the given database"""
+    if using not in _available:
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            _available[using] = False
+        else:
+            with connection.cursor() as cursor:
+                _available[using] = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _available[using]
+
+
+def build_match_query(terms):
+    """
+    Turn search terms into an FTS5 query where every term must match as a
+    prefix, e.g. ['gats', 'fitz'] -> '"gats"* "fitz"*'.
+    """
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms if term)
+
+
+def matching(queryset, query, profile_field):
+    """
+    Restrict `queryset` to the rows whose profile, in `profile_field`,
+    matches the query, and annotate them with `search_rank` (lower is more
+    relevant).
+
+    The index table is joined once and the rank is its hidden `rank`
+    column, set to RANK_FUNCTION for this query. Unlike a bm25() call, the
+    column can also be read by grouped querysets such as those annotated
+    with copy counts.
+    """
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rank MATCH %s'],
+        params=[query, RANK_FUNCTION],
+    ).filter(
+        **{profile_field: RawSQL(f'{FTS_TABLE}.rowid', ())}
+    ).annotate(search_rank=RawSQL(f'{FTS_TABLE}.rank', (), output_field=FloatField()))
+
+
+def index_profiles(profile_ids, using='default'):
+    """Insert or refresh the index rows of the given profiles"""
+    profile_ids = list(profile_ids)
+    if not profile_ids or not is_available(using):
+        return
+    placeholders = ', '.join(['%s'] * len(profile_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', profile_ids)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, isbn, description, author, series) '
+            f'{SELECT_ROWS_SQL} WHERE p.id IN ({placeholders})',
+            profile_ids,
+        )
+
+
+def remove_profiles(profile_ids, using='default'):
+    """Drop the index rows of the given profiles"""
+    profile_ids = list(profile_ids)
+    if not profile_ids or not is_available(using):
+        return
+    placeholders = ', '.join(['%s'] * len(profile_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', profile_ids)
+
+
+def rebuild(using='default'):
+    """Repopulate the whole index from the catalog tables; returns the row count"""
+    if not is_available(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, isbn, description, author, series) '
+            f'{SELECT_ROWS_SQL}'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,61 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from . import search
+from .models import Author, Book, BookProfile, Series
+
+# Sent by code that changes catalog rows without model signals
+# (QuerySet.update(), bulk_create()), e.g. circulation.services; the API
+# drops its cached catalog pages on it
+catalog_changed = Signal()
+
+
+@receiver(post_save, sender=BookProfile)
+def index_book_profile(sender, instance, **kwargs):
+    search.index_profiles([instance.pk])
+
+
+@receiver(post_delete, sender=BookProfile)
+def unindex_book_profile(sender, instance, **kwargs):
+    search.remove_profiles([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Series)
+def reindex_related_profiles(sender, instance, **kwargs):
+    """Author and series names are indexed with each of their profiles"""
+    search.index_profiles(instance.book_profiles.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Series)
+def remember_related_profiles(sender, instance, **kwargs):
+    # The profiles are detached (SET_NULL) before post_delete fires
+    instance._indexed_profile_ids = list(instance.book_profiles.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Series)
+def reindex_detached_profiles(sender, instance, **kwargs):
+    search.index_profiles(getattr(instance, '_indexed_profile_ids', []))
+
+
+@receiver(pre_save, sender=Book)
+def remember_previous_values(sender, instance, **kwargs):
+    # A copy moved to another profile leaves its old profile one short;
+    # status changes are logged by circulation.signals
+    update_fields = kwargs.get('update_fields')
+    if instance.pk is not None and (
+        update_fields is None or {'profile', 'status'} & set(update_fields)
+    ):
+        previous = Book.objects.filter(pk=instance.pk).values_list('profile_id', 'status').first()
+        if previous:
+            instance._previous_profile_id, instance._previous_status = previous
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def recount_available_copies(sender, instance, **kwargs):
+    """Saves and deletes through the ORM; services recount after their own UPDATEs"""
+    profile_ids = {instance.profile_id, getattr(instance, '_previous_profile_id', None)} - {None}
+    BookProfile.objects.filter(pk__in=profile_ids).refresh_available_copies()
@@ -1,3 +1,67 @@
+from importlib import import_module
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from . import search
+from .models import Author, BookProfile, Series
+
+fts_migration = import_module('books.migrations.0003_bookprofile_fts')
+
+
+class CatalogSearchTests(TestCase):
+    """The full-text index follows the catalog and ranks by relevance"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Fitzgerald')
+        cls.series = Series.objects.create(name='Jazz Age')
+        cls.gatsby = BookProfile.objects.create(
+            name='The Great Gatsby', isbn='9780743273565',
+            author=cls.author, series=cls.series
+        )
+        cls.essay = BookProfile.objects.create(
+            name='Essays', isbn='9780000000001', description='On the great novels of the age'
+        )
+
+    def find(self, *terms):
+        query = search.build_match_query(terms)
+        return list(
+            search.matching(BookProfile.objects.all(), query, 'id')
+            .order_by('search_rank').values_list('name', flat=True)
+        )
+
+    def test_index_is_created_on_sqlite(self):
+        self.assertTrue(search.is_available())
+
+    def test_migration_skips_other_databases(self):
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = 'postgresql'
+        fts_migration.create_fts_table(None, schema_editor)
+        fts_migration.drop_fts_table(None, schema_editor)
+        schema_editor.execute.assert_not_called()
+
+    def test_profile_changes_are_indexed(self):
+        self.gatsby.name = 'Trimalchio'
+        self.gatsby.save()
+        self.assertEqual(self.find('trimal'), ['Trimalchio'])
+        self.assertEqual(self.find('gatsby'), [])
+
+        self.gatsby.delete()
+        self.assertEqual(self.find('trimal'), [])
+
+    def test_author_and_series_changes_are_indexed(self):
+        self.assertEqual(self.find('fitz'), ['The Great Gatsby'])
+        self.author.name = 'Scott'
+        self.author.save()
+        self.assertEqual(self.find('fitz'), [])
+        self.assertEqual(self.find('scott'), ['The Great Gatsby'])
+
+        self.series.delete()
+        self.assertEqual(self.find('jazz'), [])
+        self.assertEqual(self.find('age'), ['Essays'])
+
+    def test_ranked_by_relevance(self):
+        # A name match outweighs a description match
+        self.assertEqual(self.find('great'), ['The Great Gatsby', 'Essays'])
+        self.assertEqual(self.find('great', 'essay'), ['Essays'])
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import RegexValidator
 from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
-from books.models import Book
+from django.utils import timezone
+from books.models import Book, BookProfile
 
 class Bundle(models.Model):
     class Status(models.TextChoices):
@@ -54,9 +55,26 @@ class Bundle(models.Model):
         super().save(*args, **kwargs)
 
     def update_books_status(self):
-        """Update the status of all books in the bundle"""
-        # Set all current books to IN_BUNDLE status
-        self.books.all().update(status=Book.Status.IN_BUNDLE)
+        """Update the status of all books in the bundle and log the changes"""
+        # circulation.models imports this module
+        from circulation.models import CirculationEvent
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Set all current books to IN_BUNDLE status
+            changed = list(
+                self.books.exclude(status=Book.Status.IN_BUNDLE).values_list('pk', 'status')
+            )
+            if not changed:
+                return
+            Book.objects.filter(pk__in=[pk for pk, _ in changed]).update(
+                status=Book.Status.IN_BUNDLE, last_updated=now
+            )
+            CirculationEvent.objects.bulk_create([
+                CirculationEvent.status_change(pk, status, Book.Status.IN_BUNDLE, now)
+                for pk, status in changed
+            ])
+            BookProfile.refresh_availability(pk for pk, _ in changed)
     
     def remove_books_status(self, books_to_remove=None):
         """Reset the status of removed books to NORMAL"""
@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import BookBorrowing, BundleBorrowing, BorrowRecord
+from django.contrib import admin, messages
+from . import services
+from .models import BookBorrowing, BundleBorrowing, BorrowRecord, CirculationEvent, Hold, LoanNotice
 
 class BaseBorrowingAdmin(admin.ModelAdmin):
     list_display = (
@@ -53,13 +54,69 @@ class BorrowRecordAdmin(admin.ModelAdmin):
     date_hierarchy = 'borrowed_date'
     
     actions = ['mark_as_returned', 'mark_as_lost']
+    # Ids of skipped records named in the action's message
+    SKIPPED_LISTED = 20
     
     def mark_as_returned(self, request, queryset):
-        for record in queryset:
-            record.mark_as_returned()
+        self._close(request, queryset, services.return_records, 'returned')
     mark_as_returned.short_description = "Mark selected records as returned"
     
     def mark_as_lost(self, request, queryset):
-        for record in queryset:
-            record.mark_as_lost()
+        self._close(request, queryset, services.lose_records, 'lost')
     mark_as_lost.short_description = "Mark selected records as lost"
+    
+    def _close(self, request, queryset, transition, label):
+        try:
+            changed, skipped = transition(queryset, actor=request.user)
+        except services.CirculationError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f"{len(changed)} records marked as {label}")
+        if skipped:
+            skipped = sorted(skipped)
+            listed = ", ".join(str(pk) for pk in skipped[:self.SKIPPED_LISTED])
+            if len(skipped) > self.SKIPPED_LISTED:
+                listed += f" and {len(skipped) - self.SKIPPED_LISTED} more"
+            self.message_user(
+                request,
+                f"Skipped {len(skipped)} records that were not on loan: {listed}",
+                messages.WARNING
+            )
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book_profile', 'patron', 'status', 'book', 'placed_at', 'expires_at')
+    list_filter = ('status', 'placed_at')
+    list_select_related = ('book_profile', 'patron__user', 'book__profile')
+    search_fields = ('book_profile__name', 'patron__user__username', 'book__nl_code')
+    raw_id_fields = ('book_profile', 'patron', 'book')
+    readonly_fields = ('status', 'book', 'ready_at', 'expires_at', 'closed_at')
+    date_hierarchy = 'placed_at'
+
+
+@admin.register(LoanNotice)
+class LoanNoticeAdmin(admin.ModelAdmin):
+    list_display = ('record', 'kind', 'due_date', 'sent_at')
+    list_filter = ('kind',)
+    list_select_related = ('record__book', 'record__bundle', 'record__borrower__user')
+    raw_id_fields = ('record',)
+    date_hierarchy = 'sent_at'
+
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(admin.ModelAdmin):
+    """Read-only view of the append-only circulation log"""
+    list_display = ('timestamp', 'event_type', 'book', 'bundle', 'profile', 'actor')
+    list_filter = ('event_type',)
+    list_select_related = ('book', 'bundle', 'profile__user', 'actor')
+    search_fields = ('book__nl_code', 'bundle__bundle_id', 'profile__user__username')
+    date_hierarchy = 'timestamp'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
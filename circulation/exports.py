@@ -0,0 +1,97 @@
+"""
+Streaming exports of the borrow history.
+
+Rows are read with values() and iterator(), so no model instances are
+built and memory use does not grow with the size of the export.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import BorrowRecord
+
+FORMATS = ['csv', 'ndjson']
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Output column -> lookup
+COLUMNS = {
+    'id': 'id',
+    'book': 'book__nl_code',
+    'book_title': 'book__profile__name',
+    'bundle': 'bundle__bundle_id',
+    'borrower': 'borrower__user__username',
+    'status': 'status',
+    'borrowed_date': 'borrowed_date',
+    'due_date': 'due_date',
+    'returned_date': 'returned_date',
+    'notes': 'notes',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def parse_bound(value, end=False):
+    """
+    Parse a date or datetime bound. A plain date covers the whole day, so
+    as an upper bound it means the end of that day. Returns None if invalid.
+    """
+    try:
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        return None
+    if day is not None:
+        moment = datetime.combine(day, time.max if end else time.min)
+    elif moment is None:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def history_queryset(date_from=None, date_to=None, statuses=None):
+    """Borrow records filtered on borrowed_date and status, as plain values"""
+    queryset = BorrowRecord.objects.all()
+    if date_from:
+        queryset = queryset.filter(borrowed_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(borrowed_date__lte=date_to)
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset.order_by('id').values_list(*COLUMNS.values())
+
+
+class _Echo:
+    """File-like object that returns what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS.keys())
+    for row in queryset.iterator(chunk_size=chunk_size):
+        yield writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in row
+        )
+
+
+def iter_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    keys = list(COLUMNS.keys())
+    for row in queryset.iterator(chunk_size=chunk_size):
+        yield json.dumps(dict(zip(keys, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export(queryset, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    if fmt == 'ndjson':
+        return iter_ndjson(queryset, chunk_size)
+    return iter_csv(queryset, chunk_size)
@@ -1,27 +1,58 @@
+import time
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from circulation import services
 from circulation.models import BorrowRecord
-from books.models import Book
 
 class Command(BaseCommand):
-    help = 'Check for overdue books and update their status'
+    help = 'Mark active borrow records past their due date as overdue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of records updated per statement'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the records that would be marked overdue'
+        )
 
     def handle(self, *args, **options):
-        # Get all active borrow records
-        active_borrows = BorrowRecord.objects.filter(
+        started = time.monotonic()
+        now = timezone.now()
+
+        # Served by the partial index on due_date for active records
+        overdue = BorrowRecord.objects.filter(
             status=BorrowRecord.Status.ACTIVE,
-            due_date__lt=timezone.now()
+            due_date__lt=now
         )
-        
+
+        if options['dry_run']:
+            count = overdue.count()
+            self.stdout.write(
+                f'{count} borrow records would be marked overdue '
+                f'({time.monotonic() - started:.3f}s)'
+            )
+            return
+
+        # One SELECT ... LIMIT n, one UPDATE and one batched event insert per
+        # batch, each batch in its own short transaction; updated rows drop
+        # out of the next batch
         count = 0
-        for borrow in active_borrows:
-            # Update book status to overdue
-            book = borrow.book
-            book.status = Book.Status.OVERDUE
-            book.save()
-            
-            count += 1
-        
+        batches = 0
+        while True:
+            batch = overdue.order_by().values('pk')[:options['batch_size']]
+            updated = services.mark_overdue(BorrowRecord.objects.filter(pk__in=batch), now)
+            if not updated:
+                break
+            count += updated
+            batches += 1
+
+        elapsed = time.monotonic() - started
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully updated {count} overdue books')
-        ) 
\ No newline at end of file
+            self.style.SUCCESS(
+                f'Successfully marked {count} borrow records overdue '
+                f'in {batches} batches ({elapsed:.3f}s)'
+            )
+        )
@@ -0,0 +1,145 @@
+import heapq
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from circulation import services
+from circulation.models import BorrowRecord
+
+class Command(BaseCommand):
+    help = (
+        'Run a long-lived scheduler that marks borrow records overdue as soon '
+        'as their due date passes'
+    )
+
+    # Records looked up per statement when marking or re-reading records
+    CHUNK_SIZE = 500
+    # How far back each poll looks again, for changes stamped before the
+    # previous poll but committed after it
+    CHANGE_OVERLAP = timedelta(minutes=5)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon', type=int, default=24,
+            help='Hours of upcoming due dates kept in memory'
+        )
+        parser.add_argument(
+            '--poll-interval', type=int, default=60,
+            help='Seconds between checks for new and changed borrow records'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Keep a min-heap of (due_date, record id) for active records due
+        within the horizon and sleep until the earliest one.
+
+        New borrows, renewals and due dates edited on existing records are
+        picked up by polling for active records updated since the previous
+        poll, through the partial index on their update time, so a changed
+        due date is seen within one poll interval. Returns need no
+        notification: when an entry fires, the UPDATE only matches records
+        that are still active and due. The in-memory window is reloaded
+        halfway through the horizon from the partial index on active due
+        dates.
+        """
+        self.start(
+            timezone.now(),
+            horizon=timedelta(hours=options['horizon']),
+            poll_interval=timedelta(seconds=options['poll_interval'])
+        )
+        self.stdout.write(f'Scheduler started with {len(self.scheduled)} upcoming due dates')
+
+        try:
+            while True:
+                close_old_connections()
+                wake_at = self.run_due(timezone.now())
+                time.sleep(max((wake_at - timezone.now()).total_seconds(), 0))
+        except KeyboardInterrupt:
+            self.stdout.write('Scheduler stopped')
+
+    def start(self, now, horizon, poll_interval):
+        self.horizon = horizon
+        self.poll_interval = poll_interval
+        self.heap = []
+        self.scheduled = {}
+        # The window below holds everything active up to now
+        self.polled_at = now
+        self.load_window(now)
+        self.next_reload = now + self.horizon / 2
+        self.next_poll = now + self.poll_interval
+
+    def run_due(self, now):
+        """Reload, poll and mark what is due at `now`; returns when to wake up next"""
+        if now >= self.next_reload:
+            self.load_window(now)
+            self.next_reload = now + self.horizon / 2
+        if now >= self.next_poll:
+            self.poll_changes(now)
+            self.next_poll = now + self.poll_interval
+
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            due_date, pk = heapq.heappop(self.heap)
+            # Skip entries superseded by a later push for the same record
+            if self.scheduled.get(pk) == due_date:
+                del self.scheduled[pk]
+                expired.append(pk)
+        if expired:
+            self.mark_overdue(expired, now)
+
+        wake_at = min(self.next_reload, self.next_poll)
+        if self.heap:
+            wake_at = min(wake_at, self.heap[0][0])
+        return wake_at
+
+    def schedule(self, pk, due_date, now):
+        if due_date >= now + self.horizon:
+            # Renewed beyond the window; the reload that reaches it schedules it
+            self.scheduled.pop(pk, None)
+        elif self.scheduled.get(pk) != due_date:
+            self.scheduled[pk] = due_date
+            heapq.heappush(self.heap, (due_date, pk))
+
+    def load_window(self, now):
+        """(Re)load active records due within the horizon"""
+        records = BorrowRecord.objects.filter(
+            status=BorrowRecord.Status.ACTIVE,
+            due_date__lt=now + self.horizon
+        ).values_list('pk', 'due_date')
+        for pk, due_date in records.iterator(chunk_size=2000):
+            self.schedule(pk, due_date, now)
+
+    def poll_changes(self, now):
+        """Schedule records borrowed, renewed or edited since the last poll"""
+        records = BorrowRecord.objects.filter(
+            status=BorrowRecord.Status.ACTIVE,
+            updated__gte=self.polled_at - self.CHANGE_OVERLAP
+        ).values_list('pk', 'due_date')
+        self.polled_at = now
+        for pk, due_date in records.iterator(chunk_size=2000):
+            self.schedule(pk, due_date, now)
+
+    def mark_overdue(self, pks, now):
+        marked = 0
+        for start in range(0, len(pks), self.CHUNK_SIZE):
+            chunk = pks[start:start + self.CHUNK_SIZE]
+            updated = services.mark_overdue(
+                BorrowRecord.objects.filter(pk__in=chunk, due_date__lte=now), now
+            )
+            marked += updated
+            if updated < len(chunk):
+                # Returned records are done; renewed ones are due later
+                renewed = BorrowRecord.objects.filter(
+                    pk__in=chunk,
+                    status=BorrowRecord.Status.ACTIVE,
+                    due_date__gt=now
+                ).values_list('pk', 'due_date')
+                for pk, due_date in renewed:
+                    self.schedule(pk, due_date, now)
+
+        if marked:
+            self.stdout.write(
+                self.style.SUCCESS(f'{now:%Y-%m-%d %H:%M:%S} marked {marked} borrow records overdue')
+            )
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from circulation import services
+from circulation.models import Hold
+
+class Command(BaseCommand):
+    help = 'Expire uncollected ready holds and pass their copies to the next patrons'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of holds expired per transaction'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the holds that would expire'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        now = timezone.now()
+
+        if options['dry_run']:
+            count = Hold.objects.filter(status=Hold.Status.READY, expires_at__lte=now).count()
+            self.stdout.write(
+                f'{count} holds would expire ({time.monotonic() - started:.3f}s)'
+            )
+            return
+
+        count = 0
+        batches = 0
+        while True:
+            expired = services.expire_holds(now, limit=options['batch_size'])
+            if not expired:
+                break
+            count += expired
+            batches += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully expired {count} holds in {batches} batches ({elapsed:.3f}s)'
+            )
+        )
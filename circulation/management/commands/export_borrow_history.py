@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from circulation import exports
+from circulation.models import BorrowRecord
+
+class Command(BaseCommand):
+    help = 'Export the borrow history as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--from', dest='date_from', help='Only records borrowed on or after this date')
+        parser.add_argument('--to', dest='date_to', help='Only records borrowed on or before this date')
+        parser.add_argument(
+            '--status', action='append', choices=BorrowRecord.Status.values,
+            help='Only records with this status (repeatable)'
+        )
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=exports.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name, end in [('date_from', False), ('date_to', True)]:
+            if options[name]:
+                bounds[name] = exports.parse_bound(options[name], end=end)
+                if bounds[name] is None:
+                    raise CommandError(f'Invalid date: {options[name]}')
+
+        queryset = exports.history_queryset(statuses=options['status'], **bounds)
+        chunks = exports.iter_export(queryset, options['format'], options['chunk_size'])
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        count = 0
+        try:
+            for chunk in chunks:
+                # Chunks end with their own newline, which OutputWrapper keeps
+                output.write(chunk)
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['format'] == 'csv':
+            count -= 1  # header row
+        self.stderr.write(
+            self.style.SUCCESS(f'Successfully exported {count} borrow records')
+        )
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from circulation.models import BorrowRecord
+from users.models import Profile
+
+class Command(BaseCommand):
+    help = 'Recount open loans per borrower and repair drifted Profile loan counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the profiles whose counters have drifted'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # One grouped query for the true counts of every borrower with open loans
+            actual = {
+                borrower: (books, bundles)
+                for borrower, books, bundles in BorrowRecord.objects.filter(
+                    status__in=BorrowRecord.ON_LOAN
+                ).values_list('borrower').annotate(
+                    books=Count('id', filter=Q(book__isnull=False)),
+                    bundles=Count('id', filter=Q(bundle__isnull=False))
+                ).order_by()
+            }
+
+            # Profiles with a nonzero counter or an open loan are the only
+            # ones that can disagree
+            candidates = Profile.objects.select_for_update().filter(
+                Q(active_book_loans__gt=0) | Q(active_bundle_loans__gt=0) | Q(pk__in=actual)
+            ).only('active_book_loans', 'active_bundle_loans')
+
+            drifted = []
+            for profile in candidates:
+                books, bundles = actual.get(profile.pk, (0, 0))
+                if (profile.active_book_loans, profile.active_bundle_loans) != (books, bundles):
+                    self.stdout.write(
+                        f'Profile {profile.pk}: books {profile.active_book_loans} -> {books}, '
+                        f'bundles {profile.active_bundle_loans} -> {bundles}'
+                    )
+                    profile.active_book_loans = books
+                    profile.active_bundle_loans = bundles
+                    drifted.append(profile)
+
+            if options['dry_run']:
+                self.stdout.write(f'{len(drifted)} profiles have drifted loan counters')
+                return
+
+            Profile.objects.bulk_update(
+                drifted, ['active_book_loans', 'active_bundle_loans'], batch_size=500
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully reconciled {len(drifted)} profiles')
+        )
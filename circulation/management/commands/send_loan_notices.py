@@ -0,0 +1,52 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from circulation import notices
+
+class Command(BaseCommand):
+    help = 'Email each borrower one digest of their overdue loans and loans due soon'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=3,
+            help='Remind borrowers of loans due within this many days'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=notices.DEFAULT_CHUNK_SIZE,
+            help='Number of emails handed to the mail backend at a time'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the digests that would be sent'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        now = timezone.now()
+        digests = notices.pending_digests(now, options['days'])
+
+        if options['dry_run']:
+            count = loans = 0
+            for digest in digests:
+                count += 1
+                loans += len(digest.overdue) + len(digest.due_soon)
+            self.stdout.write(
+                f'{count} digests covering {loans} loans would be sent '
+                f'({time.monotonic() - started:.3f}s)'
+            )
+            return
+
+        sent, loans, skipped = notices.send_digests(
+            digests, now, get_connection(), chunk_size=options['chunk_size']
+        )
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} borrowers without an email address'))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully sent {sent} digests covering {loans} loans ({elapsed:.3f}s)'
+            )
+        )
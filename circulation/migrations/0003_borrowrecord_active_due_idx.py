@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bundles", "0002_alter_bundle_status"),
+        ("circulation", "0002_borrowrecord"),
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(
+                condition=models.Q(("status", "ACT")),
+                fields=["due_date"],
+                name="circulation_active_due_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_bookprofile_fts"),
+        ("bundles", "0002_alter_bundle_status"),
+        ("circulation", "0003_borrowrecord_active_due_idx"),
+        ("users", "0002_profile_loan_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CirculationEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("BOR", "Borrowed"),
+                            ("RET", "Returned"),
+                            ("REN", "Renewed"),
+                            ("OVD", "Overdue"),
+                            ("LOS", "Lost"),
+                            ("WOF", "Written off"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(default=django.utils.timezone.now)),
+                ("notes", models.TextField(blank=True)),
+                (
+                    "actor",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "bundle",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="bundles.bundle",
+                    ),
+                ),
+                (
+                    "profile",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="users.profile",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["timestamp", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["timestamp"], name="circulation_timesta_7e8a55_idx"
+                    ),
+                    models.Index(
+                        fields=["book", "timestamp"],
+                        name="circulation_book_id_1f3d87_idx",
+                    ),
+                    models.Index(
+                        fields=["bundle", "timestamp"],
+                        name="circulation_bundle__35e1ba_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_bookprofile_fts"),
+        ("circulation", "0004_circulationevent"),
+        ("users", "0002_profile_loan_counters"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="circulationevent",
+            name="event_type",
+            field=models.CharField(
+                choices=[
+                    ("BOR", "Borrowed"),
+                    ("RET", "Returned"),
+                    ("REN", "Renewed"),
+                    ("OVD", "Overdue"),
+                    ("LOS", "Lost"),
+                    ("WOF", "Written off"),
+                    ("HRD", "Set aside for hold"),
+                    ("HCN", "Hold cancelled"),
+                    ("HEX", "Hold expired"),
+                ],
+                max_length=3,
+            ),
+        ),
+        migrations.CreateModel(
+            name="Hold",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("WAI", "Waiting"),
+                            ("RDY", "Ready for pickup"),
+                            ("FUL", "Fulfilled"),
+                            ("CAN", "Cancelled"),
+                            ("EXP", "Expired"),
+                        ],
+                        default="WAI",
+                        max_length=3,
+                    ),
+                ),
+                ("placed_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("ready_at", models.DateTimeField(blank=True, null=True)),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+                ("closed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="holds",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "book_profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="holds",
+                        to="books.bookprofile",
+                    ),
+                ),
+                (
+                    "patron",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="holds",
+                        to="users.profile",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["placed_at", "id"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "WAI")),
+                        fields=["book_profile", "placed_at", "id"],
+                        name="circulation_hold_queue_idx",
+                    ),
+                    models.Index(
+                        condition=models.Q(("status", "RDY")),
+                        fields=["expires_at"],
+                        name="circulation_hold_expiry_idx",
+                    ),
+                    models.Index(
+                        fields=["patron", "status"],
+                        name="circulation_patron__52d734_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("status__in", ["WAI", "RDY"])),
+                        fields=("book_profile", "patron"),
+                        name="circulation_one_open_hold_per_title",
+                    )
+                ],
+            },
+        ),
+    ]
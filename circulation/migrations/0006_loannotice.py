@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_bookprofile_available_copies"),
+        ("bundles", "0002_alter_bundle_status"),
+        ("circulation", "0005_hold"),
+        ("users", "0002_profile_loan_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LoanNotice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("REM", "Due date reminder"),
+                            ("OVD", "Overdue notice"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                ("due_date", models.DateTimeField()),
+                ("sent_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["-sent_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(
+                condition=models.Q(("status__in", ["ACT", "OVD"])),
+                fields=["due_date"],
+                name="circulation_on_loan_due_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="loannotice",
+            name="record",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notices",
+                to="circulation.borrowrecord",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="loannotice",
+            constraint=models.UniqueConstraint(
+                fields=("record", "due_date", "kind"),
+                name="circulation_one_notice_per_due_date",
+            ),
+        ),
+    ]
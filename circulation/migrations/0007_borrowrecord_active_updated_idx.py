@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_bookprofile_available_copies"),
+        ("bundles", "0002_alter_bundle_status"),
+        ("circulation", "0006_loannotice"),
+        ("users", "0002_profile_loan_counters"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(
+                condition=models.Q(("status", "ACT")),
+                fields=["updated"],
+                name="circulation_active_updated_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("circulation", "0007_borrowrecord_active_updated_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="circulationevent",
+            name="event_type",
+            field=models.CharField(
+                choices=[
+                    ("BOR", "Borrowed"),
+                    ("RET", "Returned"),
+                    ("REN", "Renewed"),
+                    ("OVD", "Overdue"),
+                    ("LOS", "Lost"),
+                    ("WOF", "Written off"),
+                    ("HRD", "Set aside for hold"),
+                    ("HCN", "Hold cancelled"),
+                    ("HEX", "Hold expired"),
+                    ("STS", "Status changed"),
+                ],
+                max_length=3,
+            ),
+        ),
+    ]
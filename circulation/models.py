@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from books.models import Book
+from books.models import Book, BookProfile
 from bundles.models import Bundle
 from users.models import Profile
 
@@ -121,6 +121,9 @@ class BorrowRecord(models.Model):
         OVERDUE = 'OVD', 'Overdue'
         LOST = 'LOS', 'Lost'
     
+    # Statuses of records whose item is still out with the borrower
+    ON_LOAN = [Status.ACTIVE, Status.OVERDUE]
+    
     borrower = models.ForeignKey(
         Profile,
         on_delete=models.PROTECT,
@@ -163,55 +166,292 @@ class BorrowRecord(models.Model):
             models.Index(fields=['borrower', 'status']),
             models.Index(fields=['book', 'status']),
             models.Index(fields=['bundle', 'status']),
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(status='ACT'),
+                name='circulation_active_due_idx'
+            ),
+            # Due-date reminders and overdue notices (circulation.notices)
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(status__in=['ACT', 'OVD']),
+                name='circulation_on_loan_due_idx'
+            ),
+            # Borrows and due date changes polled by circulation_scheduler
+            models.Index(
+                fields=['updated'],
+                condition=models.Q(status='ACT'),
+                name='circulation_active_updated_idx'
+            ),
         ]
     
     def clean(self):
         """Validate that either book or bundle is set, but not both"""
-        if not self.book and not self.bundle:
+        if not self.book_id and not self.bundle_id:
             raise ValidationError("Either book or bundle must be specified")
-        if self.book and self.bundle:
+        if self.book_id and self.bundle_id:
             raise ValidationError("Cannot borrow both book and bundle")
     
+    def adjust_borrower_loans(self, amount):
+        """Add amount to the borrower's counter for this record's kind of item"""
+        if self.bundle_id:
+            Profile.adjust_loan_counters(self.borrower_id, bundles=amount)
+        else:
+            Profile.adjust_loan_counters(self.borrower_id, books=amount)
+    
     def save(self, *args, **kwargs):
+        # Loans made through circulation.services never get here; this
+        # keeps records created directly (admin, shell, fixtures) consistent
         self.clean()
+        adding = self._state.adding
         super().save(*args, **kwargs)
-        
-        # Update book/bundle status
-        if self.status == self.Status.ACTIVE:
-            if self.book:
-                self.book.status = Book.Status.BORROWED
-                self.book.save()
-            if self.bundle:
-                self.bundle.status = Bundle.Status.BORROWED
-                self.bundle.save()
+        if adding and self.status in self.ON_LOAN:
+            self.adjust_borrower_loans(1)
+            CirculationEvent.objects.create(
+                event_type=CirculationEvent.Type.BORROW,
+                timestamp=self.borrowed_date,
+                book_id=self.book_id,
+                bundle_id=self.bundle_id,
+                profile_id=self.borrower_id,
+                notes=self.notes
+            )
+            # Only the item's status column is written, without a full save
+            if self.book_id:
+                Book.objects.filter(pk=self.book_id).update(
+                    status=Book.Status.BORROWED, last_updated=timezone.now()
+                )
+                BookProfile.refresh_availability([self.book_id])
+            if self.bundle_id:
+                Bundle.objects.filter(pk=self.bundle_id).update(
+                    status=Bundle.Status.BORROWED, last_updated=timezone.now()
+                )
     
     def mark_as_returned(self):
         """Mark the record as returned and update related objects"""
-        self.status = self.Status.RETURNED
-        self.returned_date = timezone.now()
-        
-        if self.book:
-            self.book.status = Book.Status.NORMAL
-            self.book.save()
-        if self.bundle:
-            self.bundle.status = Bundle.Status.NORMAL
-            self.bundle.save()
-        
-        self.save()
+        from .services import return_record
+        return_record(self)
     
     def mark_as_lost(self):
         """Mark the record as lost and update related objects"""
-        self.status = self.Status.LOST
-        
-        if self.book:
-            self.book.status = Book.Status.LOST
-            self.book.save()
-        if self.bundle:
-            self.bundle.status = Bundle.Status.LOST
-            self.bundle.save()
-        
-        self.save()
+        from .services import lose_record
+        lose_record(self)
     
     def __str__(self):
         item = self.book.nl_code if self.book else f"Bundle {self.bundle.bundle_id}"
         return f"{self.borrower.user.username} - {item} ({self.get_status_display()})"
+
+
+class Hold(models.Model):
+    """
+    A patron's place in the queue for any copy of a title.
+
+    Waiting holds are served in placed_at order. When a copy comes back it
+    is set aside (Book.Status.BOOKED) for the first waiting hold, which
+    becomes ready until it is collected, cancelled or expires.
+    """
+    class Status(models.TextChoices):
+        WAITING = 'WAI', 'Waiting'
+        READY = 'RDY', 'Ready for pickup'
+        FULFILLED = 'FUL', 'Fulfilled'
+        CANCELLED = 'CAN', 'Cancelled'
+        EXPIRED = 'EXP', 'Expired'
+    
+    # Statuses of holds still in the queue or waiting on the pickup shelf
+    OPEN = [Status.WAITING, Status.READY]
+    
+    book_profile = models.ForeignKey(
+        BookProfile,
+        on_delete=models.PROTECT,
+        related_name='holds'
+    )
+    patron = models.ForeignKey(
+        Profile,
+        on_delete=models.PROTECT,
+        related_name='holds'
+    )
+    status = models.CharField(
+        max_length=3,
+        choices=Status.choices,
+        default=Status.WAITING
+    )
+    # The copy set aside for a ready hold
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='holds'
+    )
+    
+    placed_at = models.DateTimeField(default=timezone.now)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['placed_at', 'id']
+        indexes = [
+            # Head of each title's queue is the first entry of this index
+            models.Index(
+                fields=['book_profile', 'placed_at', 'id'],
+                condition=models.Q(status='WAI'),
+                name='circulation_hold_queue_idx'
+            ),
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='RDY'),
+                name='circulation_hold_expiry_idx'
+            ),
+            models.Index(fields=['patron', 'status']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book_profile', 'patron'],
+                condition=models.Q(status__in=['WAI', 'RDY']),
+                name='circulation_one_open_hold_per_title'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.patron} - {self.book_profile} ({self.get_status_display()})"
+
+
+class LoanNotice(models.Model):
+    """
+    A reminder or overdue notice sent for a loan.
+
+    Notices are keyed on the loan's due date, so reruns of
+    send_loan_notices skip loans already told about and a renewed loan
+    gets a fresh reminder for its new due date.
+    """
+    class Kind(models.TextChoices):
+        REMINDER = 'REM', 'Due date reminder'
+        OVERDUE = 'OVD', 'Overdue notice'
+    
+    record = models.ForeignKey(
+        BorrowRecord,
+        on_delete=models.CASCADE,
+        related_name='notices'
+    )
+    kind = models.CharField(max_length=3, choices=Kind.choices)
+    due_date = models.DateTimeField()
+    sent_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-sent_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['record', 'due_date', 'kind'],
+                name='circulation_one_notice_per_due_date'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.record_id} ({self.due_date:%Y-%m-%d})"
+
+
+class CirculationEventQuerySet(models.QuerySet):
+    def between(self, start, end):
+        """Events in [start, end), oldest first; served by the timestamp index"""
+        return self.filter(timestamp__gte=start, timestamp__lt=end).order_by('timestamp', 'id')
+
+    def for_book(self, book_id):
+        return self.filter(book_id=book_id).order_by('timestamp', 'id')
+
+    def for_bundle(self, bundle_id):
+        return self.filter(bundle_id=bundle_id).order_by('timestamp', 'id')
+
+
+class CirculationEvent(models.Model):
+    """
+    Append-only log of circulation state changes.
+
+    Rows are written in the same transaction as the change they describe
+    and never updated. References are plain ids without database
+    constraints, so deleting a book, bundle, profile or user never touches
+    the log and history and analytics queries stay off BorrowRecord.
+
+    Copy status changes made outside circulation.services (joining or
+    leaving a bundle, edits in the admin or the API) are logged as
+    STATUS_CHANGED with the old and new status in the notes, so the log
+    holds the full history of Book.status.
+    """
+    class Type(models.TextChoices):
+        BORROW = 'BOR', 'Borrowed'
+        RETURN = 'RET', 'Returned'
+        RENEW = 'REN', 'Renewed'
+        OVERDUE = 'OVD', 'Overdue'
+        LOST = 'LOS', 'Lost'
+        WRITE_OFF = 'WOF', 'Written off'
+        HOLD_READY = 'HRD', 'Set aside for hold'
+        HOLD_CANCELLED = 'HCN', 'Hold cancelled'
+        HOLD_EXPIRED = 'HEX', 'Hold expired'
+        STATUS_CHANGED = 'STS', 'Status changed'
+    
+    event_type = models.CharField(max_length=3, choices=Type.choices)
+    timestamp = models.DateTimeField(default=timezone.now)
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    bundle = models.ForeignKey(
+        Bundle,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    profile = models.ForeignKey(
+        Profile,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    notes = models.TextField(blank=True)
+    
+    objects = CirculationEventQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['timestamp', 'id']
+        indexes = [
+            models.Index(fields=['timestamp']),
+            models.Index(fields=['book', 'timestamp']),
+            models.Index(fields=['bundle', 'timestamp']),
+        ]
+    
+    @classmethod
+    def status_change(cls, book_id, previous, current, timestamp=None):
+        """An unsaved STATUS_CHANGED event for a copy, noting both statuses"""
+        return cls(
+            event_type=cls.Type.STATUS_CHANGED,
+            timestamp=timestamp or timezone.now(),
+            book_id=book_id,
+            notes=f"{Book.Status(previous).label} -> {Book.Status(current).label}"
+        )
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Circulation events cannot be changed")
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Circulation events cannot be deleted")
+    
+    def __str__(self):
+        item = f"book {self.book_id}" if self.book_id else f"bundle {self.bundle_id}"
+        return f"{self.get_event_type_display()} {item} at {self.timestamp:%Y-%m-%d %H:%M}"
@@ -0,0 +1,117 @@
+"""
+Due-date reminders and overdue notices, one digest email per borrower.
+
+Open loans due within the reminder window are read with one query over
+the partial index on their due dates, ordered by borrower so digests are
+built while the rows stream in. Digests go out in chunks over a single
+mail connection; after each chunk the loans it covered are recorded as
+LoanNotices, which later runs skip.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+
+from django.core.mail import EmailMessage
+from django.db.models import Exists, OuterRef, Q
+
+from .models import BorrowRecord, LoanNotice
+
+DEFAULT_CHUNK_SIZE = 100
+
+Loan = namedtuple('Loan', ['record_id', 'title', 'code', 'due_date'])
+Digest = namedtuple('Digest', ['email', 'username', 'overdue', 'due_soon'])
+
+
+def pending_loans(now, days):
+    """
+    Open loans overdue or due within `days` that have no notice for their
+    current due date yet, as plain values ordered by borrower
+    """
+    def noticed(kind):
+        return Exists(LoanNotice.objects.filter(
+            record=OuterRef('pk'), due_date=OuterRef('due_date'), kind=kind
+        ))
+
+    return BorrowRecord.objects.filter(
+        status__in=BorrowRecord.ON_LOAN,
+        due_date__lt=now + timedelta(days=days)
+    ).filter(
+        Q(due_date__lt=now) & ~noticed(LoanNotice.Kind.OVERDUE)
+        | Q(due_date__gte=now) & ~noticed(LoanNotice.Kind.REMINDER)
+    ).order_by('borrower_id', 'due_date', 'pk').values_list(
+        'pk', 'borrower_id', 'borrower__user__email', 'borrower__user__username',
+        'due_date', 'book__profile__name', 'book__nl_code', 'bundle__name', 'bundle__bundle_id'
+    )
+
+
+def pending_digests(now, days):
+    """Group pending_loans() into one Digest per borrower"""
+    rows = pending_loans(now, days).iterator(chunk_size=2000)
+    for _, loans in groupby(rows, key=lambda row: row[1]):
+        overdue, due_soon = [], []
+        for pk, _, email, username, due_date, title, code, bundle_name, bundle_code in loans:
+            loan = Loan(pk, title or bundle_name, code or bundle_code, due_date)
+            (overdue if due_date < now else due_soon).append(loan)
+        yield Digest(email, username, overdue, due_soon)
+
+
+def build_message(digest, connection=None):
+    sections = []
+    if digest.overdue:
+        sections.append('These loans are overdue, please return them as soon as possible:')
+        sections.extend(_loan_lines(digest.overdue))
+    if digest.due_soon:
+        if sections:
+            sections.append('')
+        sections.append('These loans are due soon:')
+        sections.extend(_loan_lines(digest.due_soon))
+    count = len(digest.overdue) + len(digest.due_soon)
+    subject = (
+        f'{count} overdue or due library loans' if digest.overdue
+        else f'{count} library loans due soon'
+    )
+    body = '\n'.join([f'Hello {digest.username},', ''] + sections)
+    return EmailMessage(subject, body, to=[digest.email], connection=connection)
+
+
+def send_digests(digests, now, connection, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Send the digests over `connection` and record their notices.
+
+    Borrowers without an email address are skipped and get no notice, so
+    they are picked up once they add one. Returns (sent, loans, skipped).
+    """
+    sent = loans = skipped = 0
+    messages, notices = [], []
+
+    def flush():
+        connection.send_messages(messages)
+        LoanNotice.objects.bulk_create(notices, ignore_conflicts=True)
+        messages.clear()
+        notices.clear()
+
+    with connection:
+        for digest in digests:
+            if not digest.email:
+                skipped += 1
+                continue
+            messages.append(build_message(digest, connection))
+            for kind, group in [
+                (LoanNotice.Kind.OVERDUE, digest.overdue),
+                (LoanNotice.Kind.REMINDER, digest.due_soon),
+            ]:
+                notices.extend(
+                    LoanNotice(record_id=loan.record_id, kind=kind, due_date=loan.due_date, sent_at=now)
+                    for loan in group
+                )
+            sent += 1
+            loans += len(digest.overdue) + len(digest.due_soon)
+            if len(messages) >= chunk_size:
+                flush()
+        if messages:
+            flush()
+    return sent, loans, skipped
+
+
+def _loan_lines(loans):
+    return [f'- {loan.title} ({loan.code}), due {loan.due_date:%Y-%m-%d}' for loan in loans]
@@ -0,0 +1,894 @@
+"""
+Circulation operations shared by the API, the staff views and the admin.
+
+Every state change is a conditional UPDATE (compare-and-swap on the
+current status) rather than a read followed by a full save(), so two
+desks acting on the same copy at the same time cannot both succeed. The
+UPDATE is atomic on every backend, including SQLite where
+select_for_update() is a no-op. Only the changed columns are written and
+no model save() runs, so no operation writes a row twice. Every change
+also appends a CirculationEvent and recounts BookProfile.available_copies
+for the copies it touched, in the same transaction.
+
+Query budget per operation, not counting transaction control
+(SAVEPOINT/RELEASE) and checked in circulation.tests:
+
+    borrow_book     5   reserve slot, claim copy, insert record, log, recount
+    borrow_any      6   reserve slot, pick copies, claim copy, insert record,
+                        log, recount
+    return_book     7   find record, close record, release slot, check holds,
+                        release item, log, recount
+    return_record   6   close record, release slot, check holds, release item,
+                        log, recount
+    mark_lost       6   mark copy, find record, close record, release slot,
+                        log, recount
+    lose_record     5   close record, mark item, release slot, log, recount
+    renew_loan      4   find record, extend due date, touch copy, log
+    write_off       3   mark copy, log, recount
+
+"check holds" looks up the head of the title's hold queue with one
+indexed query; when someone is waiting, handing the copy to them costs one
+more UPDATE and the copy is BOOKED instead of back on the shelf.
+Collecting a ready hold costs two statements more than a plain checkout.
+borrow_any tries one more copy for each that another desk took first.
+The limit is read from the borrower's Entitlement row; a checkout refused
+on an ended entitlement refreshes it and reserves once more.
+
+return_records(), lose_records() and mark_overdue() handle any number of
+selected records with one read, at most four UPDATEs (records, books,
+bundles, loan counters), one batched insert into the log and one recount.
+
+Failed operations may spend one extra query to explain the failure.
+process_batch() handles a whole list of operations with one conditional
+UPDATE per kind of status change (per SWAP_CHUNK_SIZE rows), however many
+operations it holds.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+
+from books.models import Book, BookProfile
+from books.signals import catalog_changed
+from bundles.models import Bundle
+from subscriptions.models import Entitlement
+from users.models import Profile
+from .models import BorrowRecord, CirculationEvent, Hold
+
+LOAN_PERIOD = timedelta(days=30)
+# How long a copy set aside for a hold waits on the pickup shelf
+HOLD_PICKUP_PERIOD = timedelta(days=3)
+# Holds a patron may have waiting or ready at once
+MAX_OPEN_HOLDS = 5
+# Free copies borrow_any reads at once; more than enough unless many desks
+# race for the same title
+CHECKOUT_ANY_CANDIDATES = 10
+# Rows per conditional UPDATE in process_batch(); each row adds parameters
+SWAP_CHUNK_SIZE = 100
+
+
+class CirculationError(Exception):
+    """A circulation operation was refused; the message is user-facing"""
+
+
+def borrow_book(book_id, borrower, notes='', actor=None):
+    """
+    Lend a copy to a borrower and return the new BorrowRecord.
+
+    Raises CirculationError if the borrower is at their limit or the copy
+    is missing or not available, in which case nothing is written (a
+    reserved loan slot is rolled back with the transaction).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        _reserve_slot(borrower)
+        if not _claim(book_id, borrower, now):
+            raise _refusal(book_id, 'Book is not available for borrowing. Current status: {status}')
+        return _lend(book_id, borrower, notes, actor, now)
+
+
+def borrow_any(book_profile_id, borrower, notes='', actor=None):
+    """
+    Lend any free copy of a title and return the new BorrowRecord.
+
+    A copy set aside for the borrower's own hold is taken first. Copies
+    another desk claims between the pick and the claim are skipped.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        _reserve_slot(borrower)
+        own_hold = Hold.objects.filter(book=OuterRef('pk'), patron=borrower, status=Hold.Status.READY)
+        candidates = Book.objects.annotate(has_own_hold=Exists(own_hold)).filter(
+            Q(status=Book.Status.NORMAL) | Q(status=Book.Status.BOOKED, has_own_hold=True),
+            profile_id=book_profile_id
+        ).order_by(
+            Case(When(status=Book.Status.BOOKED, then=Value(0)), default=Value(1)), 'pk'
+        ).values_list('pk', flat=True)[:CHECKOUT_ANY_CANDIDATES]
+        for book_id in candidates:
+            if _claim(book_id, borrower, now):
+                return _lend(book_id, borrower, notes, actor, now)
+        raise CirculationError('No copy of this title is available for borrowing')
+
+
+def return_book(book_id, notes='', actor=None):
+    """Close the open loan of a copy as returned and return its record"""
+    with transaction.atomic():
+        record = _open_record(book_id)
+        return return_record(record, notes=notes, actor=actor)
+
+
+def return_record(record, notes='', actor=None):
+    """
+    Close an open borrow record as returned and put its item back on the
+    shelf. Return notes are kept on the RETURN event.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        _close(record, BorrowRecord.Status.RETURNED, now, returned_date=now)
+        events = [_event(CirculationEvent.Type.RETURN, record, now, actor, notes)]
+        booked = False
+        if record.book_id:
+            # Hand the copy straight to the first patron waiting for the title
+            booked, hold_events = _set_aside_copy(record.book_id, now)
+            events += hold_events
+        if not booked:
+            _set_item_status(record, Book.Status.NORMAL, Bundle.Status.NORMAL, now)
+        _log(events)
+        _copies_changed([record.book_id] if record.book_id else [])
+    return record
+
+
+def mark_lost(book_id, actor=None):
+    """
+    Mark a copy as lost, closing its open loan if it has one.
+
+    Returns the closed BorrowRecord, or None if the copy was on the shelf.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        marked = Book.objects.filter(
+            pk=book_id,
+            status__in=[Book.Status.BORROWED, Book.Status.NORMAL]
+        ).update(status=Book.Status.LOST, last_updated=now)
+        if not marked:
+            raise _refusal(book_id, 'Cannot mark book as lost with status: {status}')
+
+        record = BorrowRecord.objects.filter(
+            book_id=book_id,
+            status__in=BorrowRecord.ON_LOAN
+        ).first()
+        if record is not None:
+            _close(record, BorrowRecord.Status.LOST, now)
+            _log([_event(CirculationEvent.Type.LOST, record, now, actor)])
+        else:
+            _log([CirculationEvent(
+                event_type=CirculationEvent.Type.LOST, book_id=book_id, timestamp=now, actor=actor
+            )])
+        _copies_changed([book_id])
+    return record
+
+
+def lose_record(record, actor=None):
+    """Close an open borrow record as lost, marking its item lost as well"""
+    now = timezone.now()
+    with transaction.atomic():
+        _close(record, BorrowRecord.Status.LOST, now)
+        _set_item_status(record, Book.Status.LOST, Bundle.Status.LOST, now)
+        _log([_event(CirculationEvent.Type.LOST, record, now, actor)])
+        _copies_changed([record.book_id] if record.book_id else [])
+    return record
+
+
+def renew_loan(book_id, period=LOAN_PERIOD, actor=None):
+    """
+    Extend the open loan of a copy to `period` from now and return its record.
+
+    An overdue loan becomes active again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        record = _open_record(book_id)
+        due_date = now + period
+        renewed = BorrowRecord.objects.filter(
+            pk=record.pk,
+            status__in=BorrowRecord.ON_LOAN
+        ).update(status=BorrowRecord.Status.ACTIVE, due_date=due_date, updated=now)
+        if not renewed:
+            raise CirculationError('No active borrow record found for this book')
+        # The catalog shows the current due date of a copy on loan
+        Book.objects.filter(pk=book_id).update(last_updated=now)
+        _log([_event(CirculationEvent.Type.RENEW, record, now, actor)])
+        _copies_changed([])
+    record.status = BorrowRecord.Status.ACTIVE
+    record.due_date = due_date
+    record.updated = now
+    return record
+
+
+def write_off(book_id, actor=None):
+    """Write off a copy that is on the shelf"""
+    now = timezone.now()
+    with transaction.atomic():
+        written_off = Book.objects.filter(
+            pk=book_id,
+            status=Book.Status.NORMAL
+        ).update(status=Book.Status.WRITTEN_OFF, last_updated=now)
+        if not written_off:
+            raise _refusal(book_id, 'Cannot write off book with status: {status}')
+        _log([CirculationEvent(
+            event_type=CirculationEvent.Type.WRITE_OFF, book_id=book_id, timestamp=now, actor=actor
+        )])
+        _copies_changed([book_id])
+
+
+def place_hold(book_profile_id, patron):
+    """
+    Join the hold queue for a title and return the new Hold.
+
+    Holds are for titles with no copy on the shelf; such a copy is
+    borrowed instead. The hold waits for the next return, which sets the
+    copy aside for it. The patron must be entitled to borrow books and may
+    have at most MAX_OPEN_HOLDS open holds.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # As in _reserve_slot, an ended entitlement may have a successor
+        entitled = patron.borrow_limit or (
+            Entitlement.objects.expired().filter(user_id=patron.user_id).refresh()
+            and patron.borrow_limit
+        )
+        if not entitled:
+            raise CirculationError('User has no active plan for borrowing books')
+        if Hold.objects.filter(patron=patron, status__in=Hold.OPEN).count() >= MAX_OPEN_HOLDS:
+            raise CirculationError(f'User already has {MAX_OPEN_HOLDS} open holds')
+        if Book.objects.filter(profile_id=book_profile_id, status=Book.Status.NORMAL).exists():
+            raise CirculationError('A copy of this title is on the shelf; borrow it instead')
+
+        hold = Hold(book_profile_id=book_profile_id, patron=patron, placed_at=now)
+        try:
+            with transaction.atomic():
+                hold.save()
+        except IntegrityError:
+            raise CirculationError('User already has an open hold on this title')
+    return hold
+
+
+def cancel_hold(hold, actor=None):
+    """
+    Cancel an open hold. A copy set aside for it goes to the next patron
+    in the queue, or back on the shelf.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        cancelled = Hold.objects.filter(
+            pk=hold.pk,
+            status__in=Hold.OPEN
+        ).update(status=Hold.Status.CANCELLED, closed_at=now)
+        if not cancelled:
+            raise CirculationError(f'Hold is already {hold.get_status_display().lower()}')
+        if hold.status == Hold.Status.READY and hold.book_id:
+            events = [_hold_event(CirculationEvent.Type.HOLD_CANCELLED, hold.book_id, hold.patron_id, now, actor)]
+            events += _pass_on_copies([(hold.book_id, hold.book_profile_id)], now)
+            _log(events)
+            _copies_changed([hold.book_id])
+    hold.status = Hold.Status.CANCELLED
+    hold.closed_at = now
+    return hold
+
+
+def expire_holds(now=None, limit=None):
+    """
+    Expire ready holds whose pickup period has passed, passing their copies
+    on, and return how many expired.
+
+    Set-based: one read of the expired holds, one UPDATE for them and the
+    same queue hand-over as cancel_hold() for all their copies together.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Served by the partial index on expires_at for ready holds
+        expired = Hold.objects.filter(
+            status=Hold.Status.READY,
+            expires_at__lte=now
+        ).order_by('expires_at').select_for_update().values_list(
+            'pk', 'book_id', 'book_profile_id', 'patron_id'
+        )
+        if limit:
+            expired = expired[:limit]
+        expired = list(expired)
+        if not expired:
+            return 0
+
+        Hold.objects.filter(
+            pk__in=[pk for pk, _, _, _ in expired],
+            status=Hold.Status.READY
+        ).update(status=Hold.Status.EXPIRED, closed_at=now)
+        events = [
+            _hold_event(CirculationEvent.Type.HOLD_EXPIRED, book_id, patron_id, now)
+            for _, book_id, _, patron_id in expired
+        ]
+        events += _pass_on_copies(
+            [(book_id, profile_id) for _, book_id, profile_id, _ in expired], now
+        )
+        _log(events)
+        _copies_changed([book_id for _, book_id, _, _ in expired])
+    return len(expired)
+
+
+def process_batch(operations, actor=None):
+    """
+    Apply validated borrow and return operations in order, in one transaction.
+
+    `operations` is a list of dicts with `action`, `book_id` and, for
+    borrows, `user_id`, plus optional `notes`. Books, open records,
+    borrowers and their limits are loaded with one query each for the whole
+    batch, and limits are checked against the borrowers' loan counters.
+    Operations are applied against that state, so a book returned earlier
+    in the batch can be borrowed again later in it. Returned copies go to
+    waiting holds first, and a patron can collect the copy set aside for
+    their hold. Returns one outcome dict per operation; a failing operation
+    does not stop the rest.
+
+    The changes are written like every other operation here: conditional
+    UPDATEs on the statuses that were read, and loan counters that only
+    grow while they stay within the limits. If another desk changed any of
+    the rows in the meantime, nothing is written and CirculationError asks
+    to retry the batch.
+    """
+    now = timezone.now()
+    book_ids = {op['book_id'] for op in operations}
+    user_ids = {op['user_id'] for op in operations if op['action'] == 'borrow'}
+    outcomes = []
+
+    with transaction.atomic():
+        books = Book.objects.in_bulk(book_ids)
+        open_records = {
+            record.book_id: record
+            for record in BorrowRecord.objects.filter(
+                book_id__in=book_ids, status__in=BorrowRecord.ON_LOAN
+            )
+        }
+        borrowers = {
+            profile.user_id: profile
+            for profile in Profile.objects.filter(user_id__in=user_ids)
+        }
+        active_counts = {
+            profile.pk: profile.active_book_loans for profile in borrowers.values()
+        }
+        # As in _reserve_slot, an ended entitlement may have a successor
+        if user_ids:
+            Entitlement.objects.expired().filter(user_id__in=user_ids).refresh()
+        limits = Profile.borrow_limits(user_ids)
+        loan_deltas = {}
+        ready_holds = {
+            hold.book_id: hold
+            for hold in Hold.objects.filter(book_id__in=book_ids, status=Hold.Status.READY)
+        }
+        # Statuses as read, which the writes below are conditional on
+        book_statuses = {pk: book.status for pk, book in books.items()}
+        record_statuses = {record.pk: record.status for record in open_records.values()}
+        hold_statuses = {hold.pk: hold.status for hold in ready_holds.values()}
+        returns_per_title = {}
+        for op in operations:
+            if op['action'] == 'return' and op['book_id'] in books:
+                profile_id = books[op['book_id']].profile_id
+                returns_per_title[profile_id] = returns_per_title.get(profile_id, 0) + 1
+        queues = _waiting_holds(returns_per_title)
+        for queue in queues.values():
+            hold_statuses.update((hold.pk, hold.status) for hold in queue)
+
+        events = []
+        new_records = []
+        changed_records = {}
+        changed_books = {}
+        changed_holds = {}
+
+        for op in operations:
+            book = books.get(op['book_id'])
+            notes = op.get('notes', '')
+            outcome = {'action': op['action'], 'book_id': op['book_id']}
+            outcomes.append(outcome)
+            error = None
+
+            if book is None:
+                error = 'Book not found'
+            elif op['action'] == 'borrow':
+                borrower = borrowers.get(op['user_id'])
+                hold = ready_holds.get(book.pk)
+                collecting = (
+                    borrower is not None and book.status == Book.Status.BOOKED
+                    and hold is not None and hold.patron_id == borrower.pk
+                )
+                if borrower is None:
+                    error = 'User profile not found'
+                elif book.status != Book.Status.NORMAL and not collecting:
+                    error = f'Book is not available for borrowing. Current status: {book.get_status_display()}'
+                elif active_counts[borrower.pk] >= limits[op['user_id']]:
+                    error = f'User has reached borrowing limit of {limits[op["user_id"]]} books'
+                else:
+                    record = BorrowRecord(
+                        book=book,
+                        borrower=borrower,
+                        borrowed_date=now,
+                        due_date=now + LOAN_PERIOD,
+                        notes=notes,
+                        status=BorrowRecord.Status.ACTIVE
+                    )
+                    new_records.append((outcome, record))
+                    events.append(_event(CirculationEvent.Type.BORROW, record, now, actor, notes))
+                    open_records[book.pk] = record
+                    active_counts[borrower.pk] += 1
+                    loan_deltas[borrower.pk] = loan_deltas.get(borrower.pk, 0) + 1
+                    book.status = Book.Status.BORROWED
+                    changed_books[book.pk] = book
+                    if collecting:
+                        hold.status = Hold.Status.FULFILLED
+                        hold.closed_at = now
+                        changed_holds[hold.pk] = hold
+                        del ready_holds[book.pk]
+            else:
+                record = open_records.pop(book.pk, None)
+                if record is None:
+                    error = 'No active borrow record found for this book'
+                else:
+                    record.status = BorrowRecord.Status.RETURNED
+                    record.returned_date = now
+                    events.append(_event(CirculationEvent.Type.RETURN, record, now, actor, notes))
+                    if record.pk:
+                        changed_records[record.pk] = record
+                    if record.borrower_id in active_counts:
+                        active_counts[record.borrower_id] -= 1
+                    loan_deltas[record.borrower_id] = loan_deltas.get(record.borrower_id, 0) - 1
+                    outcome['record'] = record
+                    book.status = Book.Status.NORMAL
+                    changed_books[book.pk] = book
+                    queue = queues.get(book.profile_id)
+                    if queue:
+                        hold = queue.pop(0)
+                        hold.status = Hold.Status.READY
+                        hold.book = book
+                        hold.ready_at = now
+                        hold.expires_at = now + HOLD_PICKUP_PERIOD
+                        changed_holds[hold.pk] = hold
+                        ready_holds[book.pk] = hold
+                        book.status = Book.Status.BOOKED
+                        events.append(_hold_event(CirculationEvent.Type.HOLD_READY, book.pk, hold.patron_id, now))
+
+            if error:
+                outcome.update(status='error', message=error)
+            else:
+                outcome['status'] = 'success'
+
+        _swap_statuses(Book, changed_books.values(), book_statuses, last_updated=now)
+        _swap_statuses(
+            BorrowRecord, changed_records.values(), record_statuses,
+            returned_date=now, updated=now
+        )
+        _swap_statuses(
+            Hold, changed_holds.values(), hold_statuses,
+            per_row=['book_id', 'ready_at', 'expires_at', 'closed_at']
+        )
+        BorrowRecord.objects.bulk_create([record for _, record in new_records])
+
+        _take_slots({pk: delta for pk, delta in loan_deltas.items() if delta > 0})
+        _adjust_loans(book_loans={pk: delta for pk, delta in loan_deltas.items() if delta < 0})
+        _log(events)
+        if changed_books:
+            _copies_changed(changed_books)
+
+    for outcome, record in new_records:
+        outcome['record'] = record
+    return outcomes
+
+
+def return_records(records, actor=None):
+    """
+    Close every open record in a queryset as returned, set-based.
+
+    Returns the ids of the records changed and of those skipped because
+    they were not on loan.
+    """
+    return _close_records(
+        records, BorrowRecord.Status.RETURNED, Book.Status.NORMAL, Bundle.Status.NORMAL,
+        CirculationEvent.Type.RETURN, actor
+    )
+
+
+def lose_records(records, actor=None):
+    """Close every open record in a queryset as lost, set-based, like return_records()"""
+    return _close_records(
+        records, BorrowRecord.Status.LOST, Book.Status.LOST, Bundle.Status.LOST,
+        CirculationEvent.Type.LOST, actor
+    )
+
+
+def mark_overdue(records, now=None):
+    """
+    Mark the active records of a queryset as overdue and log the change.
+
+    Returns the number of records marked. Meant for the overdue sweeps,
+    which pass the candidates one batch at a time.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        selected = list(records.filter(
+            status=BorrowRecord.Status.ACTIVE
+        ).select_for_update().values_list('pk', 'book_id', 'bundle_id', 'borrower_id'))
+        if not selected:
+            return 0
+        marked = BorrowRecord.objects.filter(
+            pk__in=[pk for pk, _, _, _ in selected],
+            status=BorrowRecord.Status.ACTIVE
+        ).update(status=BorrowRecord.Status.OVERDUE, updated=now)
+        _log([
+            CirculationEvent(
+                event_type=CirculationEvent.Type.OVERDUE, timestamp=now,
+                book_id=book_id, bundle_id=bundle_id, profile_id=borrower_id
+            )
+            for _, book_id, bundle_id, borrower_id in selected
+        ])
+    return marked
+
+
+def _close_records(records, status, book_status, bundle_status, event_type, actor):
+    """
+    One read of the selected records, then one UPDATE each for the records,
+    their books, their bundles and the borrowers' loan counters.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        selected = list(records.select_for_update().order_by().values_list(
+            'pk', 'status', 'book_id', 'bundle_id', 'borrower_id', 'book__profile_id'
+        ))
+        open_records = [row for row in selected if row[1] in BorrowRecord.ON_LOAN]
+        skipped = [row[0] for row in selected if row[1] not in BorrowRecord.ON_LOAN]
+        changed = [row[0] for row in open_records]
+        if not changed:
+            return changed, skipped
+
+        fields = {'returned_date': now} if status == BorrowRecord.Status.RETURNED else {}
+        closed = BorrowRecord.objects.filter(
+            pk__in=changed,
+            status__in=BorrowRecord.ON_LOAN
+        ).update(status=status, updated=now, **fields)
+        if closed != len(changed):
+            # Another desk closed some of them since they were read; the
+            # counter changes below would be wrong, so undo everything
+            raise CirculationError('Some records changed while being updated; please try again')
+
+        events = []
+        book_ids = [book_id for _, _, book_id, _, _, _ in open_records if book_id]
+        bundle_ids = [bundle_id for _, _, _, bundle_id, _, _ in open_records if bundle_id]
+        if book_ids and status == BorrowRecord.Status.RETURNED:
+            # Returned copies go to waiting holds first
+            booked, events = _set_aside_copies(
+                [(book_id, profile_id) for _, _, book_id, _, _, profile_id in open_records if book_id], now
+            )
+            book_ids = [book_id for book_id in book_ids if book_id not in booked]
+        if book_ids:
+            Book.objects.filter(pk__in=book_ids).update(status=book_status, last_updated=now)
+        if bundle_ids:
+            Bundle.objects.filter(pk__in=bundle_ids).update(status=bundle_status, last_updated=now)
+
+        book_loans = {}
+        bundle_loans = {}
+        for _, _, _, bundle_id, borrower_id, _ in open_records:
+            loans = bundle_loans if bundle_id else book_loans
+            loans[borrower_id] = loans.get(borrower_id, 0) - 1
+        _adjust_loans(book_loans, bundle_loans)
+        _log([
+            CirculationEvent(
+                event_type=event_type, timestamp=now, actor=actor,
+                book_id=book_id, bundle_id=bundle_id, profile_id=borrower_id
+            )
+            for _, _, book_id, bundle_id, borrower_id, _ in open_records
+        ] + events)
+        _copies_changed([book_id for _, _, book_id, _, _, _ in open_records if book_id])
+    return changed, skipped
+
+
+def _adjust_loans(book_loans=None, bundle_loans=None):
+    """
+    Move loan counters by per-profile amounts ({profile_id: delta}) in a
+    single UPDATE.
+    """
+    updates = {}
+    profile_ids = set()
+    for field, deltas in [('active_book_loans', book_loans), ('active_bundle_loans', bundle_loans)]:
+        deltas = {pk: delta for pk, delta in (deltas or {}).items() if delta}
+        if not deltas:
+            continue
+        profile_ids.update(deltas)
+        updates[field] = Greatest(
+            F(field) + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+                default=Value(0)
+            ),
+            0
+        )
+    if updates:
+        Profile.objects.filter(pk__in=profile_ids).update(**updates)
+
+
+def _swap_statuses(model, objects, read_statuses, per_row=(), **values):
+    """
+    Write the new status of each object, and its `per_row` fields, with one
+    conditional UPDATE per pair of (status as read, new status) and chunk.
+    `values` are written to every row. Raises CirculationError, rolling the
+    caller back, if any row no longer has the status it was read with.
+    """
+    groups = {}
+    for obj in objects:
+        groups.setdefault((read_statuses[obj.pk], obj.status), []).append(obj)
+    for (before, after), group in groups.items():
+        for start in range(0, len(group), SWAP_CHUNK_SIZE):
+            chunk = group[start:start + SWAP_CHUNK_SIZE]
+            fields = {
+                field: Case(
+                    *[When(pk=obj.pk, then=Value(getattr(obj, field))) for obj in chunk],
+                    output_field=model._meta.get_field(field)
+                )
+                for field in per_row
+            }
+            swapped = model.objects.filter(
+                pk__in=[obj.pk for obj in chunk],
+                status=before
+            ).update(status=after, **fields, **values)
+            if swapped != len(chunk):
+                raise CirculationError(
+                    'Some copies, loans or holds changed while the batch was processed; please try again'
+                )
+
+
+def _take_slots(deltas):
+    """
+    Add loans to the counters of borrowers ({profile_id: count}) in one
+    UPDATE that only applies while every counter stays within its limit,
+    like _reserve_slot does for a single loan.
+    """
+    if not deltas:
+        return
+    added = Case(*[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()], default=Value(0))
+    taken = Profile.objects.alias(
+        loans_after=F('active_book_loans') + added
+    ).filter(
+        pk__in=deltas,
+        loans_after__lte=Profile.borrow_limit_expression()
+    ).update(active_book_loans=F('active_book_loans') + added)
+    if taken != len(deltas):
+        raise CirculationError('Some borrowers reached their limit while the batch was processed; please try again')
+
+
+def _open_record(book_id):
+    """The open borrow record of a copy; raises CirculationError if there is none"""
+    record = BorrowRecord.objects.filter(
+        book_id=book_id,
+        status__in=BorrowRecord.ON_LOAN
+    ).first()
+    if record is None:
+        raise CirculationError('No active borrow record found for this book')
+    return record
+
+
+def _close(record, status, now, **fields):
+    """
+    Move an open record to `status`, writing only the given columns, and
+    release the borrower's loan slot.
+    """
+    closed = BorrowRecord.objects.filter(
+        pk=record.pk,
+        status__in=BorrowRecord.ON_LOAN
+    ).update(status=status, updated=now, **fields)
+    if not closed:
+        raise CirculationError('Borrow record is no longer active')
+    record.status = status
+    record.updated = now
+    for name, value in fields.items():
+        setattr(record, name, value)
+    record.adjust_borrower_loans(-1)
+
+
+def _event(event_type, record, now, actor=None, notes=''):
+    """An unsaved event for a change to a borrow record's item"""
+    return CirculationEvent(
+        event_type=event_type,
+        timestamp=now,
+        book_id=record.book_id,
+        bundle_id=record.bundle_id,
+        profile_id=record.borrower_id,
+        actor=actor,
+        notes=notes
+    )
+
+
+def _log(events):
+    """Append events to the log with batched inserts"""
+    if events:
+        CirculationEvent.objects.bulk_create(events, batch_size=500)
+
+
+def _reserve_slot(borrower):
+    """
+    Take one of the borrower's loan slots; the condition makes the limit
+    lookup, the check and the increment a single statement.
+    """
+    def reserve():
+        return Profile.objects.filter(
+            pk=borrower.pk,
+            active_book_loans__lt=Profile.borrow_limit_expression()
+        ).update(active_book_loans=F('active_book_loans') + 1)
+
+    # A subscription that just ended may have a successor the entitlement
+    # has not picked up yet; refresh it and try once more
+    reserved = reserve() or (
+        Entitlement.objects.expired().filter(user_id=borrower.user_id).refresh() and reserve()
+    )
+    if not reserved:
+        raise CirculationError(f'User has reached borrowing limit of {borrower.borrow_limit} books')
+
+
+def _claim(book_id, borrower, now):
+    """Mark a free copy, or the copy set aside for the borrower's hold, borrowed"""
+    claimed = Book.objects.filter(
+        pk=book_id,
+        status=Book.Status.NORMAL
+    ).update(status=Book.Status.BORROWED, last_updated=now)
+    return claimed or _collect_hold(book_id, borrower, now)
+
+
+def _lend(book_id, borrower, notes, actor, now):
+    """Record the loan of a claimed copy"""
+    # bulk_create inserts without BorrowRecord.save(), which would mark
+    # the book borrowed and count the loan a second time
+    record, = BorrowRecord.objects.bulk_create([BorrowRecord(
+        book_id=book_id,
+        borrower=borrower,
+        borrowed_date=now,
+        due_date=now + LOAN_PERIOD,
+        notes=notes,
+        status=BorrowRecord.Status.ACTIVE
+    )])
+    _log([_event(CirculationEvent.Type.BORROW, record, now, actor, notes)])
+    _copies_changed([book_id])
+    return record
+
+
+def _collect_hold(book_id, borrower, now):
+    """Let a patron borrow the copy set aside for their ready hold"""
+    collected = Hold.objects.filter(
+        book_id=book_id,
+        patron=borrower,
+        status=Hold.Status.READY
+    ).update(status=Hold.Status.FULFILLED, closed_at=now)
+    return collected and Book.objects.filter(
+        pk=book_id,
+        status=Book.Status.BOOKED
+    ).update(status=Book.Status.BORROWED, last_updated=now)
+
+
+def _set_aside_copy(book_id, now):
+    """
+    Give a returned copy to the first waiting hold on its title.
+
+    Returns whether the copy was set aside (and is now BOOKED) and the
+    events to log.
+    """
+    # The join on the copy reaches the title's queue through its partial index
+    hold = Hold.objects.filter(
+        book_profile__copies=book_id,
+        status=Hold.Status.WAITING
+    ).order_by('placed_at', 'id').only('pk', 'patron_id').first()
+    if hold is None:
+        return False, []
+    readied = Hold.objects.filter(pk=hold.pk, status=Hold.Status.WAITING).update(
+        status=Hold.Status.READY, book_id=book_id,
+        ready_at=now, expires_at=now + HOLD_PICKUP_PERIOD
+    )
+    if not readied:
+        return False, []
+    Book.objects.filter(pk=book_id).update(status=Book.Status.BOOKED, last_updated=now)
+    return True, [_hold_event(CirculationEvent.Type.HOLD_READY, book_id, hold.patron_id, now)]
+
+
+def _waiting_holds(copies_per_title):
+    """
+    The first waiting holds of each title, as many as it has copies to give
+    out, in queue order: {book_profile_id: [hold, ...]}.
+    """
+    if not copies_per_title:
+        return {}
+    queues = {}
+    waiting = Hold.objects.filter(
+        book_profile_id__in=copies_per_title,
+        status=Hold.Status.WAITING
+    ).annotate(queue_position=Window(
+        RowNumber(),
+        partition_by=F('book_profile_id'),
+        order_by=[F('placed_at').asc(), F('id').asc()]
+    )).filter(queue_position__lte=max(copies_per_title.values())).order_by(
+        'book_profile_id', 'queue_position'
+    )
+    for hold in waiting:
+        queues.setdefault(hold.book_profile_id, []).append(hold)
+    return queues
+
+
+def _set_aside_copies(copies, now):
+    """
+    Give freed copies, as (book_id, book_profile_id) pairs, to the waiting
+    holds on their titles in queue order.
+
+    Writes the holds and marks the copies they got BOOKED; returns the ids
+    of those copies and the events to log. The caller sets the status of
+    the remaining copies.
+    """
+    copies_per_title = {}
+    for _, profile_id in copies:
+        copies_per_title[profile_id] = copies_per_title.get(profile_id, 0) + 1
+    queues = _waiting_holds(copies_per_title)
+
+    assigned = {}
+    events = []
+    for book_id, profile_id in copies:
+        queue = queues.get(profile_id)
+        if queue:
+            hold = queue.pop(0)
+            assigned[hold.pk] = book_id
+            events.append(_hold_event(CirculationEvent.Type.HOLD_READY, book_id, hold.patron_id, now))
+    if not assigned:
+        return set(), events
+
+    readied = Hold.objects.filter(pk__in=assigned, status=Hold.Status.WAITING).update(
+        status=Hold.Status.READY,
+        book_id=Case(*[When(pk=pk, then=Value(book_id)) for pk, book_id in assigned.items()]),
+        ready_at=now,
+        expires_at=now + HOLD_PICKUP_PERIOD
+    )
+    if readied != len(assigned):
+        raise CirculationError('Some holds changed while being updated; please try again')
+    booked = set(assigned.values())
+    Book.objects.filter(pk__in=booked).update(status=Book.Status.BOOKED, last_updated=now)
+    return booked, events
+
+
+def _pass_on_copies(copies, now):
+    """Set copies freed from holds aside for the next patrons, or shelve them"""
+    booked, events = _set_aside_copies(copies, now)
+    shelved = [book_id for book_id, _ in copies if book_id not in booked]
+    if shelved:
+        Book.objects.filter(pk__in=shelved).update(status=Book.Status.NORMAL, last_updated=now)
+    return events
+
+
+def _hold_event(event_type, book_id, patron_id, now, actor=None):
+    return CirculationEvent(
+        event_type=event_type, timestamp=now, actor=actor,
+        book_id=book_id, profile_id=patron_id
+    )
+
+
+def _copies_changed(book_ids):
+    """
+    Recount the available copies of the affected titles and refresh cached
+    catalog pages once committed; the UPDATEs above send no signals.
+    """
+    if book_ids:
+        BookProfile.refresh_availability(book_ids)
+    transaction.on_commit(lambda: catalog_changed.send(sender=Book))
+
+
+def _set_item_status(record, book_status, bundle_status, now):
+    if record.bundle_id:
+        Bundle.objects.filter(pk=record.bundle_id).update(status=bundle_status, last_updated=now)
+    else:
+        Book.objects.filter(pk=record.book_id).update(status=book_status, last_updated=now)
+
+
+def _refusal(book_id, message):
+    """The error for a copy whose status did not allow the change"""
+    book = Book.objects.filter(pk=book_id).only('status').first()
+    if book is None:
+        return CirculationError('Book not found')
+    return CirculationError(message.format(status=book.get_status_display()))
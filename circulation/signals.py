@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from books.models import Book
+from .models import CirculationEvent
+
+
+@receiver(post_save, sender=Book)
+def log_status_change(sender, instance, created, **kwargs):
+    """Saves through the ORM (admin, API, bundles); services log their own UPDATEs"""
+    # Set by books.signals before the save; dropped so a later save that
+    # skips the lookup cannot log it again
+    previous = instance.__dict__.pop('_previous_status', None)
+    if not created and previous is not None and previous != instance.status:
+        CirculationEvent.status_change(instance.pk, previous, instance.status).save()
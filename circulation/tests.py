@@ -1,3 +1,920 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from books.models import Book, BookProfile
+from bundles.models import Bundle
+from subscriptions.models import Entitlement, FreeBorrowingPlan, PlanDuration, Subscription
+from users.models import Profile
+from . import services
+from .admin import BorrowRecordAdmin
+from .management.commands.circulation_scheduler import Command as SchedulerCommand
+from .models import BorrowRecord, CirculationEvent, Hold, LoanNotice
+
+
+def create_borrower(username, max_books):
+    user = User.objects.create_user(username)
+    duration, _ = PlanDuration.objects.get_or_create(months=1, defaults={'description': '1 month'})
+    plan = FreeBorrowingPlan.objects.create(
+        name=f'{username} plan', price=0, duration=duration, max_books=max_books
+    )
+    now = timezone.now()
+    Subscription.objects.create(
+        user=user, free_borrowing_plan=plan,
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=30)
+    )
+    return user.profile
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """
+    Stress the checkout path with many threads racing for the same copies.
+    Each thread uses its own database connection.
+    """
+    THREADS = 16
+    BOOKS = 20
+
+    def setUp(self):
+        profile = BookProfile.objects.create(name='Popular', isbn='9780000000001')
+        self.book_ids = [
+            Book.objects.create(profile=profile, nl_code=f'NL{i}').pk
+            for i in range(self.BOOKS)
+        ]
+        self.borrowers = [
+            create_borrower(f'reader{i}', max_books=self.BOOKS)
+            for i in range(self.THREADS)
+        ]
+
+    def borrow_with_retry(self, book_id, borrower):
+        # SQLite reports lock contention instead of waiting; retry those
+        while True:
+            try:
+                return services.borrow_book(book_id, borrower)
+            except OperationalError:
+                time.sleep(0.001)
+
+    def test_no_double_loans(self):
+        barrier = threading.Barrier(self.THREADS)
+        successes = []
+        refusals = []
+
+        def desk(borrower):
+            try:
+                barrier.wait()
+                for book_id in self.book_ids:
+                    try:
+                        successes.append(self.borrow_with_retry(book_id, borrower).book_id)
+                    except services.CirculationError:
+                        refusals.append(book_id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=desk, args=(b,)) for b in self.borrowers]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        attempts = self.THREADS * self.BOOKS
+        self.assertEqual(len(successes) + len(refusals), attempts)
+        self.assertEqual(sorted(successes), sorted(self.book_ids))
+        for book_id in self.book_ids:
+            self.assertEqual(
+                BorrowRecord.objects.filter(book_id=book_id, status__in=BorrowRecord.ON_LOAN).count(), 1
+            )
+        self.assertFalse(Book.objects.exclude(status=Book.Status.BORROWED).exists())
+        self.assertLess(elapsed, 60, f'{attempts} checkouts took {elapsed:.1f}s')
+
+
+class QueryBudgetTests(TestCase):
+    """Each circulation operation stays within its documented query budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        profile = BookProfile.objects.create(name='Budget', isbn='9780000000002')
+        cls.books = [
+            Book.objects.create(profile=profile, nl_code=f'NL{i}') for i in range(2)
+        ]
+        cls.borrower = create_borrower('reader', max_books=2)
+
+    def count_statements(self, operation, *args, **kwargs):
+        # Savepoints come from the test case's own transaction nesting
+        with CaptureQueriesContext(connection) as ctx:
+            result = operation(*args, **kwargs)
+        statements = [
+            query['sql'] for query in ctx.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        return len(statements), result
+
+    def assert_loans(self, count):
+        self.borrower.refresh_from_db()
+        self.assertEqual(self.borrower.active_book_loans, count)
+
+    def test_borrow_and_return(self):
+        book = self.books[0]
+        statements, record = self.count_statements(services.borrow_book, book.pk, self.borrower)
+        self.assertLessEqual(statements, 5)
+        self.assert_loans(1)
+
+        statements, record = self.count_statements(services.return_book, book.pk, notes='ok')
+        self.assertLessEqual(statements, 7)
+        self.assertEqual(record.status, BorrowRecord.Status.RETURNED)
+        self.assertEqual(Book.objects.get(pk=book.pk).status, Book.Status.NORMAL)
+        self.assert_loans(0)
+
+        self.assertEqual(
+            list(CirculationEvent.objects.for_book(book.pk).values_list('event_type', 'profile', 'notes')),
+            [
+                (CirculationEvent.Type.BORROW, self.borrower.pk, ''),
+                (CirculationEvent.Type.RETURN, self.borrower.pk, 'ok'),
+            ]
+        )
+
+    def test_renew_and_mark_lost(self):
+        book = self.books[0]
+        record = services.borrow_book(book.pk, self.borrower)
+        BorrowRecord.objects.filter(pk=record.pk).update(
+            status=BorrowRecord.Status.OVERDUE, due_date=timezone.now() - timedelta(days=1)
+        )
+
+        touched = Book.objects.get(pk=book.pk).last_updated
+        statements, record = self.count_statements(services.renew_loan, book.pk)
+        self.assertLessEqual(statements, 4)
+        self.assertEqual(BorrowRecord.objects.get(pk=record.pk).status, BorrowRecord.Status.ACTIVE)
+        self.assertGreater(Book.objects.get(pk=book.pk).last_updated, touched)
+
+        statements, record = self.count_statements(services.mark_lost, book.pk)
+        self.assertLessEqual(statements, 6)
+        self.assertEqual(BorrowRecord.objects.get(pk=record.pk).status, BorrowRecord.Status.LOST)
+        self.assertEqual(Book.objects.get(pk=book.pk).status, Book.Status.LOST)
+        self.assert_loans(0)
+
+    def test_direct_save_writes_book_once(self):
+        book = self.books[1]
+        statements, _ = self.count_statements(
+            BorrowRecord.objects.create,
+            book=book, borrower=self.borrower, due_date=timezone.now() + services.LOAN_PERIOD
+        )
+        # Insert, loan counter, event, the book's status column and the
+        # title's available copies
+        self.assertEqual(statements, 5)
+        self.assertEqual(Book.objects.get(pk=book.pk).status, Book.Status.BORROWED)
+        self.assert_loans(1)
+
+    def test_refusals_write_nothing(self):
+        book = self.books[0]
+        Book.objects.filter(pk=book.pk).update(status=Book.Status.WRITTEN_OFF)
+        with self.assertRaisesMessage(services.CirculationError, 'Written Off'):
+            services.borrow_book(book.pk, self.borrower)
+        with self.assertRaises(services.CirculationError):
+            services.return_book(book.pk)
+        self.assertFalse(BorrowRecord.objects.exists())
+        self.assertFalse(CirculationEvent.objects.exists())
+        self.assert_loans(0)
+
+
+class HoldQueueTests(TestCase):
+    """Returned copies go to the head of the title's hold queue"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.title = BookProfile.objects.create(name='Wanted', isbn='9780000000003')
+        cls.book = Book.objects.create(profile=cls.title, nl_code='NL1')
+        cls.readers = [create_borrower(f'reader{i}', max_books=1) for i in range(3)]
+
+    def holds(self):
+        return list(Hold.objects.order_by('id').values_list('patron', 'status', 'book'))
+
+    def test_return_sets_copy_aside_in_queue_order(self):
+        first, second, third = self.readers
+        services.borrow_book(self.book.pk, first)
+        services.place_hold(self.title.pk, second)
+        services.place_hold(self.title.pk, third)
+
+        services.return_book(self.book.pk)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.Status.BOOKED)
+        self.assertEqual(self.holds(), [
+            (second.pk, Hold.Status.READY, self.book.pk),
+            (third.pk, Hold.Status.WAITING, None),
+        ])
+
+        with self.assertRaises(services.CirculationError):
+            services.borrow_book(self.book.pk, third)
+        services.borrow_book(self.book.pk, second)
+        self.assertEqual(self.holds()[0][1], Hold.Status.FULFILLED)
+
+    def test_expired_hold_passes_copy_on(self):
+        first, second, third = self.readers
+        services.borrow_book(self.book.pk, third)
+        services.place_hold(self.title.pk, first)
+        services.place_hold(self.title.pk, second)
+        services.return_book(self.book.pk)
+        self.assertEqual(self.holds()[0], (first.pk, Hold.Status.READY, self.book.pk))
+
+        expired = services.expire_holds(timezone.now() + services.HOLD_PICKUP_PERIOD)
+        self.assertEqual(expired, 1)
+        self.assertEqual(self.holds(), [
+            (first.pk, Hold.Status.EXPIRED, self.book.pk),
+            (second.pk, Hold.Status.READY, self.book.pk),
+        ])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.Status.BOOKED)
+
+    def test_refusals(self):
+        first, second, _ = self.readers
+        with self.assertRaisesMessage(services.CirculationError, 'on the shelf'):
+            services.place_hold(self.title.pk, first)
+
+        services.borrow_book(self.book.pk, first)
+        unentitled = User.objects.create_user('visitor').profile
+        with self.assertRaisesMessage(services.CirculationError, 'no active plan'):
+            services.place_hold(self.title.pk, unentitled)
+
+        services.place_hold(self.title.pk, second)
+        with self.assertRaisesMessage(services.CirculationError, 'open hold on this title'):
+            services.place_hold(self.title.pk, second)
+
+        for i in range(services.MAX_OPEN_HOLDS - 1):
+            title = BookProfile.objects.create(name=f'Unreleased {i}', isbn=f'97800000001{i:02d}')
+            services.place_hold(title.pk, second)
+        title = BookProfile.objects.create(name='One too many', isbn='9780000000199')
+        with self.assertRaisesMessage(services.CirculationError, 'open holds'):
+            services.place_hold(title.pk, second)
+
+        self.assertEqual(Hold.objects.filter(patron=second).count(), services.MAX_OPEN_HOLDS)
+        self.assertFalse(Hold.objects.exclude(patron=second).exists())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).status, Book.Status.BORROWED)
+
+
+class ProcessBatchTests(TestCase):
+    """process_batch applies mixed operations in order and writes them with compare-and-swap"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.title = BookProfile.objects.create(name='Batch', isbn='9780000000006')
+        cls.books = [Book.objects.create(profile=cls.title, nl_code=f'NL{i}') for i in range(3)]
+        cls.first = create_borrower('first', max_books=1)
+        cls.second = create_borrower('second', max_books=2)
+
+    def borrow(self, book, borrower):
+        return {'action': 'borrow', 'book_id': book.pk, 'user_id': borrower.user_id}
+
+    def give_back(self, book):
+        return {'action': 'return', 'book_id': book.pk}
+
+    def loans(self, profile):
+        profile.refresh_from_db()
+        return profile.active_book_loans
+
+    def test_mixed_operations(self):
+        services.borrow_book(self.books[0].pk, self.first)
+        outcomes = services.process_batch([
+            self.borrow(self.books[1], self.first),
+            self.give_back(self.books[0]),
+            self.borrow(self.books[0], self.second),
+            self.borrow(self.books[0], self.first),
+            self.give_back(self.books[2]),
+            {'action': 'borrow', 'book_id': 0, 'user_id': self.second.user_id},
+            {'action': 'borrow', 'book_id': self.books[2].pk, 'user_id': 0},
+            self.borrow(self.books[1], self.first),
+        ])
+        self.assertEqual([outcome['status'] for outcome in outcomes], [
+            'error', 'success', 'success', 'error', 'error', 'error', 'error', 'success'
+        ])
+        self.assertIn('borrowing limit of 1', outcomes[0]['message'])
+        self.assertIn('Current status: Borrowed', outcomes[3]['message'])
+        self.assertEqual(outcomes[4]['message'], 'No active borrow record found for this book')
+        self.assertEqual(outcomes[5]['message'], 'Book not found')
+        self.assertEqual(outcomes[6]['message'], 'User profile not found')
+
+        self.assertEqual(
+            list(BorrowRecord.objects.order_by('pk').values_list('book', 'borrower', 'status')),
+            [
+                (self.books[0].pk, self.first.pk, BorrowRecord.Status.RETURNED),
+                (self.books[0].pk, self.second.pk, BorrowRecord.Status.ACTIVE),
+                (self.books[1].pk, self.first.pk, BorrowRecord.Status.ACTIVE),
+            ]
+        )
+        self.assertEqual((self.loans(self.first), self.loans(self.second)), (1, 1))
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('status', flat=True)),
+            [Book.Status.BORROWED, Book.Status.BORROWED, Book.Status.NORMAL]
+        )
+        self.assertEqual(BookProfile.objects.get(pk=self.title.pk).available_copies, 1)
+        self.assertEqual(
+            list(CirculationEvent.objects.order_by('pk').values_list('event_type', 'book')[1:]),
+            [
+                (CirculationEvent.Type.RETURN, self.books[0].pk),
+                (CirculationEvent.Type.BORROW, self.books[0].pk),
+                (CirculationEvent.Type.BORROW, self.books[1].pk),
+            ]
+        )
+
+    def test_returned_copy_goes_to_hold_and_is_collected(self):
+        for book in self.books[:2]:
+            services.borrow_book(book.pk, self.second)
+        Book.objects.filter(pk=self.books[2].pk).update(status=Book.Status.LOST)
+        services.place_hold(self.title.pk, self.first)
+
+        outcomes = services.process_batch([
+            self.give_back(self.books[0]),
+            self.borrow(self.books[0], self.second),
+            self.borrow(self.books[0], self.first),
+        ])
+        self.assertEqual([outcome['status'] for outcome in outcomes], ['success', 'error', 'success'])
+        self.assertEqual(Hold.objects.get().status, Hold.Status.FULFILLED)
+        self.assertEqual(Hold.objects.get().book_id, self.books[0].pk)
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).status, Book.Status.BORROWED)
+
+    def test_conflicting_change_writes_nothing(self):
+        waiting_holds = services._waiting_holds
+
+        def desk_lends_copy(copies_per_title):
+            # Another desk lends the copy between the batch's reads and writes
+            Book.objects.filter(pk=self.books[1].pk).update(status=Book.Status.BORROWED)
+            return waiting_holds(copies_per_title)
+
+        with mock.patch.object(services, '_waiting_holds', desk_lends_copy):
+            with self.assertRaisesMessage(services.CirculationError, 'try again'):
+                with transaction.atomic():
+                    services.process_batch([
+                        self.borrow(self.books[0], self.second),
+                        self.borrow(self.books[1], self.second),
+                    ])
+        self.assertFalse(BorrowRecord.objects.exists())
+        self.assertEqual(self.loans(self.second), 0)
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).status, Book.Status.NORMAL)
+
+    def test_limit_reached_meanwhile_writes_nothing(self):
+        waiting_holds = services._waiting_holds
+
+        def desk_lends_to_borrower(copies_per_title):
+            services.borrow_book(self.books[2].pk, self.first)
+            return waiting_holds(copies_per_title)
+
+        with mock.patch.object(services, '_waiting_holds', desk_lends_to_borrower):
+            with self.assertRaisesMessage(services.CirculationError, 'limit'):
+                with transaction.atomic():
+                    services.process_batch([self.borrow(self.books[0], self.first)])
+        self.assertFalse(BorrowRecord.objects.exists())
+
+    def test_ended_entitlement_is_refreshed(self):
+        # The entitlement still describes a subscription that has just ended
+        Entitlement.objects.filter(user_id=self.first.user_id).update(valid_until=timezone.now())
+        outcome, = services.process_batch([self.borrow(self.books[0], self.first)])
+        self.assertEqual(outcome['status'], 'success')
+        self.assertEqual(self.loans(self.first), 1)
+
+
+class SchedulerTests(TestCase):
+    """circulation_scheduler marks loans overdue at their due date and follows changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        title = BookProfile.objects.create(name='Scheduled', isbn='9780000000007')
+        cls.books = [Book.objects.create(profile=title, nl_code=f'NL{i}') for i in range(3)]
+        cls.reader = create_borrower('reader', max_books=3)
+
+    def start(self, now, horizon=timedelta(hours=24)):
+        scheduler = SchedulerCommand(stdout=StringIO())
+        scheduler.start(now, horizon=horizon, poll_interval=timedelta(seconds=60))
+        return scheduler
+
+    def lend(self, book, due_in):
+        record = services.borrow_book(book.pk, self.reader)
+        BorrowRecord.objects.filter(pk=record.pk).update(
+            due_date=timezone.now() + due_in, updated=timezone.now()
+        )
+        return record
+
+    def status(self, record):
+        return BorrowRecord.objects.get(pk=record.pk).status
+
+    def test_marks_records_as_they_fall_due(self):
+        soon = self.lend(self.books[0], timedelta(hours=1))
+        later = self.lend(self.books[1], timedelta(hours=2))
+        services.return_book(self.books[1].pk)
+        self.lend(self.books[2], timedelta(days=10))
+        now = timezone.now()
+
+        # One read of the window; no scan of the borrowing history
+        with self.assertNumQueries(1):
+            scheduler = self.start(now)
+        self.assertEqual(set(scheduler.scheduled), {soon.pk})
+
+        scheduler.run_due(now + timedelta(minutes=59))
+        self.assertEqual(self.status(soon), BorrowRecord.Status.ACTIVE)
+        wake_at = scheduler.run_due(now + timedelta(hours=1, seconds=1))
+        self.assertEqual(self.status(soon), BorrowRecord.Status.OVERDUE)
+        self.assertEqual(self.status(later), BorrowRecord.Status.RETURNED)
+        self.assertEqual(wake_at, scheduler.next_poll)
+
+    def test_follows_new_and_changed_due_dates(self):
+        renewed = self.lend(self.books[0], timedelta(hours=1))
+        edited = self.lend(self.books[1], timedelta(days=10))
+        now = timezone.now()
+        scheduler = self.start(now)
+
+        services.renew_loan(self.books[0].pk)
+        BorrowRecord.objects.filter(pk=edited.pk).update(
+            due_date=now + timedelta(hours=3), updated=timezone.now()
+        )
+        added = self.lend(self.books[2], timedelta(hours=2))
+
+        poll = now + timedelta(minutes=1)
+        scheduler.run_due(poll)
+        self.assertEqual(set(scheduler.scheduled), {edited.pk, added.pk})
+
+        scheduler.run_due(now + timedelta(hours=3, seconds=1))
+        self.assertEqual(self.status(renewed), BorrowRecord.Status.ACTIVE)
+        self.assertEqual(self.status(edited), BorrowRecord.Status.OVERDUE)
+        self.assertEqual(self.status(added), BorrowRecord.Status.OVERDUE)
+
+    def test_new_borrows_are_polled(self):
+        now = timezone.now()
+        scheduler = self.start(now, horizon=timedelta(days=40))
+        record = services.borrow_book(self.books[0].pk, self.reader)
+        scheduler.run_due(now + timedelta(minutes=1))
+        self.assertEqual(scheduler.scheduled, {record.pk: record.due_date})
+
+
+class CheckoutAnyTests(TestCase):
+    """borrow_any picks a free copy and keeps available_copies in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.title = BookProfile.objects.create(name='Common', isbn='9780000000004')
+        cls.books = [Book.objects.create(profile=cls.title, nl_code=f'NL{i}') for i in range(2)]
+        cls.readers = [create_borrower(f'reader{i}', max_books=2) for i in range(3)]
+
+    def available(self):
+        return BookProfile.objects.get(pk=self.title.pk).available_copies
+
+    def test_lends_each_copy_once(self):
+        first, second, third = self.readers
+        self.assertEqual(self.available(), 2)
+
+        loans = [services.borrow_any(self.title.pk, first), services.borrow_any(self.title.pk, second)]
+        self.assertEqual({loan.book_id for loan in loans}, {book.pk for book in self.books})
+        self.assertEqual(self.available(), 0)
+
+        with self.assertRaisesMessage(services.CirculationError, 'No copy'):
+            services.borrow_any(self.title.pk, third)
+        third.refresh_from_db()
+        self.assertEqual(third.active_book_loans, 0)
+
+        services.return_record(loans[0])
+        self.assertEqual(self.available(), 1)
+
+    def test_prefers_copy_held_for_borrower(self):
+        first, second, third = self.readers
+        loans = [services.borrow_any(self.title.pk, first) for _ in self.books]
+        services.place_hold(self.title.pk, second)
+        for loan in loans:
+            services.return_record(loan)
+        held = Hold.objects.get(patron=second).book_id
+        self.assertEqual(held, loans[0].book_id)
+        self.assertEqual(self.available(), 1)
+
+        loan = services.borrow_any(self.title.pk, third)
+        self.assertNotEqual(loan.book_id, held)
+        loan = services.borrow_any(self.title.pk, second)
+        self.assertEqual(loan.book_id, held)
+        self.assertEqual(Hold.objects.get(patron=second).status, Hold.Status.FULFILLED)
+
+
+class LoanNoticeTests(TestCase):
+    """send_loan_notices sends one digest per borrower and never repeats one"""
+
+    @classmethod
+    def setUpTestData(cls):
+        title = BookProfile.objects.create(name='Due', isbn='9780000000005')
+        cls.books = [Book.objects.create(profile=title, nl_code=f'NL{i}') for i in range(4)]
+        cls.reader = create_borrower('reader', max_books=4)
+        User.objects.filter(pk=cls.reader.user_id).update(email='reader@example.com')
+        cls.silent = create_borrower('silent', max_books=4)
+
+    def lend(self, book, borrower, due_in):
+        record = services.borrow_book(book.pk, borrower)
+        BorrowRecord.objects.filter(pk=record.pk).update(due_date=timezone.now() + due_in)
+        return record
+
+    def send(self):
+        call_command('send_loan_notices', days=3, stdout=StringIO())
+
+    def test_digest_per_borrower_is_sent_once(self):
+        overdue = self.lend(self.books[0], self.reader, timedelta(days=-1))
+        due_soon = self.lend(self.books[1], self.reader, timedelta(days=1))
+        self.lend(self.books[2], self.reader, timedelta(days=10))
+        self.lend(self.books[3], self.silent, timedelta(days=1))
+
+        self.send()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertIn('NL0', mail.outbox[0].body)
+        self.assertIn('NL1', mail.outbox[0].body)
+        self.assertNotIn('NL2', mail.outbox[0].body)
+        self.assertEqual(
+            set(LoanNotice.objects.values_list('record', 'kind')),
+            {(overdue.pk, LoanNotice.Kind.OVERDUE), (due_soon.pk, LoanNotice.Kind.REMINDER)}
+        )
+
+        self.send()
+        self.assertEqual(len(mail.outbox), 1)
+
+        # A renewed loan is reminded again of its new due date
+        BorrowRecord.objects.filter(pk=due_soon.pk).update(due_date=timezone.now() + timedelta(days=2))
+        self.send()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('NL1', mail.outbox[1].body)
+        self.assertNotIn('NL0', mail.outbox[1].body)
+
+
+class BorrowHistoryExportTests(TestCase):
+    """export_borrow_history writes the filtered history as CSV or NDJSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        title = BookProfile.objects.create(name='Exported', isbn='9780000000008')
+        books = [Book.objects.create(profile=title, nl_code=f'NL{i}') for i in range(3)]
+        reader = create_borrower('reader', max_books=3)
+        cls.records = []
+        for book, borrowed, status in [
+            (books[0], '2024-01-10', BorrowRecord.Status.RETURNED),
+            (books[1], '2024-02-01', BorrowRecord.Status.ACTIVE),
+            (books[2], '2024-03-05', BorrowRecord.Status.OVERDUE),
+        ]:
+            record = services.borrow_book(book.pk, reader)
+            BorrowRecord.objects.filter(pk=record.pk).update(
+                borrowed_date=f'{borrowed}T12:00:00Z', status=status
+            )
+            cls.records.append(record)
+
+    def export(self, **options):
+        out = StringIO()
+        call_command('export_borrow_history', stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_csv_with_date_bounds(self):
+        rows = list(csv.DictReader(StringIO(self.export(date_from='2024-02-01', date_to='2024-03-05'))))
+        self.assertEqual([int(row['id']) for row in rows], [record.pk for record in self.records[1:]])
+        self.assertEqual(rows[0]['book'], 'NL1')
+        self.assertEqual(rows[0]['book_title'], 'Exported')
+        self.assertEqual(rows[0]['borrower'], 'reader')
+        self.assertEqual(rows[0]['borrowed_date'], '2024-02-01T12:00:00+00:00')
+
+    def test_ndjson_with_status_filter(self):
+        lines = self.export(format='ndjson', status=['RET', 'OVD']).splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['status'] for row in rows], ['RET', 'OVD'])
+        self.assertEqual(rows[0]['book'], 'NL0')
+        self.assertIsNone(rows[0]['bundle'])
+
+    def test_invalid_date(self):
+        with self.assertRaisesMessage(CommandError, 'Invalid date'):
+            self.export(date_from='yesterday')
+
+
+class CheckOverdueTests(TestCase):
+    """check_overdue marks active loans past due in batches and skips the rest"""
+
+    @classmethod
+    def setUpTestData(cls):
+        title = BookProfile.objects.create(name='Late', isbn='9780000000009')
+        books = [Book.objects.create(profile=title, nl_code=f'NL{i}') for i in range(6)]
+        cls.reader = create_borrower('reader', max_books=6)
+        cls.late = []
+        for i, book in enumerate(books):
+            record = services.borrow_book(book.pk, cls.reader)
+            due_in = timedelta(days=1) if i == 3 else timedelta(days=-1)
+            BorrowRecord.objects.filter(pk=record.pk).update(due_date=timezone.now() + due_in)
+            if i < 3:
+                cls.late.append(record.pk)
+        BorrowRecord.objects.filter(book=books[4]).update(status=BorrowRecord.Status.OVERDUE)
+        services.return_book(books[5].pk)
+        BorrowRecord.objects.filter(book=books[5]).update(due_date=timezone.now() - timedelta(days=1))
+
+    def check_overdue(self, **options):
+        out = StringIO()
+        call_command('check_overdue', stdout=out, **options)
+        return out.getvalue()
+
+    def statuses(self):
+        return dict(BorrowRecord.objects.values_list('pk', 'status'))
+
+    def test_marks_in_batches(self):
+        before = self.statuses()
+        output = self.check_overdue(batch_size=2)
+        self.assertIn('marked 3 borrow records overdue in 2 batches', output)
+
+        after = self.statuses()
+        for pk, status in before.items():
+            expected = BorrowRecord.Status.OVERDUE if pk in self.late else status
+            self.assertEqual(after[pk], expected)
+        self.assertEqual(
+            sorted(CirculationEvent.objects.filter(
+                event_type=CirculationEvent.Type.OVERDUE
+            ).values_list('book', flat=True)),
+            sorted(BorrowRecord.objects.filter(pk__in=self.late).values_list('book', flat=True))
+        )
+        # Overdue loans are still out: the loan counter does not move
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.active_book_loans, 5)
+
+        self.assertIn('marked 0 borrow records overdue in 0 batches', self.check_overdue())
+
+    def test_dry_run_changes_nothing(self):
+        before = self.statuses()
+        self.assertIn('3 borrow records would be marked overdue', self.check_overdue(dry_run=True))
+        self.assertEqual(self.statuses(), before)
+        self.assertFalse(CirculationEvent.objects.filter(event_type=CirculationEvent.Type.OVERDUE).exists())
+
+
+class ReconcileLoanCountersTests(TestCase):
+    """reconcile_loan_counters recounts open loans and repairs drifted counters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        title = BookProfile.objects.create(name='Counted', isbn='9780000000010')
+        books = [Book.objects.create(profile=title, nl_code=f'NL{i}') for i in range(3)]
+        cls.reader = create_borrower('reader', max_books=3)
+        cls.other = create_borrower('other', max_books=3)
+        cls.idle = create_borrower('idle', max_books=3)
+        services.borrow_book(books[0].pk, cls.reader)
+        services.borrow_book(books[1].pk, cls.reader)
+        services.borrow_book(books[2].pk, cls.other)
+        bundle = Bundle.objects.create(bundle_id='B1', name='Box')
+        BorrowRecord.objects.create(
+            borrower=cls.other, bundle=bundle, due_date=timezone.now() + timedelta(days=7)
+        )
+        # Drift: one counter too low, one too high, one borrower with no loans at all
+        Profile.objects.filter(pk=cls.reader.pk).update(active_book_loans=1)
+        Profile.objects.filter(pk=cls.other.pk).update(active_bundle_loans=3)
+        Profile.objects.filter(pk=cls.idle.pk).update(active_book_loans=2)
+
+    def reconcile(self, **options):
+        out = StringIO()
+        call_command('reconcile_loan_counters', stdout=out, **options)
+        return out.getvalue()
+
+    def counters(self):
+        return {
+            pk: (books, bundles)
+            for pk, books, bundles in Profile.objects.filter(
+                pk__in=[self.reader.pk, self.other.pk, self.idle.pk]
+            ).values_list('pk', 'active_book_loans', 'active_bundle_loans')
+        }
+
+    def test_repairs_drifted_counters(self):
+        output = self.reconcile()
+        self.assertIn(f'Profile {self.reader.pk}: books 1 -> 2, bundles 0 -> 0', output)
+        self.assertIn(f'Profile {self.other.pk}: books 1 -> 1, bundles 3 -> 1', output)
+        self.assertIn(f'Profile {self.idle.pk}: books 2 -> 0, bundles 0 -> 0', output)
+        self.assertIn('Successfully reconciled 3 profiles', output)
+        self.assertEqual(self.counters(), {
+            self.reader.pk: (2, 0), self.other.pk: (1, 1), self.idle.pk: (0, 0)
+        })
+
+        self.assertIn('Successfully reconciled 0 profiles', self.reconcile())
+
+    def test_dry_run_only_reports(self):
+        before = self.counters()
+        output = self.reconcile(dry_run=True)
+        self.assertIn(f'Profile {self.reader.pk}: books 1 -> 2, bundles 0 -> 0', output)
+        self.assertIn('3 profiles have drifted loan counters', output)
+        self.assertNotIn('Successfully reconciled', output)
+        self.assertEqual(self.counters(), before)
+
+
+class BorrowRecordAdminActionTests(TestCase):
+    """The admin's bulk return and lost actions close a mixed selection in one pass"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('desk', password='x')
+        cls.held_title = BookProfile.objects.create(name='Wanted', isbn='9780000000011')
+        cls.held_copies = [
+            Book.objects.create(profile=cls.held_title, nl_code=f'NL{i}') for i in range(2)
+        ]
+        other_title = BookProfile.objects.create(name='Late', isbn='9780000000012')
+        cls.late_copy = Book.objects.create(profile=other_title, nl_code='NL2')
+        cls.returned_copy = Book.objects.create(profile=other_title, nl_code='NL3')
+        cls.bundle = Bundle.objects.create(bundle_id='B1', name='Box')
+
+        cls.reader = create_borrower('reader', max_books=5)
+        cls.other = create_borrower('other', max_books=5)
+        cls.open_records = [
+            services.borrow_book(book.pk, cls.reader).pk
+            for book in cls.held_copies + [cls.late_copy]
+        ]
+        BorrowRecord.objects.filter(book=cls.late_copy).update(status=BorrowRecord.Status.OVERDUE)
+        cls.open_records.append(BorrowRecord.objects.create(
+            borrower=cls.other, bundle=cls.bundle, due_date=timezone.now() + timedelta(days=7)
+        ).pk)
+        cls.closed_record = services.borrow_book(cls.returned_copy.pk, cls.reader).pk
+        services.return_book(cls.returned_copy.pk)
+        cls.hold = services.place_hold(cls.held_title.pk, cls.other)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.last_event = CirculationEvent.objects.latest('id').pk
+
+    def run_action(self, action):
+        response = self.client.post('/admin/circulation/borrowrecord/', {
+            'action': action,
+            '_selected_action': self.open_records + [self.closed_record],
+        }, follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def new_events(self):
+        return list(CirculationEvent.objects.filter(pk__gt=self.last_event).values_list(
+            'event_type', 'book', 'bundle', 'profile', 'actor'
+        ))
+
+    def loans(self, profile):
+        profile.refresh_from_db()
+        return profile.active_book_loans, profile.active_bundle_loans
+
+    def test_mark_as_returned(self):
+        self.assertEqual(self.run_action('mark_as_returned'), [
+            '4 records marked as returned',
+            f'Skipped 1 records that were not on loan: {self.closed_record}',
+        ])
+        statuses = dict(BorrowRecord.objects.values_list('pk', 'status'))
+        for pk in self.open_records + [self.closed_record]:
+            self.assertEqual(statuses[pk], BorrowRecord.Status.RETURNED)
+
+        # One returned copy is set aside for the waiting hold, the other goes back on the shelf
+        self.assertEqual(
+            sorted(Book.objects.filter(profile=self.held_title).values_list('status', flat=True)),
+            sorted([Book.Status.BOOKED, Book.Status.NORMAL])
+        )
+        self.hold.refresh_from_db()
+        self.assertEqual(self.hold.status, Hold.Status.READY)
+        self.late_copy.refresh_from_db()
+        self.assertEqual(self.late_copy.status, Book.Status.NORMAL)
+        self.bundle.refresh_from_db()
+        self.assertEqual(self.bundle.status, Bundle.Status.NORMAL)
+        self.held_title.refresh_from_db()
+        self.assertEqual(self.held_title.available_copies, 1)
+
+        self.assertEqual(self.loans(self.reader), (0, 0))
+        self.assertEqual(self.loans(self.other), (0, 0))
+
+        self.assertCountEqual(self.new_events(), [
+            (CirculationEvent.Type.RETURN, self.held_copies[0].pk, None, self.reader.pk, self.admin.pk),
+            (CirculationEvent.Type.RETURN, self.held_copies[1].pk, None, self.reader.pk, self.admin.pk),
+            (CirculationEvent.Type.RETURN, self.late_copy.pk, None, self.reader.pk, self.admin.pk),
+            (CirculationEvent.Type.RETURN, None, self.bundle.pk, self.other.pk, self.admin.pk),
+            (CirculationEvent.Type.HOLD_READY, self.hold.book_id, None, self.other.pk, None),
+        ])
+
+    def test_mark_as_lost(self):
+        self.assertEqual(self.run_action('mark_as_lost'), [
+            '4 records marked as lost',
+            f'Skipped 1 records that were not on loan: {self.closed_record}',
+        ])
+        self.assertEqual(
+            BorrowRecord.objects.get(pk=self.closed_record).status, BorrowRecord.Status.RETURNED
+        )
+        self.assertFalse(
+            BorrowRecord.objects.filter(pk__in=self.open_records).exclude(
+                status=BorrowRecord.Status.LOST
+            ).exists()
+        )
+        # Lost copies are not set aside: the hold keeps waiting
+        self.assertEqual(
+            set(Book.objects.filter(
+                pk__in=[book.pk for book in self.held_copies] + [self.late_copy.pk]
+            ).values_list('status', flat=True)),
+            {Book.Status.LOST}
+        )
+        self.hold.refresh_from_db()
+        self.assertEqual(self.hold.status, Hold.Status.WAITING)
+        self.bundle.refresh_from_db()
+        self.assertEqual(self.bundle.status, Bundle.Status.LOST)
+
+        self.assertEqual(self.loans(self.reader), (0, 0))
+        self.assertEqual(self.loans(self.other), (0, 0))
+        self.assertCountEqual(
+            [(event_type, profile) for event_type, _, _, profile, _ in self.new_events()],
+            [(CirculationEvent.Type.LOST, self.reader.pk)] * 3
+            + [(CirculationEvent.Type.LOST, self.other.pk)]
+        )
+
+    def test_nothing_on_loan(self):
+        self.open_records = []
+        self.assertEqual(self.run_action('mark_as_returned'), [
+            '0 records marked as returned',
+            f'Skipped 1 records that were not on loan: {self.closed_record}',
+        ])
+        self.assertEqual(self.new_events(), [])
+        self.assertEqual(self.loans(self.reader), (3, 0))
+
+    def test_long_skipped_list_is_truncated(self):
+        services.return_records(BorrowRecord.objects.filter(pk__in=self.open_records))
+        closed = sorted(self.open_records + [self.closed_record])
+        with mock.patch.object(BorrowRecordAdmin, 'SKIPPED_LISTED', 2):
+            messages = self.run_action('mark_as_lost')
+        self.assertEqual(messages, [
+            '0 records marked as lost',
+            f'Skipped 5 records that were not on loan: {closed[0]}, {closed[1]} and 3 more',
+        ])
+
+
+class CirculationEventLogTests(TestCase):
+    """Every change of a copy's status leaves an event, whichever path made it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        title = BookProfile.objects.create(name='Logged', isbn='9780000000013')
+        cls.book = Book.objects.create(profile=title, nl_code='NL1')
+        cls.other_book = Book.objects.create(profile=title, nl_code='NL2')
+        cls.reader = create_borrower('reader', max_books=2)
+
+    def history(self, book):
+        return list(CirculationEvent.objects.for_book(book.pk).values_list('event_type', 'notes'))
+
+    def test_circulation_history(self):
+        services.borrow_book(self.book.pk, self.reader, actor=self.staff)
+        services.renew_loan(self.book.pk, actor=self.staff)
+        services.return_book(self.book.pk, actor=self.staff)
+        events = CirculationEvent.objects.for_book(self.book.pk)
+        self.assertEqual(
+            [event.event_type for event in events],
+            [CirculationEvent.Type.BORROW, CirculationEvent.Type.RENEW, CirculationEvent.Type.RETURN]
+        )
+        self.assertEqual(
+            {(event.profile_id, event.actor_id) for event in events},
+            {(self.reader.pk, self.staff.pk)}
+        )
+
+    def test_bundle_membership(self):
+        bundle = Bundle.objects.create(bundle_id='B1', name='Box')
+        bundle.books.add(self.book)
+        bundle.books.add(self.other_book)
+        # The first copy was already in the bundle: only the second one is logged again
+        self.assertEqual(self.history(self.book), [
+            (CirculationEvent.Type.STATUS_CHANGED, 'Normal -> In Bundle'),
+        ])
+        self.assertEqual(self.history(self.other_book), [
+            (CirculationEvent.Type.STATUS_CHANGED, 'Normal -> In Bundle'),
+        ])
+
+        bundle.books.remove(self.book)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.status, Book.Status.NORMAL)
+        self.assertEqual(self.history(self.book), [
+            (CirculationEvent.Type.STATUS_CHANGED, 'Normal -> In Bundle'),
+            (CirculationEvent.Type.STATUS_CHANGED, 'In Bundle -> Normal'),
+        ])
+        self.assertEqual(len(self.history(self.other_book)), 1)
+
+    def test_direct_edits(self):
+        self.book.status = Book.Status.LOST
+        self.book.save()
+        # Saves that leave the status alone are not logged
+        self.book.save()
+        self.book.nl_code = 'NL3'
+        self.book.save(update_fields=['nl_code'])
+
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.patch(
+            f'/api/books/{self.book.pk}/', {'status': Book.Status.NORMAL}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        client.patch(f'/api/books/{self.book.pk}/', {'nl_code': 'NL4'}, format='json')
+
+        self.assertEqual(self.history(self.book), [
+            (CirculationEvent.Type.STATUS_CHANGED, 'Normal -> Lost'),
+            (CirculationEvent.Type.STATUS_CHANGED, 'Lost -> Normal'),
+        ])
+        self.assertEqual(self.history(self.other_book), [])
+
+    def test_events_are_append_only(self):
+        self.book.status = Book.Status.LOST
+        self.book.save()
+        event = CirculationEvent.objects.get(book=self.book)
+        event.notes = 'edited'
+        with self.assertRaises(ValidationError):
+            event.save()
+        with self.assertRaises(ValidationError):
+            event.delete()
@@ -5,6 +5,7 @@ from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from datetime import datetime, timedelta
+from . import services
 from .models import BorrowRecord
 from books.models import Book
 from users.models import Profile
@@ -30,50 +31,21 @@ def create_borrow(request):
                 'message': 'Book ID and User ID are required'
             }, status=400)
 
-        book = get_object_or_404(Book, id=book_id)
         borrower = get_object_or_404(Profile, user_id=user_id)
 
-        # Check if book is available
-        if book.status != Book.Status.NORMAL:
+        try:
+            borrow_record = services.borrow_book(book_id, borrower, notes=notes, actor=request.user)
+        except services.CirculationError as e:
             return JsonResponse({
                 'status': 'error',
-                'message': f'Book is not available for borrowing. Current status: {book.get_status_display()}'
+                'message': str(e)
             }, status=400)
 
-        # Check if user has reached borrowing limit
-        active_borrows = BorrowRecord.objects.filter(
-            borrower=borrower,
-            status=BorrowRecord.Status.ACTIVE
-        ).count()
-        
-        if active_borrows >= borrower.borrow_limit:
-            return JsonResponse({
-                'status': 'error',
-                'message': f'User has reached borrowing limit of {borrower.borrow_limit} books'
-            }, status=400)
-
-        # Auto-calculate due date (30 days from now)
-        due_date = timezone.now() + timedelta(days=30)
-
-        # Create borrow record
-        borrow_record = BorrowRecord.objects.create(
-            book=book,
-            borrower=borrower,
-            borrowed_date=timezone.now(),
-            due_date=due_date,
-            notes=notes,
-            status=BorrowRecord.Status.ACTIVE
-        )
-
-        # Update book status
-        book.status = Book.Status.BORROWED
-        book.save()
-
         return JsonResponse({
             'status': 'success',
             'message': 'Borrow record created successfully',
             'record_id': borrow_record.id,
-            'due_date': due_date.strftime('%Y-%m-%d')
+            'due_date': borrow_record.due_date.strftime('%Y-%m-%d')
         })
 
     except json.JSONDecodeError:
@@ -103,30 +75,14 @@ def return_book(request):
                 'message': 'Book ID is required'
             }, status=400)
 
-        book = get_object_or_404(Book, id=book_id)
-        
-        # Find active borrow record
-        borrow_record = BorrowRecord.objects.filter(
-            book=book,
-            status=BorrowRecord.Status.ACTIVE
-        ).first()
-        
-        if not borrow_record:
+        try:
+            services.return_book(book_id, notes=notes, actor=request.user)
+        except services.CirculationError as e:
             return JsonResponse({
                 'status': 'error',
-                'message': 'No active borrow record found for this book'
+                'message': str(e)
             }, status=400)
 
-        # Update borrow record
-        borrow_record.status = BorrowRecord.Status.RETURNED
-        borrow_record.returned_date = timezone.now()
-        borrow_record.notes = f"{borrow_record.notes}\nReturn notes: {notes}".strip()
-        borrow_record.save()
-
-        # Update book status
-        book.status = Book.Status.NORMAL
-        book.save()
-
         return JsonResponse({
             'status': 'success',
             'message': 'Book returned successfully'
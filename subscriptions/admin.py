@@ -1,9 +1,17 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from . import imports
 from .models import (
     PlanDuration,
     FreeBorrowingPlan,
     BundleBorrowingPlan,
-    Subscription
+    Subscription,
+    Entitlement
 )
 
 @admin.register(PlanDuration)
@@ -24,6 +32,13 @@ class FreeBorrowingPlanAdmin(BasePlanAdmin):
 class BundleBorrowingPlanAdmin(BasePlanAdmin):
     list_display = BasePlanAdmin.list_display + ('max_bundles',)
 
+class SubscriptionImportForm(forms.Form):
+    csv_file = forms.FileField(label='CSV file')
+    dry_run = forms.BooleanField(
+        required=False,
+        help_text='Only validate the file and list the rows that would be rejected'
+    )
+
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = (
@@ -46,3 +61,66 @@ class SubscriptionAdmin(admin.ModelAdmin):
             plans.append(f"Bundle: {obj.bundle_borrowing_plan.name}")
         return " + ".join(plans)
     get_plans_display.short_description = "Plans"
+    
+    # Rejected rows listed after an import; the rest are only counted
+    ERRORS_LISTED = 20
+    
+    def get_urls(self):
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_csv),
+                name='subscriptions_subscription_import'
+            ),
+        ] + super().get_urls()
+    
+    def import_csv(self, request):
+        """Bulk import subscriptions from an uploaded CSV file"""
+        if not self.has_add_permission(request):
+            return redirect('admin:subscriptions_subscription_changelist')
+        
+        form = SubscriptionImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                result = imports.import_subscriptions(
+                    io.TextIOWrapper(form.cleaned_data['csv_file'], encoding='utf-8-sig', newline=''),
+                    dry_run=form.cleaned_data['dry_run']
+                )
+            except (UnicodeDecodeError, imports.SubscriptionImportError) as e:
+                self.message_user(request, f"Could not import the file: {e}", messages.ERROR)
+            else:
+                verb = "would be imported" if form.cleaned_data['dry_run'] else "imported"
+                self.message_user(request, f"{result.created} subscriptions {verb}.", messages.SUCCESS)
+                if result.errors:
+                    listed = "; ".join(
+                        f"line {line}: {message}" for line, message in result.errors[:self.ERRORS_LISTED]
+                    )
+                    if len(result.errors) > self.ERRORS_LISTED:
+                        listed += f" and {len(result.errors) - self.ERRORS_LISTED} more"
+                    self.message_user(
+                        request, f"{len(result.errors)} rows rejected: {listed}", messages.WARNING
+                    )
+                if not form.cleaned_data['dry_run']:
+                    return redirect('admin:subscriptions_subscription_changelist')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import subscriptions',
+            'form': form,
+            'columns': imports.COLUMNS,
+        }
+        return TemplateResponse(request, 'admin/subscriptions/subscription/import.html', context)
+
+@admin.register(Entitlement)
+class EntitlementAdmin(admin.ModelAdmin):
+    """Read-only; rows are recomputed from subscriptions"""
+    list_display = ('user', 'max_books', 'max_bundles', 'valid_from', 'valid_until', 'updated')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
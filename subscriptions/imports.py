@@ -0,0 +1,254 @@
+"""
+Bulk import of subscriptions from CSV.
+
+Subscription.save() runs full_clean(), which costs one overlap query per
+row. Here the overlap rule is checked in memory instead: the existing
+active subscriptions of all users in the file are read with one query per
+chunk of users, and each user's incoming rows are checked against them
+and then swept among themselves in start date order. Valid rows are
+inserted with bulk_create and every rejected row is reported with its
+line number.
+
+Columns: username, free_plan and bundle_plan (plan ids, at least one of
+the two), start_date, and optionally end_date and status (ACT, EXP or
+CAN; default ACT). Without an end_date the longest duration of the
+row's plans is used, as in Subscription.clean().
+"""
+import csv
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, time
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import BundleBorrowingPlan, Entitlement, FreeBorrowingPlan, Subscription
+
+COLUMNS = ['username', 'free_plan', 'bundle_plan', 'start_date', 'end_date', 'status']
+REQUIRED_COLUMNS = ['username', 'start_date']
+
+DEFAULT_BATCH_SIZE = 1000
+
+ImportResult = namedtuple('ImportResult', ['created', 'errors'])
+
+
+class SubscriptionImportError(Exception):
+    """The file as a whole cannot be imported"""
+
+
+def parse_moment(value):
+    """A date (midnight) or datetime, made aware; None if missing or invalid"""
+    try:
+        day = parse_date(value)
+        moment = datetime.combine(day, time.min) if day else parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def import_subscriptions(lines, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import the CSV text `lines` (an iterable of str) and return an
+    ImportResult of the number of subscriptions created and a list of
+    (line number, message) for the rows that were rejected.
+    """
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise SubscriptionImportError(f'Missing columns: {", ".join(missing)}')
+    rows = [(reader.line_num, row) for row in reader]
+
+    errors = []
+    candidates = _parse_rows(rows, errors, batch_size)
+    accepted = _sweep(candidates, _existing_intervals(candidates, batch_size), errors)
+    errors.sort()
+
+    if dry_run or not accepted:
+        return ImportResult(len(accepted), errors)
+
+    user_ids = list({subscription.user_id for subscription in accepted})
+    with transaction.atomic():
+        Subscription.objects.bulk_create(accepted, batch_size=batch_size)
+        for start in range(0, len(user_ids), batch_size):
+            Entitlement.objects.refresh_users(user_ids[start:start + batch_size])
+    return ImportResult(len(accepted), errors)
+
+
+def _parse_rows(rows, errors, batch_size):
+    """Validate each row on its own; returns (line, Subscription) pairs"""
+    usernames = list({row['username'].strip() for _, row in rows if row.get('username')})
+    users = {}
+    for start in range(0, len(usernames), batch_size):
+        users.update(User.objects.filter(
+            username__in=usernames[start:start + batch_size]
+        ).values_list('username', 'pk'))
+    # Plans are few; load them all with their durations
+    plans = {
+        'free_plan': FreeBorrowingPlan.objects.select_related('duration').in_bulk(),
+        'bundle_plan': BundleBorrowingPlan.objects.select_related('duration').in_bulk(),
+    }
+    # Default end dates: one relativedelta per distinct duration
+    periods = {}
+    statuses = set(Subscription.Status.values)
+
+    candidates = []
+    for line, row in rows:
+        username = (row.get('username') or '').strip()
+        if username not in users:
+            errors.append((line, f'Unknown user "{username}"'))
+            continue
+
+        chosen, error = _parse_plans(row, plans)
+        if error:
+            errors.append((line, error))
+            continue
+
+        start_date = parse_moment((row.get('start_date') or '').strip())
+        if start_date is None:
+            errors.append((line, 'Invalid start_date'))
+            continue
+        end_value = (row.get('end_date') or '').strip()
+        if end_value:
+            end_date = parse_moment(end_value)
+            if end_date is None:
+                errors.append((line, 'Invalid end_date'))
+                continue
+        else:
+            months = max(plan.duration.months for plan in chosen.values())
+            if months not in periods:
+                periods[months] = relativedelta(months=months)
+            end_date = start_date + periods[months]
+        if end_date <= start_date:
+            errors.append((line, 'end_date must be after start_date'))
+            continue
+
+        status = (row.get('status') or '').strip().upper() or Subscription.Status.ACTIVE
+        if status not in statuses:
+            errors.append((line, f'Unknown status "{status}"'))
+            continue
+
+        candidates.append((line, Subscription(
+            user_id=users[username],
+            free_borrowing_plan=chosen.get('free_plan'),
+            bundle_borrowing_plan=chosen.get('bundle_plan'),
+            start_date=start_date,
+            end_date=end_date,
+            status=status
+        )))
+    return candidates
+
+
+def _parse_plans(row, plans):
+    """Map the row's plan columns to plans; returns (plans, error)"""
+    chosen = {}
+    for column, known in plans.items():
+        value = (row.get(column) or '').strip()
+        if not value:
+            continue
+        plan = known.get(int(value)) if value.isdigit() else None
+        if plan is None:
+            return None, f'Unknown {column.replace("_", " ")} "{value}"'
+        chosen[column] = plan
+    if not chosen:
+        return None, 'At least one plan type must be selected'
+    return chosen, None
+
+
+def _existing_intervals(candidates, batch_size):
+    """Active subscriptions already stored for the users in the file, per user"""
+    user_ids = list({subscription.user_id for _, subscription in candidates})
+    existing = {}
+    for start in range(0, len(user_ids), batch_size):
+        intervals = Subscription.objects.filter(
+            user_id__in=user_ids[start:start + batch_size],
+            status=Subscription.Status.ACTIVE
+        ).values_list('user_id', 'start_date', 'end_date')
+        for user_id, start_date, end_date in intervals:
+            existing.setdefault(user_id, []).append((start_date, end_date))
+    return existing
+
+
+def _sweep(candidates, existing, errors):
+    """
+    Apply Subscription.clean()'s rule that no subscription may overlap an
+    active one, and return the subscriptions to create.
+
+    Per user, every incoming row is first checked against the stored
+    active subscriptions, which always win. The active rows that survive
+    are then swept among themselves in start order: a row overlapping the
+    last one kept is rejected, so every rejected row overlaps a row that
+    is imported or already stored. Rows that are not active are last
+    checked against everything active.
+    """
+    per_user = {}
+    for line, subscription in candidates:
+        per_user.setdefault(subscription.user_id, []).append((line, subscription))
+
+    accepted = []
+    for user_id, incoming in per_user.items():
+        # (start, end, line, subscription); stored rows have no line
+        stored = _Intervals((start, end, None, None) for start, end in existing.get(user_id, []))
+
+        surviving = []
+        for line, subscription in incoming:
+            overlap = stored.overlap(subscription.start_date, subscription.end_date)
+            if overlap:
+                errors.append((line, _overlap_message(overlap)))
+            else:
+                surviving.append((subscription.start_date, subscription.end_date, line, subscription))
+
+        kept = []
+        for interval in sorted(
+            (interval for interval in surviving if interval[3].status == Subscription.Status.ACTIVE),
+            key=lambda interval: interval[:3]
+        ):
+            if kept and interval[0] < kept[-1][1]:
+                errors.append((interval[2], _overlap_message(kept[-1])))
+            else:
+                kept.append(interval)
+
+        active = _Intervals(kept)
+        for start, end, line, subscription in surviving:
+            if subscription.status == Subscription.Status.ACTIVE:
+                continue
+            overlap = active.overlap(start, end)
+            if overlap:
+                errors.append((line, _overlap_message(overlap)))
+            else:
+                accepted.append(subscription)
+
+        accepted.extend(interval[3] for interval in kept)
+    return accepted
+
+
+class _Intervals:
+    """Intervals sorted by start, answering overlap queries by binary search"""
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self.starts = [interval[0] for interval in self.intervals]
+        # The interval with the latest end among the first i + 1, so overlaps
+        # between the intervals themselves do not hide one
+        self.latest = []
+        for interval in self.intervals:
+            if not self.latest or interval[1] > self.latest[-1][1]:
+                self.latest.append(interval)
+            else:
+                self.latest.append(self.latest[-1])
+
+    def overlap(self, start, end):
+        """An interval overlapping [start, end), or None"""
+        index = bisect_left(self.starts, end) - 1
+        if index >= 0 and self.latest[index][1] > start:
+            return self.latest[index]
+        return None
+
+
+def _overlap_message(interval):
+    source = f'line {interval[2]}' if interval[2] is not None else 'an existing subscription'
+    return f'Overlaps {source} ({interval[0]:%Y-%m-%d} to {interval[1]:%Y-%m-%d})'
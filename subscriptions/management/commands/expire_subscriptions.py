@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from subscriptions.models import Entitlement, Subscription
+
+class Command(BaseCommand):
+    help = 'Mark active subscriptions past their end date as expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of subscriptions updated per statement'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the subscriptions that would be expired'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        now = timezone.now()
+
+        # Served by the index on (status, end_date)
+        lapsed = Subscription.objects.filter(
+            status=Subscription.Status.ACTIVE,
+            end_date__lte=now
+        )
+
+        if options['dry_run']:
+            count = lapsed.count()
+            self.stdout.write(
+                f'{count} subscriptions would be expired '
+                f'({time.monotonic() - started:.3f}s)'
+            )
+            return
+
+        # One SELECT ... LIMIT n, one UPDATE and one entitlement refresh per
+        # batch, each batch in its own short transaction; expired rows drop
+        # out of the next batch
+        count = 0
+        batches = 0
+        while True:
+            with transaction.atomic():
+                batch = list(lapsed.order_by().values_list('pk', 'user_id')[:options['batch_size']])
+                if not batch:
+                    break
+                # The status condition keeps a concurrent edit from being overwritten
+                count += Subscription.objects.filter(
+                    pk__in=[pk for pk, _ in batch],
+                    status=Subscription.Status.ACTIVE
+                ).update(status=Subscription.Status.EXPIRED)
+                # Picks up any subscription that follows the lapsed one
+                Entitlement.objects.filter(
+                    user_id__in={user_id for _, user_id in batch}
+                ).refresh(now)
+            batches += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully expired {count} subscriptions '
+                f'in {batches} batches ({elapsed:.3f}s)'
+            )
+        )
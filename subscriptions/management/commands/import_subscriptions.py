@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from subscriptions import imports
+
+class Command(BaseCommand):
+    help = (
+        'Import subscriptions from a CSV file with the columns '
+        f'{", ".join(imports.COLUMNS)}; rows that overlap an active subscription are rejected'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument(
+            '--batch-size', type=int, default=imports.DEFAULT_BATCH_SIZE,
+            help='Number of rows inserted per statement'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only validate the file and report the rows that would be rejected'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                result = imports.import_subscriptions(
+                    csv_file, dry_run=options['dry_run'], batch_size=options['batch_size']
+                )
+        except (OSError, imports.SubscriptionImportError) as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f'Line {line}: {message}')
+
+        elapsed = time.monotonic() - started
+        if options['dry_run']:
+            self.stdout.write(
+                f'{result.created} subscriptions would be imported, '
+                f'{len(result.errors)} rows rejected ({elapsed:.3f}s)'
+            )
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully imported {result.created} subscriptions, '
+                f'{len(result.errors)} rows rejected ({elapsed:.3f}s)'
+            )
+        )
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from subscriptions.models import Entitlement, Subscription
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized borrowing entitlements from subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--expired', action='store_true',
+            help='Only refresh entitlements whose subscription has ended'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of entitlements recomputed per statement'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        now = timezone.now()
+        batch_size = options['batch_size']
+
+        if options['expired']:
+            # Served by the index on valid_until
+            refreshed = Entitlement.objects.expired(now).refresh(now)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully refreshed {refreshed} expired entitlements '
+                    f'({time.monotonic() - started:.3f}s)'
+                )
+            )
+            return
+
+        # Users with a current or upcoming subscription but no row yet
+        missing = Subscription.objects.filter(
+            status=Subscription.Status.ACTIVE,
+            end_date__gt=now,
+            user__entitlement__isnull=True
+        ).values_list('user_id', flat=True).distinct()
+        created = len(Entitlement.objects.bulk_create(
+            [Entitlement(user_id=user_id) for user_id in missing.iterator(chunk_size=2000)],
+            batch_size=batch_size, ignore_conflicts=True
+        ))
+
+        # Walk all rows in primary key order, one UPDATE per batch
+        refreshed = 0
+        last_pk = 0
+        while True:
+            batch = list(Entitlement.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )[:batch_size])
+            if not batch:
+                break
+            refreshed += Entitlement.objects.filter(pk__in=batch).refresh(now)
+            last_pk = batch[-1]
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully rebuilt {refreshed} entitlements, {created} new ({elapsed:.3f}s)'
+            )
+        )
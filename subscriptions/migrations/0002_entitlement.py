@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def build_entitlements(apps, schema_editor):
+    Subscription = apps.get_model("subscriptions", "Subscription")
+    Entitlement = apps.get_model("subscriptions", "Entitlement")
+    now = timezone.now()
+    user_ids = (
+        Subscription.objects.filter(status="ACT", end_date__gt=now)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    Entitlement.objects.bulk_create(
+        [Entitlement(user_id=user_id) for user_id in user_ids], batch_size=500
+    )
+    # Same as EntitlementQuerySet.refresh
+    subscription = Subscription.objects.filter(
+        user_id=OuterRef("user_id"), status="ACT", end_date__gt=now
+    ).order_by("start_date")
+
+    def field(lookup):
+        return Subquery(subscription.values(lookup)[:1])
+
+    Entitlement.objects.update(
+        max_books=Coalesce(field("free_borrowing_plan__max_books"), 0),
+        max_bundles=Coalesce(field("bundle_borrowing_plan__max_bundles"), 0),
+        valid_from=field("start_date"),
+        valid_until=field("end_date"),
+        updated=now,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("subscriptions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Entitlement",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="entitlement",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("max_books", models.PositiveIntegerField(default=0)),
+                ("max_bundles", models.PositiveIntegerField(default=0)),
+                ("valid_from", models.DateTimeField(blank=True, null=True)),
+                ("valid_until", models.DateTimeField(blank=True, null=True)),
+                ("updated", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["valid_until"], name="subscriptio_valid_u_df324e_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_entitlements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscriptions", "0002_entitlement"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(
+                fields=["status", "end_date"], name="subscriptio_status_5ff966_idx"
+            ),
+        ),
+    ]
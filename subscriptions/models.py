@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 
@@ -29,6 +33,11 @@ class BasePlan(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.duration})"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Limits of existing subscriptions follow the plan
+        Entitlement.objects.filter(user__subscriptions__in=self.subscription_set.all()).refresh()
 
 class FreeBorrowingPlan(BasePlan):
     """Plan for borrowing individual books"""
@@ -76,6 +85,15 @@ class Subscription(models.Model):
     
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Lapsed subscriptions still marked active (expire_subscriptions)
+            models.Index(fields=['status', 'end_date']),
+        ]
+    
+    def forget_memoized(self):
+        """Drop the active subscription memoized on the user's loaded profile"""
+        if Subscription.user.is_cached(self) and User.profile.is_cached(self.user):
+            self.user.profile.forget_subscription()
     
     def __str__(self):
         plans = []
@@ -115,6 +133,8 @@ class Subscription(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+        Entitlement.objects.refresh_users([self.user_id])
+        self.forget_memoized()
     
     @property
     def is_active(self):
@@ -122,3 +142,78 @@ class Subscription(models.Model):
             self.status == self.Status.ACTIVE and
             self.start_date <= timezone.now() <= self.end_date
         )
+
+class EntitlementQuerySet(models.QuerySet):
+    def refresh(self, now=None):
+        """
+        Recompute these entitlements from their users' subscriptions with
+        one UPDATE. Each row takes the earliest active subscription that has
+        not ended yet: the current one, or else the next one to start.
+        """
+        now = now or timezone.now()
+        subscription = Subscription.objects.filter(
+            user_id=OuterRef('user_id'),
+            status=Subscription.Status.ACTIVE,
+            end_date__gt=now
+        ).order_by('start_date')
+
+        def field(lookup):
+            return Subquery(subscription.values(lookup)[:1])
+
+        return self.update(
+            max_books=Coalesce(field('free_borrowing_plan__max_books'), 0),
+            max_bundles=Coalesce(field('bundle_borrowing_plan__max_bundles'), 0),
+            valid_from=field('start_date'),
+            valid_until=field('end_date'),
+            updated=now
+        )
+
+    def refresh_users(self, user_ids):
+        """Create missing entitlements for these users and recompute them"""
+        user_ids = list(user_ids)
+        self.bulk_create([Entitlement(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        return self.filter(user_id__in=user_ids).refresh()
+
+    def expired(self, now=None):
+        """Entitlements whose subscription has ended and may have a successor"""
+        return self.filter(valid_until__lte=now or timezone.now())
+
+class Entitlement(models.Model):
+    """
+    What a user may borrow, materialized from their subscriptions.
+
+    Checkout reads this one row by primary key instead of joining the
+    subscription and plan tables. Rows are recomputed when a subscription
+    or plan is saved or a subscription deleted; the validity window makes
+    an ended subscription grant nothing even before its row is refreshed
+    (rebuild_entitlements --expired, or the refusal path of checkout).
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='entitlement'
+    )
+    max_books = models.PositiveIntegerField(default=0)
+    max_bundles = models.PositiveIntegerField(default=0)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(default=timezone.now)
+    
+    objects = EntitlementQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['valid_until']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.max_books} books, {self.max_bundles} bundles"
+
+# Deletes include cascades and queryset deletes, which skip Model.delete().
+# Only existing rows are refreshed: when the user itself is being deleted
+# its entitlement goes with it and must not be recreated.
+@receiver(post_delete, sender=Subscription)
+def forget_deleted_subscription(sender, instance, **kwargs):
+    Entitlement.objects.filter(user_id=instance.user_id).refresh()
+    instance.forget_memoized()
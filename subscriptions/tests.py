@@ -1,3 +1,137 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import imports
+from .models import Entitlement, FreeBorrowingPlan, PlanDuration, Subscription
+
+
+class EntitlementTests(TestCase):
+    """Entitlements follow subscriptions and plans"""
+
+    @classmethod
+    def setUpTestData(cls):
+        duration = PlanDuration.objects.create(months=1, description='1 month')
+        cls.plan = FreeBorrowingPlan.objects.create(name='Free', price=0, duration=duration, max_books=3)
+        cls.user = User.objects.create_user('reader')
+        cls.profile = cls.user.profile
+
+    def subscribe(self, start, end):
+        now = timezone.now()
+        return Subscription.objects.create(
+            user=self.user, free_borrowing_plan=self.plan,
+            start_date=now + start, end_date=now + end
+        )
+
+    def test_follows_subscription_and_plan(self):
+        self.assertEqual(self.profile.borrow_limit, 0)
+        subscription = self.subscribe(timedelta(days=-1), timedelta(days=30))
+        self.assertEqual(self.profile.borrow_limit, 3)
+
+        self.plan.max_books = 5
+        self.plan.save()
+        self.assertEqual(self.profile.borrow_limit, 5)
+
+        subscription.delete()
+        self.assertEqual(self.profile.borrow_limit, 0)
+
+    def test_successor_is_picked_up_when_subscription_ends(self):
+        self.subscribe(timedelta(days=-30), timedelta(days=-1))
+        upcoming = self.subscribe(timedelta(days=-1), timedelta(days=30))
+        # Backdate the row to the state it had before the first one ended
+        Entitlement.objects.filter(user=self.user).update(
+            valid_from=timezone.now() - timedelta(days=30),
+            valid_until=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(self.profile.borrow_limit, 0)
+
+        call_command('rebuild_entitlements', expired=True, stdout=StringIO())
+        entitlement = Entitlement.objects.get(user=self.user)
+        self.assertEqual(entitlement.valid_until, upcoming.end_date)
+        self.assertEqual(self.profile.borrow_limit, 3)
+
+    def test_expire_subscriptions(self):
+        lapsed = self.subscribe(timedelta(days=-30), timedelta(days=-1))
+        current = self.subscribe(timedelta(days=-1), timedelta(days=30))
+
+        call_command('expire_subscriptions', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            dict(Subscription.objects.values_list('pk', 'status')),
+            {lapsed.pk: Subscription.Status.EXPIRED, current.pk: Subscription.Status.ACTIVE}
+        )
+        self.assertEqual(self.profile.borrow_limit, 3)
+
+        out = StringIO()
+        call_command('expire_subscriptions', stdout=out)
+        self.assertIn('expired 0 subscriptions', out.getvalue())
+
+
+class SubscriptionImportTests(TestCase):
+    """CSV import checks overlaps in memory and reports rejected rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        duration = PlanDuration.objects.create(months=2, description='2 months')
+        cls.plan = FreeBorrowingPlan.objects.create(name='Free', price=0, duration=duration, max_books=3)
+        cls.staff = User.objects.create_superuser('staff', password='x')
+        for username in ['ann', 'bob']:
+            User.objects.create_user(username)
+        Subscription.objects.create(
+            user=User.objects.get(username='ann'), free_borrowing_plan=cls.plan,
+            start_date=timezone.make_aware(datetime(2026, 1, 1)),
+            end_date=timezone.make_aware(datetime(2026, 3, 1))
+        )
+
+    def csv(self, *rows):
+        return '\n'.join(['username,free_plan,start_date,end_date,status'] + list(rows)) + '\n'
+
+    def test_rejects_overlaps_and_bad_rows(self):
+        p = self.plan.pk
+        result = imports.import_subscriptions(StringIO(self.csv(
+            f'ann,{p},2026-02-01,,',            # overlaps the stored one
+            f'ann,{p},2026-03-01,,',            # starts where it ends
+            f'bob,{p},2026-01-15,2026-04-01,',
+            f'bob,{p},2026-03-01,2026-05-01,',  # overlaps the row above
+            f'bob,{p},2026-03-01,2026-05-01,EXP',
+            f'bob,{p},2026-04-01,2026-05-01,EXP',
+            f'eve,{p},2026-01-01,,',
+            'bob,,2026-06-01,,',
+            f'bob,{p},soon,,',
+        )))
+
+        self.assertEqual(result.created, 3)
+        self.assertEqual([line for line, _ in result.errors], [2, 5, 6, 8, 9, 10])
+        self.assertIn('existing subscription', result.errors[0][1])
+        self.assertIn('line 4', result.errors[1][1])
+        ann = Subscription.objects.filter(user__username='ann').order_by('start_date').last()
+        self.assertEqual(ann.end_date, timezone.make_aware(datetime(2026, 5, 1)))
+        self.assertEqual(Entitlement.objects.filter(user__username__in=['ann', 'bob']).count(), 2)
+
+    def test_row_is_only_rejected_for_an_imported_or_stored_overlap(self):
+        # A overlaps B and the stored one; B overlaps only A
+        p = self.plan.pk
+        result = imports.import_subscriptions(StringIO(self.csv(
+            f'ann,{p},2025-12-01,2026-10-01,',  # A
+            f'ann,{p},2025-12-05,2025-12-20,',  # B
+        )))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [2])
+        self.assertIn('existing subscription', result.errors[0][1])
+        self.assertTrue(Subscription.objects.filter(
+            user__username='ann', end_date=timezone.make_aware(datetime(2025, 12, 20))
+        ).exists())
 
-# Create your tests here.
+    def test_admin_upload(self):
+        self.client.force_login(self.staff)
+        upload = SimpleUploadedFile('subs.csv', self.csv(f'bob,{self.plan.pk},2026-01-01,,').encode())
+        response = self.client.post(
+            reverse('admin:subscriptions_subscription_import'), {'csv_file': upload}, follow=True
+        )
+        self.assertContains(response, '1 subscriptions imported')
+        self.assertTrue(Subscription.objects.filter(user__username='bob').exists())
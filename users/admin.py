@@ -10,6 +10,13 @@ class ProfileInline(admin.StackedInline):
 
 class UserAdmin(BaseUserAdmin):
     inlines = (ProfileInline,)
+    
+    def get_inline_instances(self, request, obj=None):
+        # The profile is created by users.signals when the user is saved;
+        # it can be edited once the user exists
+        if obj is None:
+            return []
+        return super().get_inline_instances(request, obj)
 
 # Re-register UserAdmin
 admin.site.unregister(User)
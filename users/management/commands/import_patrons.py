@@ -0,0 +1,151 @@
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from users.models import Profile
+
+class Command(BaseCommand):
+    help = (
+        'Create patrons (users with their profiles) in bulk from a CSV file with the '
+        'columns username, email, first_name, last_name, password and birthday; '
+        'usernames that already exist are skipped'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Threads hashing passwords; the hashers release the GIL'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of patrons hashed and inserted at a time'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only validate the file and count the patrons that would be created'
+        )
+
+    def handle(self, *args, **options):
+        """
+        User and Profile rows are inserted with bulk_create, so no post_save
+        receiver runs per user. Passwords are hashed in a thread pool, one
+        batch at a time, and every batch is inserted in its own transaction
+        so a user never exists without a profile. Reruns skip the usernames
+        already present, which makes an interrupted import safe to repeat.
+        """
+        started = time.monotonic()
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                reader = csv.DictReader(csv_file)
+                if 'username' not in (reader.fieldnames or []):
+                    raise CommandError('Missing column: username')
+                rows = [(reader.line_num, row) for row in reader]
+        except OSError as e:
+            raise CommandError(str(e))
+
+        patrons, rejected = self.validate(rows)
+        existing = self.existing_usernames([patron['username'] for patron in patrons], options['batch_size'])
+        patrons = [patron for patron in patrons if patron['username'] not in existing]
+
+        for line, message in rejected:
+            self.stderr.write(f'Line {line}: {message}')
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'{len(patrons)} patrons would be created, {len(existing)} already exist, '
+                f'{len(rejected)} rows rejected ({time.monotonic() - started:.3f}s)'
+            )
+            return
+
+        created = 0
+        batch_size = options['batch_size']
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(patrons), batch_size):
+                batch = patrons[start:start + batch_size]
+                hashes = pool.map(make_password, [patron['password'] for patron in batch])
+                created += self.create(batch, hashes)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully created {created} patrons, skipped {len(existing)} existing, '
+                f'{len(rejected)} rows rejected ({elapsed:.3f}s)'
+            )
+        )
+
+    def validate(self, rows):
+        """Check each row on its own; returns (patrons, [(line, message)])"""
+        patrons = []
+        rejected = []
+        seen = set()
+        max_length = User._meta.get_field('username').max_length
+        for line, row in rows:
+            username = (row.get('username') or '').strip()
+            try:
+                User.username_validator(username)
+            except ValidationError:
+                username_valid = False
+            else:
+                username_valid = len(username) <= max_length
+            if not username_valid:
+                rejected.append((line, f'Invalid username "{username}"'))
+                continue
+            if username in seen:
+                rejected.append((line, f'Duplicate username "{username}"'))
+                continue
+            seen.add(username)
+
+            birthday = (row.get('birthday') or '').strip()
+            if birthday:
+                try:
+                    birthday = parse_date(birthday)
+                except ValueError:
+                    birthday = None
+                if birthday is None:
+                    rejected.append((line, 'Invalid birthday'))
+                    continue
+
+            patrons.append({
+                'username': username,
+                'email': (row.get('email') or '').strip(),
+                'first_name': (row.get('first_name') or '').strip(),
+                'last_name': (row.get('last_name') or '').strip(),
+                # No password gives an unusable one; the patron resets it
+                'password': row.get('password') or None,
+                'birthday': birthday or None,
+            })
+        return patrons, rejected
+
+    def existing_usernames(self, usernames, batch_size):
+        existing = set()
+        for start in range(0, len(usernames), batch_size):
+            existing.update(User.objects.filter(
+                username__in=usernames[start:start + batch_size]
+            ).values_list('username', flat=True))
+        return existing
+
+    def create(self, batch, hashes):
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=patron['username'],
+                    email=patron['email'],
+                    first_name=patron['first_name'],
+                    last_name=patron['last_name'],
+                    password=password
+                )
+                for patron, password in zip(batch, hashes)
+            ])
+            Profile.objects.bulk_create([
+                Profile(user=user, birthday=patron['birthday'])
+                for user, patron in zip(users, batch)
+            ])
+        return len(users)
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:54
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_current_loans(apps, schema_editor):
+    Profile = apps.get_model("users", "Profile")
+    BorrowRecord = apps.get_model("circulation", "BorrowRecord")
+    counts = (
+        BorrowRecord.objects.filter(status__in=["ACT", "OVD"])
+        .values("borrower")
+        .annotate(
+            books=Count("pk", filter=Q(book__isnull=False)),
+            bundles=Count("pk", filter=Q(bundle__isnull=False)),
+        )
+        .order_by()
+    )
+    for row in counts:
+        Profile.objects.filter(pk=row["borrower"]).update(
+            active_book_loans=row["books"], active_bundle_loans=row["bundles"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("circulation", "0003_borrowrecord_active_due_idx"),
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="active_book_loans",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="active_bundle_loans",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_current_loans, migrations.RunPython.noop),
+    ]
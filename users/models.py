@@ -1,9 +1,9 @@
 from django.db import models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from datetime import date
-from subscriptions.models import Subscription
+from subscriptions.models import Entitlement, Subscription
 from django.utils import timezone
 
 class Profile(models.Model):
@@ -11,6 +11,11 @@ class Profile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
     birthday = models.DateField(null=True, blank=True)
     
+    # Items currently on loan (active or overdue borrow records), kept in
+    # step by every borrow, return and loss so limit checks read one row
+    active_book_loans = models.PositiveIntegerField(default=0, editable=False)
+    active_bundle_loans = models.PositiveIntegerField(default=0, editable=False)
+    
     @property
     def age(self):
         if self.birthday:
@@ -20,12 +25,34 @@ class Profile(models.Model):
     
     @property
     def active_subscription(self):
-        """Get the user's active subscription"""
-        return self.user.subscriptions.filter(
-            status=Subscription.Status.ACTIVE,
-            start_date__lte=timezone.now(),
-            end_date__gt=timezone.now()
-        ).first()
+        """
+        Get the user's active subscription, with its plans and their durations.
+
+        Looked up once per profile instance, which lives for one request,
+        and reused by the entitlement properties below. refresh_from_db()
+        and saving or deleting a subscription through this profile's user
+        drop it.
+        """
+        if '_active_subscription' not in self.__dict__:
+            now = timezone.now()
+            subscription = Subscription.objects.filter(
+                user_id=self.user_id,
+                status=Subscription.Status.ACTIVE,
+                start_date__lte=now,
+                end_date__gt=now
+            ).select_related(
+                'free_borrowing_plan__duration', 'bundle_borrowing_plan__duration'
+            ).first()
+            self.__dict__['_active_subscription'] = subscription
+        return self.__dict__['_active_subscription']
+    
+    def forget_subscription(self):
+        """Drop the memoized active subscription"""
+        self.__dict__.pop('_active_subscription', None)
+    
+    def refresh_from_db(self, *args, **kwargs):
+        self.forget_subscription()
+        super().refresh_from_db(*args, **kwargs)
     
     @property
     def has_active_free_plan(self):
@@ -51,10 +78,49 @@ class Profile(models.Model):
         sub = self.active_subscription
         return sub.bundle_borrowing_plan.max_bundles if sub and sub.bundle_borrowing_plan else 0
 
+    @property
+    def borrow_limit(self):
+        """Maximum number of books the user may have on loan at once, as checkout enforces it"""
+        return Profile.borrow_limits([self.user_id])[self.user_id]
+
+    @staticmethod
+    def borrow_limits(user_ids):
+        """Map each user id to its borrow_limit, using one query for all users"""
+        now = timezone.now()
+        limits = dict(Entitlement.objects.filter(
+            user_id__in=user_ids,
+            valid_from__lte=now,
+            valid_until__gt=now
+        ).values_list('user_id', 'max_books'))
+        return {user_id: limits.get(user_id, 0) for user_id in user_ids}
+
+    @staticmethod
+    def borrow_limit_expression():
+        """
+        borrow_limit as a subquery on the profile's user, for filters and
+        UPDATE conditions; a primary key lookup on the user's Entitlement
+        """
+        now = timezone.now()
+        return Coalesce(Subquery(
+            Entitlement.objects.filter(
+                user_id=OuterRef('user_id'),
+                valid_from__lte=now,
+                valid_until__gt=now
+            ).values('max_books')[:1]
+        ), 0)
+
+    @staticmethod
+    def adjust_loan_counters(profile_id, books=0, bundles=0):
+        """Atomically add to a profile's loan counters; negative amounts release loans"""
+        Profile.objects.filter(pk=profile_id).update(
+            active_book_loans=Greatest(F('active_book_loans') + books, 0),
+            active_bundle_loans=Greatest(F('active_bundle_loans') + bundles, 0)
+        )
+
     @property
     def active_borrows(self):
         """Return all active borrows for this user"""
-        return self.borrow_records.filter(status='ACT')
+        return self.borrow_records.filter(status__in=['ACT', 'OVD'])
     
     @property
     def borrowed_books(self):
@@ -76,17 +142,9 @@ class Profile(models.Model):
         """Check if user has any overdue items"""
         now = timezone.now()
         return self.borrow_records.filter(
-            status='ACT',
+            status__in=['ACT', 'OVD'],
             due_date__lt=now
         ).exists()
 
     def __str__(self):
         return f"{self.user.username}'s profile"
-
-# Signal to create/update Profile when User is created/updated
-@receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-    else:
-        instance.profile.save()
@@ -3,9 +3,8 @@ from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import Profile
 
-@receiver(post_save, sender=User)
-def handle_user_profile(sender, instance, created, **kwargs):
-    """Handle profile creation and updates for users"""
-    if created:
-        # Only create profile for new users
-        Profile.objects.get_or_create(user=instance) 
\ No newline at end of file
+@receiver(post_save, sender=User, dispatch_uid='users.create_user_profile')
+def handle_user_profile(sender, instance, created, raw=False, **kwargs):
+    """Create the profile of a new user; bulk imports create profiles themselves"""
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
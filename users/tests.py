@@ -1,3 +1,120 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from subscriptions.models import BundleBorrowingPlan, FreeBorrowingPlan, PlanDuration, Subscription
+from .models import Profile
+
+
+class ActiveSubscriptionTests(TestCase):
+    """Entitlement checks share one subscription lookup per profile"""
+
+    @classmethod
+    def setUpTestData(cls):
+        duration = PlanDuration.objects.create(months=1, description='1 month')
+        cls.free_plan = FreeBorrowingPlan.objects.create(name='Free', price=0, duration=duration, max_books=3)
+        cls.bundle_plan = BundleBorrowingPlan.objects.create(name='Bundle', price=0, duration=duration, max_bundles=1)
+        cls.user = User.objects.create_user('reader')
+        now = timezone.now()
+        cls.subscription = Subscription.objects.create(
+            user=cls.user, free_borrowing_plan=cls.free_plan,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=30)
+        )
+
+    def test_entitlements_use_one_query(self):
+        profile = Profile.objects.get(user=self.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(profile.has_active_free_plan)
+            self.assertFalse(profile.has_active_bundle_plan)
+            self.assertEqual(profile.max_books_allowed, 3)
+            self.assertEqual(profile.max_bundles_allowed, 0)
+            self.assertEqual(profile.active_subscription.free_borrowing_plan.duration.months, 1)
+
+    def test_saving_a_subscription_invalidates(self):
+        subscription = Subscription.objects.select_related('user__profile').get(pk=self.subscription.pk)
+        profile = subscription.user.profile
+        self.assertEqual(profile.max_bundles_allowed, 0)
+
+        subscription.bundle_borrowing_plan = self.bundle_plan
+        subscription.save()
+        self.assertEqual(profile.max_bundles_allowed, 1)
+
+        subscription.delete()
+        self.assertEqual(profile.max_books_allowed, 0)
+
+    def test_refresh_from_db_invalidates(self):
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.max_books_allowed, 3)
+
+        Subscription.objects.filter(pk=self.subscription.pk).update(status=Subscription.Status.CANCELLED)
+        self.assertEqual(profile.max_books_allowed, 3)
+        profile.refresh_from_db()
+        self.assertEqual(profile.max_books_allowed, 0)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportPatronsTests(TestCase):
+    """import_patrons creates users with profiles and skips known usernames"""
+
+    def import_patrons(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write(content)
+        self.addCleanup(os.remove, csv_file.name)
+        err = StringIO()
+        call_command('import_patrons', csv_file.name, workers=2, batch_size=2, stdout=StringIO(), stderr=err)
+        return err.getvalue()
+
+    def test_import_is_idempotent(self):
+        User.objects.create_user('existing')
+        content = (
+            'username,email,password,birthday\n'
+            'ann,ann@example.com,secret,2010-05-01\n'
+            'bob,,,\n'
+            'existing,,,\n'
+            'ann,,,\n'
+            'bad name,,,\n'
+            'cat,,,someday\n'
+        )
+        errors = self.import_patrons(content)
+        self.assertIn('Line 5: Duplicate username "ann"', errors)
+        self.assertIn('Line 6: Invalid username', errors)
+        self.assertIn('Line 7: Invalid birthday', errors)
+
+        ann = User.objects.get(username='ann')
+        self.assertTrue(ann.check_password('secret'))
+        self.assertEqual(ann.profile.birthday, date(2010, 5, 1))
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertEqual(Profile.objects.count(), 3)
+
+        self.import_patrons(content)
+        self.assertEqual(User.objects.count(), 3)
+        self.assertEqual(Profile.objects.count(), 3)
+
+
+class UserAdminTests(TestCase):
+    """Adding a user in the admin creates exactly one profile"""
+
+    def test_add_user(self):
+        self.client.force_login(User.objects.create_superuser('staff', password='x'))
+        response = self.client.post(reverse('admin:auth_user_add'), {
+            'username': 'newcomer',
+            'password1': 'a-long-Passphrase-1',
+            'password2': 'a-long-Passphrase-1',
+            'usable_password': 'true',
+            'profile-TOTAL_FORMS': '1',
+            'profile-INITIAL_FORMS': '0',
+            'profile-0-birthday': '2010-05-01',
+        })
+        self.assertEqual(response.status_code, 302)
+        user = User.objects.get(username='newcomer')
+        self.assertEqual(Profile.objects.filter(user=user).count(), 1)
+
+        response = self.client.get(reverse('admin:auth_user_change', args=[user.pk]))
+        self.assertContains(response, 'profile-0-birthday')